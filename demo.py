@@ -9,19 +9,23 @@ import ollama
 
 from src.retriever import OMLRetriever
 from src.embeddings import EmbeddingManager
+from src.embedding_index import EmbeddingIndex
 from src.examples_processor import ExamplesProcessor
 from src.validation.validator import OMLValidator
 from src.validation.error_handler import ErrorHandler
 from src.validation.feedback_loop import FeedbackLoop
 from src.dependency.vocabulary_manager import VocabularyManager
+from src.instrumentation import JsonLinesSink, configure_logging, get_instrumentation, span
 
 def main():
     parser = argparse.ArgumentParser(description='OML Copilot Demo')
     parser.add_argument('--examples', '-e', type=str, default='src/oml_examples.jsonl',
                     help='Examples database file')
+    parser.add_argument('--index', '-i', type=str, default=None,
+                        help='Prebuilt embedding index directory (skips re-embedding the examples)')
     parser.add_argument('--workspace', '-w', type=str, default='examples',
                         help='Workspace directory with OML files')
-    parser.add_argument('--grammar', '-g', type=str, default='grammar/oml3_lark.txt',
+    parser.add_argument('--grammar', '-g', type=str, default='grammar/oml3_lalr.txt',
                     help='Grammar file')
     parser.add_argument('--model', '-m', type=str, default='mistral',
                         help='Ollama model name')
@@ -29,22 +33,42 @@ def main():
         '--retrieval-only',
         action='store_true',
         help='Run retrieval demo without calling Ollama for code generation')
+    parser.add_argument('--log-level', type=str, default='INFO',
+                        help='Logging level (DEBUG also shows the retrieved examples and their scores)')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='Write stage timing metrics to this file on exit')
+    parser.add_argument('--metrics-format', choices=['prometheus', 'jsonl'], default='prometheus',
+                        help='Format of the metrics file')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Append every timing span to this JSON lines file')
     args = parser.parse_args()
     
+    configure_logging(args.log_level)
+    instrumentation = get_instrumentation()
+    if args.trace:
+        instrumentation.add_sink(JsonLinesSink(args.trace))
+    
     print("Initializing OML Copilot...")
     
     # Set up embedding manager
     embedding_manager = EmbeddingManager()
     
-    # Load examples
-    examples_processor = ExamplesProcessor(embedding_manager)
-    examples = examples_processor.load_examples(args.examples)
-    
-    # Process examples
-    vector_db = examples_processor.process_examples(examples)
-    
-    # Create retriever
-    retriever = OMLRetriever(vector_db, embedding_manager)
+    if EmbeddingIndex.exists(args.index):
+        # Map the prebuilt index
+        retriever = OMLRetriever.from_index(args.index, embedding_manager)
+        examples = retriever.vector_db
+        examples_source = args.index
+    else:
+        # Load examples
+        examples_processor = ExamplesProcessor(embedding_manager)
+        examples = examples_processor.load_examples(args.examples)
+        
+        # Process examples
+        vector_db = examples_processor.process_examples(examples)
+        
+        # Create retriever
+        retriever = OMLRetriever(vector_db, embedding_manager)
+        examples_source = args.examples
     
     # Set up validator
     validator = OMLValidator(args.grammar)
@@ -59,7 +83,7 @@ def main():
     feedback_loop = FeedbackLoop(ollama, validator, error_handler)
     
     print("\nOML Copilot initialized.")
-    print(f"Loaded {len(examples)} examples from {args.examples}")
+    print(f"Loaded {len(examples)} examples from {examples_source}")
     print(f"Loaded grammar from {args.grammar}")
     print(f"Using LLM model: {args.model}")
     print(f"Available vocabularies: {', '.join(vocabulary_manager.get_allowed_extensions())}")
@@ -79,32 +103,34 @@ def main():
             print("Please import them before proceeding.")
             continue
         
-        # Retrieve relevant examples
-        print("\nRetrieving relevant examples...")
-        retrieved_knowledge = retriever.retrieve(query)
-        
-        if args.retrieval_only:
-            print("\nRetrieval-only mode enabled. Skipping Ollama generation.")
-            print("\nTop retrieved examples:")
-            for i, (example, score) in enumerate(retrieved_knowledge, start=1):
-                print(f"\n--- Example {i} | Similarity: {score:.4f} ---")
-                print(example[:1000])
-            continue
+        with span('request', operation='demo'):
+            # Retrieve relevant examples
+            print("\nRetrieving relevant examples...")
+            retrieved_knowledge = retriever.retrieve(query)
+            
+            if args.retrieval_only:
+                print("\nRetrieval-only mode enabled. Skipping Ollama generation.")
+                print("\nTop retrieved examples:")
+                for i, (example, score) in enumerate(retrieved_knowledge, start=1):
+                    print(f"\n--- Example {i} | Similarity: {score:.4f} ---")
+                    print(example[:1000])
+                continue
 
-        # Create instruction prompt
-        instruction_prompt = 'You are an OML code generation assistant. Use only the following context to generate syntactically correct OML code:\n\n'
-        
-        # Add vocabulary restrictions
-        vocab_restrictions = vocabulary_manager.format_vocabulary_restrictions()
-        instruction_prompt += vocab_restrictions + "\n\n"
-        
-        # Add retrieved knowledge
-        for example, score in retrieved_knowledge:
-            instruction_prompt += f"EXAMPLE:\n{example}\n\n"
-        
-        # Generate and refine code
-        print("\nGenerating OML code...")
-        code, iterations, success = feedback_loop.generate_and_refine(query, instruction_prompt)
+            # Create instruction prompt
+            with span('prompt_build', examples=len(retrieved_knowledge)):
+                instruction_prompt = 'You are an OML code generation assistant. Use only the following context to generate syntactically correct OML code:\n\n'
+                
+                # Add vocabulary restrictions
+                vocab_restrictions = vocabulary_manager.format_vocabulary_restrictions()
+                instruction_prompt += vocab_restrictions + "\n\n"
+                
+                # Add retrieved knowledge
+                for example, score in retrieved_knowledge:
+                    instruction_prompt += f"EXAMPLE:\n{example}\n\n"
+            
+            # Generate and refine code
+            print("\nGenerating OML code...")
+            code, iterations, success = feedback_loop.generate_and_refine(query, instruction_prompt)
         
         if success:
             print(f"\nSuccessfully generated valid OML code after {iterations} iterations.")
@@ -118,6 +144,14 @@ def main():
                 file.write(code)
             print(f"Saved generated code to {output_file}")
     
+    if args.metrics:
+        with open(args.metrics, 'w') as file:
+            if args.metrics_format == 'jsonl':
+                file.write(instrumentation.registry.to_json_lines())
+            else:
+                file.write(instrumentation.registry.to_prometheus())
+        print(f"Saved metrics to {args.metrics}")
+    
     print("\nThank you for using OML Copilot!")
     
 if __name__ == "__main__":
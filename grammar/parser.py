@@ -1,19 +1,28 @@
-from lark import Lark
+# parser.py - Parse sample OML vocabularies and draw a parse tree
 
-# Step 1: Read the grammar from a text file
-with open("oml3_lark.txt", "r") as file:
-    grammar = file.read()
+import os
+import sys
 
-# Step 2: Create the Lark parser using the grammar
-parser = Lark(grammar)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Step 3: Define a function to parse input
+from lark import Tree
+from src.validation.parser_cache import get_parser
+
+GRAMMAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oml3_lalr.txt")
+
+# Step 1: Get the compiled parser (loaded from the parser cache after the first run)
+def get_oml_parser():
+    with open(GRAMMAR_FILE, "r") as file:
+        grammar = file.read()
+    return get_parser(grammar)
+
+# Step 2: Define a function to parse input
 def parse_input(input_str):
-    parse_tree = parser.parse(input_str)
+    parse_tree = get_oml_parser().parse(input_str)
     return parse_tree.pretty()
 
-# Step 4: Test the parser with an example input
-input_str = """vocabulary <http://example.com/tutorial1/vocabulary/pizza#> as pizza {
+# Sample vocabularies
+PIZZA_VOCABULARY = """vocabulary <http://example.com/tutorial1/vocabulary/pizza#> as pizza {
 
     extends <http://www.w3.org/2001/XMLSchema#> as xsd
 
@@ -211,15 +220,7 @@ input_str = """vocabulary <http://example.com/tutorial1/vocabulary/pizza#> as pi
 }
 """
 
-# Parse the input and print the result
-try:
-    parsed_result = parse_input(input_str)
-    print(parsed_result)
-except Exception as e:
-    print(f"Error: {e}")
-
-# Step 4: Test the parser with an example input
-input_str = """@dc:creator "SIE Disruption Lab"
+FOUNDATION_VOCABULARY = """@dc:creator "SIE Disruption Lab"
 @dc:contributor "Joe Gregory"
 @dc:description "A vocabulary to capture the foundation terminology required by the SIE Disruption Lab. Note that this is essentially a simplified version of gUFO."
 @dc:hasVersion "0.1"
@@ -435,15 +436,7 @@ vocabulary <http://uaontologies.com/UA_Foundation/UA_Foundation#> as foundation
 	}
 """
 
-# Parse the input and print the result
-try:
-    parsed_result = parse_input(input_str)
-    print(parsed_result)
-except Exception as e:
-    print(f"Error: {e}")
-
-# Step 4: Test the parser with an example input
-input_str = """@dc:creator "SIE Disruption Lab"
+AGENT_VOCABULARY = """@dc:creator "SIE Disruption Lab"
 @dc:contributor "Joe Gregory"
 @dc:description "A vocabulary to capture the organization patterns required by the SIE Disruption Lab."
 @dc:hasVersion "0.1"
@@ -639,15 +632,10 @@ vocabulary <http://uaontologies.com/UA_Core/UA_Agent#> as UA_Agent {
 }
 """
 
-# Parse the input and print the result
-try:
-    parsed_result = parse_input(input_str)
-    print(parsed_result)
-except Exception as e:
-    print(f"Error: {e}")
-
 # Function to visualize the parse tree
 def visualize_parse_tree(parse_tree):
+    from graphviz import Digraph
+
     def build_graph(tree, graph=None):
         if graph is None:
             graph = Digraph()
@@ -664,6 +652,20 @@ def visualize_parse_tree(parse_tree):
     graph = build_graph(parse_tree)
     return graph
 
-# Visualize the parse tree
-graph = visualize_parse_tree(parsed_result)
-graph.render("pizza_tree", format="png", view=True)
+def main():
+    parse_tree = None
+    for input_str in (PIZZA_VOCABULARY, FOUNDATION_VOCABULARY, AGENT_VOCABULARY):
+        # Parse the input and print the result
+        try:
+            parse_tree = get_oml_parser().parse(input_str)
+            print(parse_tree.pretty())
+        except Exception as e:
+            print(f"Error: {e}")
+
+    # Visualize the parse tree
+    if parse_tree is not None:
+        graph = visualize_parse_tree(parse_tree)
+        graph.render("pizza_tree", format="png", view=True)
+
+if __name__ == "__main__":
+    main()
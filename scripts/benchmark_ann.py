@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark IVF approximate search against exact search
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ann_index import IVFIndex, benchmark_recall
+from src.embedding_index import EmbeddingIndex
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark IVF recall and latency against exact search')
+    parser.add_argument('--index', '-i', type=str, help='Embedding index directory (defaults to synthetic data)')
+    parser.add_argument('--size', '-n', type=int, default=100000, help='Number of synthetic vectors')
+    parser.add_argument('--dim', '-d', type=int, default=1024, help='Dimension of synthetic vectors')
+    parser.add_argument('--queries', '-q', type=int, default=200, help='Number of queries')
+    parser.add_argument('--top-k', '-k', type=int, default=10, help='Neighbours per query')
+    parser.add_argument('--lists', type=int, default=None, help='Number of IVF lists')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64], help='nprobe values to evaluate')
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    
+    if args.index:
+        matrix = EmbeddingIndex.load(args.index).input_embeddings
+    else:
+        # Clustered synthetic data resembles real embedding distributions more than uniform noise
+        centers = rng.standard_normal((max(1, args.size // 500), args.dim)).astype(np.float32)
+        matrix = centers[rng.integers(len(centers), size=args.size)]
+        matrix += 0.5 * rng.standard_normal(matrix.shape).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    
+    # Queries are perturbed corpus rows
+    queries = matrix[rng.choice(len(matrix), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    
+    print(f"Building IVF index over {len(matrix)} vectors of dimension {matrix.shape[1]}...")
+    index = IVFIndex(n_lists=args.lists).build(matrix)
+    
+    print(f"{'nprobe':>8} {'recall@' + str(args.top_k):>10} {'ivf ms':>10} {'exact ms':>10}")
+    for row in benchmark_recall(matrix, queries, index, args.top_k, args.nprobe):
+        print(f"{row['nprobe']:>8} {row['recall']:>10.3f} {row['ivf_ms']:>10.3f} {row['exact_ms']:>10.3f}")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Script to measure import and startup time of OML Copilot entry points
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+STATEMENTS = [
+    "import src",
+    "from src import count_tokens",
+    "from src.prompt_engineering import create_instruction_prompt",
+    "from src.validation import OMLValidator",
+    "from src import EmbeddingManager; EmbeddingManager()",
+    "from src import OMLRetriever",
+]
+
+def time_statement(statement, repeat):
+    """Run a statement in fresh interpreters and return per-run wall times in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=ROOT_DIR, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold import time of OML Copilot modules')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='Fresh interpreters per statement')
+    args = parser.parse_args()
+    
+    baseline = statistics.median(time_statement("pass", args.repeat))
+    print(f"Interpreter startup: {baseline:.0f} ms (subtracted below)")
+    
+    for statement in STATEMENTS:
+        timings = time_statement(statement, args.repeat)
+        print(f"{statistics.median(timings) - baseline:>8.0f} ms  {statement}")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
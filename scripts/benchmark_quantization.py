@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Script to report memory saved and recall lost by quantized embedding storage
+
+A quantized retriever keeps only the quantized matrix resident (float32 rows
+are read from the memory-mapped index or the stored vectors for rescoring),
+so "saved" is the memory the float32 matrix would otherwise take.
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.embedding_index import EmbeddingIndex
+from src.embeddings import EmbeddingManager
+from src.examples_processor import ExamplesProcessor
+from src.quantization import benchmark_quantization
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark float16/int8 embedding storage against float32')
+    parser.add_argument('--index', '-i', type=str, help='Embedding index directory (defaults to synthetic data)')
+    parser.add_argument('--examples', '-e', type=str,
+                        help='Examples JSONL file (e.g. src/oml_examples.jsonl) whose inputs are embedded and searched')
+    parser.add_argument('--size', '-n', type=int, default=20000, help='Number of synthetic vectors')
+    parser.add_argument('--dim', '-d', type=int, default=1024, help='Dimension of synthetic vectors')
+    parser.add_argument('--queries', '-q', type=int, default=100, help='Number of queries')
+    parser.add_argument('--top-k', '-k', type=int, default=3, help='Neighbours per query')
+    parser.add_argument('--rescore-factor', '-r', type=int, default=4, help='Candidates per result rescored exactly')
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    
+    # Queries from a real corpus are its own rows, left out of their results
+    exclude = None
+    if args.index or args.examples:
+        if args.index:
+            matrix = np.asarray(EmbeddingIndex.load(args.index).input_embeddings)
+        else:
+            processor = ExamplesProcessor(EmbeddingManager())
+            vector_db = processor.process_examples(processor.load_examples(args.examples))
+            matrix = np.vstack([input_embedding for _, _, input_embedding, _ in vector_db]).astype(np.float32)
+        matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        exclude = rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)
+        queries = matrix[exclude]
+    else:
+        matrix = rng.standard_normal((args.size, args.dim)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+        # Queries are perturbed corpus rows
+        queries = matrix[rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)]
+        queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    
+    full_mb = matrix.size * 4 / 2**20
+    print(f"float32 matrix: {len(matrix)} x {matrix.shape[1]} = {full_mb:.2f} MiB")
+    print(f"{'mode':>8} {'MiB':>8} {'saved':>8} {'recall@' + str(args.top_k):>10} {'rescored':>10}")
+    for row in benchmark_quantization(matrix, queries, args.top_k, args.rescore_factor, exclude=exclude):
+        print(f"{row['mode']:>8} {row['bytes'] / 2**20:>8.2f} {row['bytes_saved'] / 2**20:>8.2f} "
+              f"{row['recall']:>10.3f} {row['rescored_recall']:>10.3f}")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,15 +12,31 @@ import glob
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.rag.embeddings import EmbeddingManager
-from src.rag.examples_processor import ExamplesProcessor
+from src.ann_index import IVFIndex, ANN_INDEX_FILE
+from src.embeddings import EmbeddingManager
+from src.embedding_index import EmbeddingIndex
+from src.quantization import QuantizedMatrix, QUANTIZATION_MODES, quantized_index_file
+from src.embedding_cache import EmbeddingCache
+from src.examples_processor import ExamplesProcessor
+from src.instrumentation import configure_logging
 
 def main():
     parser = argparse.ArgumentParser(description='Build examples database from OML files')
     parser.add_argument('--input', '-i', type=str, required=True, help='Input directory with OML files')
     parser.add_argument('--output', '-o', type=str, required=True, help='Output JSONL file')
     parser.add_argument('--embeddings', '-e', action='store_true', help='Generate embeddings')
+    parser.add_argument('--batch-size', '-b', type=int, default=64, help='Texts per embedding forward pass')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='CPU worker processes for embedding')
+    parser.add_argument('--cache', '-c', type=str, default=None,
+                        help='Embedding cache file (defaults to <output>_cache.sqlite)')
+    parser.add_argument('--cache-size', type=int, default=None, help='Maximum number of cached embeddings')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute every embedding')
+    parser.add_argument('--ann', action='store_true', help='Also build an IVF index for approximate search')
+    parser.add_argument('--quantize', '-q', choices=QUANTIZATION_MODES,
+                        help='Also store a reduced-precision copy of the input embeddings')
+    parser.add_argument('--log-level', type=str, default='INFO', help='Logging level (DEBUG, INFO, WARNING, ...)')
     args = parser.parse_args()
+    configure_logging(args.log_level)
     
     # Check if input directory exists
     if not os.path.isdir(args.input):
@@ -72,7 +88,13 @@ def main():
     if args.embeddings:
         print("Generating embeddings...")
         
-        embedding_manager = EmbeddingManager()
+        # Reuse embeddings of unchanged examples from previous builds
+        cache = None
+        if not args.no_cache:
+            cache_path = args.cache or args.output.replace('.jsonl', '_cache.sqlite')
+            cache = EmbeddingCache(cache_path, max_entries=args.cache_size)
+        
+        embedding_manager = EmbeddingManager(batch_size=args.batch_size, num_workers=args.workers, cache=cache)
         examples_processor = ExamplesProcessor(embedding_manager)
         
         # Load examples
@@ -85,10 +107,24 @@ def main():
         vector_db = examples_processor.process_examples(expanded_examples)
         
         # Save processed examples
-        embedding_output = args.output.replace('.jsonl', '_embeddings.json')
-        examples_processor.save_processed_examples(vector_db, embedding_output)
+        embedding_output = args.output.replace('.jsonl', '_index')
+        examples_processor.save_processed_examples(
+            vector_db, embedding_output, ids=[example['id'] for example in expanded_examples]
+        )
         
         print(f"Saved embeddings to {embedding_output}")
+        
+        # Build the approximate search index over the saved matrix
+        index = EmbeddingIndex.load(embedding_output)
+        if args.ann:
+            IVFIndex().build(index.input_embeddings).save(os.path.join(embedding_output, ANN_INDEX_FILE))
+            print(f"Saved IVF index to {os.path.join(embedding_output, ANN_INDEX_FILE)}")
+        
+        # Store the quantized scan matrix
+        if args.quantize:
+            quantized_path = os.path.join(embedding_output, quantized_index_file(args.quantize))
+            QuantizedMatrix.quantize(index.input_embeddings, args.quantize).save(quantized_path)
+            print(f"Saved {args.quantize} embeddings to {quantized_path}")
     
     return 0
 
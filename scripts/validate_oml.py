@@ -11,62 +11,77 @@ import glob
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.validation.validator import OMLValidator
+from src.validation.batch import (grammar_file_hash, load_state, save_state, summarize, validate_files,
+                                  write_json_report, write_junit_report)
+from src.validation.validator import PARSER_MODES
+
+def print_result(result):
+    """Print the verdict of one file."""
+    if result['skipped']:
+        status = "unchanged, valid" if result['valid'] else "unchanged, invalid"
+        print(f"{'✅' if result['valid'] else '❌'} {result['path']} ({status})")
+    elif result['valid']:
+        print(f"✅ {result['path']} is valid ({result['parse_time']:.3f}s)")
+    else:
+        print(f"❌ {result['path']} is invalid: {result['error']}")
 
 def main():
     parser = argparse.ArgumentParser(description='Validate OML files against grammar')
     parser.add_argument('--input', '-i', type=str, help='Input OML file or directory')
     parser.add_argument('--grammar', '-g', type=str, help='Grammar file')
+    parser.add_argument('--parser', choices=PARSER_MODES, default='auto', help='Parser mode of the validator')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Worker processes, each with its own compiled validator (0 = one per CPU)')
+    parser.add_argument('--json', type=str, help='Write a JSON report to this file')
+    parser.add_argument('--junit', type=str, help='Write a JUnit XML report to this file')
+    parser.add_argument('--changed-since', type=str, metavar='STATE_FILE',
+                        help='Only validate files whose content changed since the run that wrote STATE_FILE '
+                             '(unchanged files keep their verdict); the file is updated after the run')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Only print invalid files and the summary')
     args = parser.parse_args()
-    
+
     # Check if input exists
     if not args.input:
         print("Error: Please provide an input file or directory")
         return 1
-    
-    # Create validator
-    validator = OMLValidator(args.grammar)
-    
+
     # Get files to validate
     files_to_validate = []
     if os.path.isdir(args.input):
-        files_to_validate = glob.glob(os.path.join(args.input, "**/*.oml"), recursive=True)
+        files_to_validate = sorted(glob.glob(os.path.join(args.input, "**/*.oml"), recursive=True))
     elif os.path.isfile(args.input):
         files_to_validate = [args.input]
     else:
         print(f"Error: Input {args.input} does not exist")
         return 1
-    
+
     if not files_to_validate:
         print(f"No OML files found in {args.input}")
         return 1
-    
-    print(f"Validating {len(files_to_validate)} OML files")
-    
-    # Validate each file
-    success_count = 0
-    error_count = 0
-    
-    for file_path in files_to_validate:
-        print(f"Validating {file_path}...")
-        
-        # Read file content
-        with open(file_path, 'r') as file:
-            content = file.read()
-        
-        # Validate content
-        is_valid, result = validator.validate(content)
-        
-        if is_valid:
-            print(f"✅ {file_path} is valid")
-            success_count += 1
-        else:
-            print(f"❌ {file_path} is invalid: {result}")
-            error_count += 1
-    
-    print(f"\nValidation complete: {success_count} valid, {error_count} invalid")
-    
-    return 0 if error_count == 0 else 1
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    state = load_state(args.changed_since) if args.changed_since else None
+    print(f"Validating {len(files_to_validate)} OML files with {jobs} job(s)")
+
+    def report(result):
+        if not args.quiet or not result['valid']:
+            print_result(result)
+
+    results = validate_files(files_to_validate, args.grammar, parser=args.parser, jobs=jobs, state=state,
+                             on_result=report)
+
+    if args.json:
+        write_json_report(results, args.json)
+    if args.junit:
+        write_junit_report(results, args.junit)
+    if args.changed_since:
+        save_state(args.changed_since, grammar_file_hash(args.grammar), results, parser=args.parser)
+
+    summary = summarize(results)
+    print(f"\nValidation complete: {summary['valid']} valid, {summary['invalid']} invalid "
+          f"({summary['skipped']} unchanged, {summary['parse_time']:.2f}s parsing)")
+
+    return 0 if summary['invalid'] == 0 else 1
 
 if __name__ == "__main__":
     sys.exit(main())
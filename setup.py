@@ -10,7 +10,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        "lark>=1.1.5",
+        "lark>=1.2.2",
         "sentence-transformers>=2.2.2",
         "tiktoken>=0.5.1",
         "numpy>=1.20.0",
@@ -4,23 +4,37 @@ OML-Copilot package initialization.
 This package exposes the main retrieval, embedding, prompt engineering,
 example processing, and dependency extraction utilities used by the
 OML-Copilot workflow.
+
+Attributes are imported lazily on first access, so importing the package
+(e.g. for the tokenizer or prompt helpers) does not pull in
+sentence-transformers and torch.
 """
 
-from src.retriever import OMLRetriever
-from src.embeddings import EmbeddingManager
-from src.tokenizer_utils import get_tokenizer, count_tokens, truncate_text
-from src.prompt_engineering import create_instruction_prompt, extract_oml_code
-from src.examples_processor import ExamplesProcessor
-from src.dependency_extractor import DependencyExtractor
-
-__all__ = [
-    "OMLRetriever",
-    "EmbeddingManager",
-    "get_tokenizer",
-    "count_tokens",
-    "truncate_text",
-    "create_instruction_prompt",
-    "extract_oml_code",
-    "ExamplesProcessor",
-    "DependencyExtractor",
-]
\ No newline at end of file
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "OMLRetriever": "src.retriever",
+    "EmbeddingManager": "src.embeddings",
+    "EmbeddingIndex": "src.embedding_index",
+    "get_tokenizer": "src.tokenizer_utils",
+    "count_tokens": "src.tokenizer_utils",
+    "truncate_text": "src.tokenizer_utils",
+    "create_instruction_prompt": "src.prompt_engineering",
+    "extract_oml_code": "src.prompt_engineering",
+    "ExamplesProcessor": "src.examples_processor",
+    "DependencyExtractor": "src.dependency_extractor",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
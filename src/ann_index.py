@@ -0,0 +1,202 @@
+# ann_index.py - Approximate nearest-neighbour search over example embeddings
+
+import time
+import numpy as np
+
+ANN_INDEX_FILE = "ivf_index.npz"
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) index for cosine similarity search in pure NumPy.
+
+    The normalized embedding matrix is partitioned into n_lists clusters with
+    spherical k-means. A query is compared against the cluster centroids and
+    only the rows of the nprobe closest clusters are scored exactly, trading a
+    little recall for a much smaller scan.
+    """
+
+    def __init__(self, n_lists=None, nprobe=16, n_iter=20, seed=0):
+        """
+        Initialize an empty IVF index.
+
+        Args:
+            n_lists (int): Number of clusters (defaults to sqrt of the corpus size)
+            nprobe (int): Number of clusters scanned per query (higher is more
+                accurate and slower)
+            n_iter (int): Number of k-means iterations
+            seed (int): Random seed for centroid initialization
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.matrix = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def build(self, matrix):
+        """
+        Cluster the embedding matrix and build the inverted lists.
+
+        Args:
+            matrix (numpy.ndarray): L2-normalized float32 matrix of shape (n, dim)
+
+        Returns:
+            IVFIndex: self
+        """
+        n = matrix.shape[0]
+        if n == 0:
+            raise ValueError("Cannot build an IVF index over an empty matrix")
+
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+
+        # Train the centroids on a sample of the corpus
+        sample_size = min(n, 256 * n_lists)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # Re-seed empty clusters with random sample rows
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+
+            centroids = _normalize_rows(sums)
+
+        self.n_lists = n_lists
+        self.matrix = matrix
+        self.centroids = centroids
+        self._assign(matrix)
+        return self
+
+    def _assign(self, matrix, chunk_size=65536):
+        """Assign every row to its closest centroid and lay out the inverted lists."""
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk_size):
+            chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+            assignments[start:start + chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+
+        self.list_ids = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, query, k, nprobe=None):
+        """
+        Find approximate top-k rows for a normalized query vector.
+
+        Args:
+            query (numpy.ndarray): L2-normalized query vector
+            k (int): Number of results
+            nprobe (int): Clusters to scan (defaults to self.nprobe)
+
+        Returns:
+            tuple: (indices, scores) ordered by descending score
+        """
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        list_order = np.argsort(-(self.centroids @ query))
+
+        # Probe at least nprobe lists, and more if they hold fewer than k rows
+        lists = []
+        candidate_count = 0
+        for list_id in list_order:
+            size = self.list_offsets[list_id + 1] - self.list_offsets[list_id]
+            lists.append(list_id)
+            candidate_count += size
+            if len(lists) >= nprobe and candidate_count >= k:
+                break
+
+        candidates = np.concatenate([
+            self.list_ids[self.list_offsets[list_id]:self.list_offsets[list_id + 1]] for list_id in lists
+        ])
+        scores = np.asarray(self.matrix[candidates], dtype=np.float32) @ query
+
+        k = min(k, len(candidates))
+        if k < len(candidates):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top], scores[top]
+
+    def save(self, file_path):
+        """
+        Save the clustering (not the embedding matrix) to an .npz file.
+
+        Args:
+            file_path (str): Output file path
+        """
+        np.savez(file_path, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_ids=self.list_ids, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, file_path, matrix):
+        """
+        Load a saved clustering and attach it to an embedding matrix.
+
+        Args:
+            file_path (str): File written by save()
+            matrix (numpy.ndarray): The normalized embedding matrix it was built on
+
+        Returns:
+            IVFIndex: Loaded index
+        """
+        with np.load(file_path) as data:
+            index = cls(n_lists=len(data['centroids']), nprobe=int(data['nprobe']))
+            index.centroids = data['centroids']
+            index.list_offsets = data['list_offsets']
+            index.list_ids = data['list_ids']
+
+        if len(index.list_ids) != matrix.shape[0]:
+            raise ValueError(f"IVF index at {file_path} does not match the embedding matrix")
+
+        index.matrix = matrix
+        return index
+
+def benchmark_recall(matrix, queries, index, k=10, nprobe_values=(1, 4, 16, 64)):
+    """
+    Compare IVF search against exact brute-force search.
+
+    Args:
+        matrix (numpy.ndarray): L2-normalized embedding matrix
+        queries (numpy.ndarray): L2-normalized query matrix
+        index (IVFIndex): Index built over matrix
+        k (int): Number of neighbours per query
+        nprobe_values (tuple): nprobe settings to evaluate
+
+    Returns:
+        list: One dict per nprobe with recall@k and mean latencies in milliseconds
+    """
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = matrix @ query
+        exact.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    results = []
+    for nprobe in nprobe_values:
+        start = time.perf_counter()
+        found = [index.search(query, k, nprobe=nprobe)[0] for query in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = np.mean([len(truth.intersection(ids.tolist())) / k for truth, ids in zip(exact, found)])
+        results.append({
+            'nprobe': nprobe,
+            'recall': float(recall),
+            'ivf_ms': ivf_ms,
+            'exact_ms': exact_ms,
+        })
+    return results
+
+def _normalize_rows(matrix):
+    """L2-normalize the rows of a matrix."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,102 @@
+# bm25_index.py - Lexical BM25 scoring over example texts
+
+import re
+import numpy as np
+from src.keyword_index import KeywordIndex
+
+CAMEL_CASE_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+class BM25Index:
+    """
+    Okapi BM25 index over example inputs and outputs.
+
+    Term weights are precomputed per (term, document) pair and stored as
+    flat posting arrays, so scoring a query is one np.bincount over the
+    postings of its terms rather than a loop over documents.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """
+        Build the index.
+
+        Args:
+            documents (list): Document texts (typically example input + output)
+            k1 (float): Term frequency saturation parameter
+            b (float): Document length normalization parameter
+        """
+        self.num_documents = len(documents)
+        self.k1 = k1
+        self.b = b
+
+        term_frequencies = []
+        lengths = np.zeros(self.num_documents, dtype=np.float32)
+        for doc_id, document in enumerate(documents):
+            counts = {}
+            for term in self.tokenize(document):
+                counts[term] = counts.get(term, 0) + 1
+            term_frequencies.append(counts)
+            lengths[doc_id] = sum(counts.values())
+
+        average_length = float(lengths.mean()) if self.num_documents and lengths.mean() > 0 else 1.0
+        length_norm = k1 * (1 - b + b * lengths / average_length)
+
+        postings = {}
+        for doc_id, counts in enumerate(term_frequencies):
+            for term, frequency in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(frequency * (k1 + 1) / (frequency + length_norm[doc_id]))
+
+        self.postings = {}
+        for term, (doc_ids, weights) in postings.items():
+            idf = np.log(1 + (self.num_documents - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            self.postings[term] = (
+                np.asarray(doc_ids, dtype=np.int64),
+                np.asarray(weights, dtype=np.float32) * np.float32(idf),
+            )
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into lowercase terms.
+
+        OML identifiers are kept whole and also split on camelCase, so a query
+        word like "topping" matches an identifier like hasTopping.
+
+        Args:
+            text (str): Text to tokenize
+
+        Returns:
+            list: Terms
+        """
+        terms = []
+        for token in KeywordIndex.tokenize(text):
+            terms.append(token.lower())
+            parts = CAMEL_CASE_PATTERN.findall(token)
+            if len(parts) > 1:
+                terms.extend(part.lower() for part in parts)
+        return terms
+
+    def score(self, query):
+        """
+        Score every document against a query.
+
+        Args:
+            query (str): Query text
+
+        Returns:
+            numpy.ndarray: BM25 score per document
+        """
+        doc_ids = []
+        weights = []
+        for term in set(self.tokenize(query)):
+            if term in self.postings:
+                doc_ids.append(self.postings[term][0])
+                weights.append(self.postings[term][1])
+
+        if not doc_ids:
+            return np.zeros(self.num_documents, dtype=np.float32)
+
+        return np.bincount(
+            np.concatenate(doc_ids), weights=np.concatenate(weights), minlength=self.num_documents
+        ).astype(np.float32)
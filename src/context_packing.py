@@ -0,0 +1,247 @@
+# context_packing.py - Relevance-per-token packing of retrieved examples into a token budget
+
+import math
+import numpy as np
+from src.tokenizer_utils import count_tokens, get_tokenizer, truncate_text
+
+EXCERPT_MODES = ('statements', 'truncate', None)
+
+# The knapsack table never has more capacity cells than this; larger budgets
+# are solved on a coarser token grid and topped up greedily
+MAX_DP_CELLS = 4096
+
+def split_statements(text):
+    """
+    Split OML text into a header, top-level statements, and a footer.
+
+    A statement is a run of lines that starts at the body depth of the
+    enclosing vocabulary/description braces and ends when its own brackets
+    are closed. Annotation lines (starting with @) are kept with the
+    statement that follows them. Text without an enclosing block is split
+    into lines.
+
+    Args:
+        text (str): OML text (possibly a chunk of a larger file)
+
+    Returns:
+        tuple: (header, statements, footer) where statements is a list of strings
+    """
+    lines = text.split('\n')
+    header_end = 0
+    depth = 0
+    for i, line in enumerate(lines):
+        depth += _depth_change(line)
+        if depth > 0:
+            header_end = i + 1
+            break
+    else:
+        return '', [line + '\n' for line in lines[:-1]] + ([lines[-1]] if lines[-1] else []), ''
+
+    body_depth = depth
+    footer_start = len(lines)
+    while footer_start > header_end and lines[footer_start - 1].strip() in ('}', ''):
+        footer_start -= 1
+
+    statements = []
+    current = []
+    for line in lines[header_end:footer_start]:
+        current.append(line)
+        depth += _depth_change(line)
+        stripped = line.strip()
+        if depth <= body_depth and stripped and not stripped.startswith('@'):
+            statements.append('\n'.join(current) + '\n')
+            current = []
+    if current:
+        statements.append('\n'.join(current) + '\n')
+
+    header = '\n'.join(lines[:header_end]) + '\n'
+    footer = '\n'.join(lines[footer_start:])
+    return header, statements, footer
+
+def statement_excerpt(text, max_tokens, tokenizer=None):
+    """
+    Shorten OML text to its header, leading whole statements, and footer.
+
+    Args:
+        text (str): OML text
+        max_tokens (int): Token limit for the excerpt
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
+
+    Returns:
+        str: Excerpt within max_tokens, or None if not even the header and
+            one statement fit
+    """
+    header, statements, footer = split_statements(text)
+    if not statements:
+        return None
+
+    # Add statements while the estimate fits, then confirm with one exact count
+    used = count_tokens(header, tokenizer) + count_tokens(footer, tokenizer)
+    kept = 0
+    for statement in statements:
+        statement_tokens = count_tokens(statement, tokenizer)
+        if used + statement_tokens > max_tokens:
+            break
+        used += statement_tokens
+        kept += 1
+
+    while kept > 0:
+        excerpt = header + ''.join(statements[:kept]) + footer
+        if count_tokens(excerpt, tokenizer) <= max_tokens:
+            return excerpt
+        kept -= 1
+    return None
+
+def pack_examples(examples, budget, tokenizer=None, excerpt='statements', min_excerpt_tokens=64):
+    """
+    Choose examples (or excerpts of them) that maximize total relevance within a token budget.
+
+    Each example can be left out, included whole, or, when it has more than
+    min_excerpt_tokens tokens, included as an excerpt of about a half or a
+    quarter of its tokens (or whatever fits the budget). An excerpt is
+    valued in proportion to the share of tokens it keeps. The choice is a
+    multiple-choice knapsack solved exactly by dynamic programming on a token
+    grid of at most MAX_DP_CELLS cells. Whatever budget the grid rounding
+    leaves is then filled greedily by value per token.
+
+    Args:
+        examples (list): (text, score) tuples, best first
+        budget (int): Token budget for the examples
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
+        excerpt (str): 'statements' (whole OML statements), 'truncate' (token
+            prefix) or None (whole examples only)
+        min_excerpt_tokens (int): Smallest excerpt worth including
+
+    Returns:
+        list: Dicts with 'text', 'score', 'tokens' (tokens the example
+            contributes), 'rank' (position in examples) and 'excerpt' (whether
+            it was shortened), in rank order
+    """
+    if excerpt not in EXCERPT_MODES:
+        raise ValueError(f"Unknown excerpt mode: {excerpt}")
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+    if budget <= 0 or not examples:
+        return []
+
+    groups = [_variants(text, score, budget, tokenizer, excerpt, min_excerpt_tokens)
+              for text, score in examples]
+    chosen = _solve_knapsack(groups, budget)
+
+    # Top up the budget left over by the grid rounding, best value per token first
+    remaining = budget - sum(groups[rank][variant]['tokens'] for rank, variant in chosen.items())
+    candidates = sorted(
+        ((variant['value'] / max(variant['tokens'], 1), rank, index)
+         for rank, group in enumerate(groups) if rank not in chosen
+         for index, variant in enumerate(group)),
+        reverse=True,
+    )
+    for _, rank, index in candidates:
+        if rank not in chosen and groups[rank][index]['tokens'] <= remaining:
+            chosen[rank] = index
+            remaining -= groups[rank][index]['tokens']
+
+    packed = []
+    for rank in sorted(chosen):
+        variant = groups[rank][chosen[rank]]
+        packed.append({
+            'text': variant['text'],
+            'score': examples[rank][1],
+            'tokens': variant['tokens'],
+            'rank': rank,
+            'excerpt': variant['excerpt'],
+        })
+    return packed
+
+def _variants(text, score, budget, tokenizer, excerpt, min_excerpt_tokens):
+    """List the ways an example can be included, each with its token cost and value."""
+    tokens = count_tokens(text, tokenizer)
+    value = max(float(score), 0.0) + 1e-6
+    variants = []
+    if tokens <= budget:
+        variants.append({'text': text, 'tokens': tokens, 'value': value, 'excerpt': False})
+
+    if excerpt is None or tokens <= min_excerpt_tokens:
+        return variants
+
+    seen = set()
+    for target in (min(tokens - 1, budget), tokens // 2, tokens // 4):
+        if target < min_excerpt_tokens:
+            continue
+        if excerpt == 'statements':
+            excerpt_text = statement_excerpt(text, target, tokenizer)
+            if excerpt_text is None:
+                excerpt_text = truncate_text(text, target, tokenizer)
+        else:
+            excerpt_text = truncate_text(text, target, tokenizer)
+
+        excerpt_tokens = count_tokens(excerpt_text, tokenizer)
+        if excerpt_text in seen or excerpt_tokens > budget or excerpt_tokens < min_excerpt_tokens:
+            continue
+        seen.add(excerpt_text)
+        variants.append({
+            'text': excerpt_text,
+            'tokens': excerpt_tokens,
+            'value': value * excerpt_tokens / tokens,
+            'excerpt': True,
+        })
+    return variants
+
+def _solve_knapsack(groups, budget):
+    """
+    Pick at most one variant per group to maximize total value within the budget.
+
+    Args:
+        groups (list): Per-example lists of variants
+        budget (int): Token budget
+
+    Returns:
+        dict: Example rank -> chosen variant index
+    """
+    granularity = max(1, math.ceil(budget / MAX_DP_CELLS))
+    capacity = budget // granularity
+
+    best = np.zeros(capacity + 1)
+    choices = np.full((len(groups), capacity + 1), -1, dtype=np.int16)
+    for rank, group in enumerate(groups):
+        updated = best.copy()
+        for index, variant in enumerate(group):
+            # Rounding costs up keeps every grid solution within the real budget
+            weight = math.ceil(variant['tokens'] / granularity)
+            if weight > capacity:
+                continue
+            candidate = np.full(capacity + 1, -np.inf)
+            candidate[weight:] = best[:capacity + 1 - weight] + variant['value']
+            better = candidate > updated
+            updated[better] = candidate[better]
+            choices[rank, better] = index
+        best = updated
+
+    chosen = {}
+    cell = int(np.argmax(best))
+    for rank in range(len(groups) - 1, -1, -1):
+        index = choices[rank, cell]
+        if index >= 0:
+            chosen[rank] = int(index)
+            cell -= math.ceil(groups[rank][index]['tokens'] / granularity)
+    return chosen
+
+def _depth_change(line):
+    """Net change in brace/bracket depth over a line, ignoring quoted strings and IRIs."""
+    change = 0
+    in_string = False
+    in_iri = False
+    for char in line:
+        if in_string:
+            in_string = char != '"'
+        elif in_iri:
+            in_iri = char != '>'
+        elif char == '"':
+            in_string = True
+        elif char == '<' and '>' in line:
+            in_iri = True
+        elif char in '{[':
+            change += 1
+        elif char in '}]':
+            change -= 1
+    return change
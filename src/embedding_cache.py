@@ -0,0 +1,239 @@
+# embedding_cache.py - Persistent content-hash cache for embeddings
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+class EmbeddingCache:
+    """
+    SQLite-backed store of embeddings keyed by content hash.
+
+    Each entry is keyed by a SHA-256 of (model name, prefix, text), so a
+    rebuild only has to embed texts that changed since the last run. When
+    max_entries is set, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_path, max_entries=None):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            cache_path (str): Path to the SQLite cache file (":memory:" for a
+                non-persistent cache)
+            max_entries (int): Maximum number of cached embeddings (None for unbounded)
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model_name, prefix, text):
+        """
+        Build the cache key for a text.
+
+        Args:
+            model_name (str): Embedding model name
+            prefix (str): Embedding prefix ("query" or "passage")
+            text (str): Text being embedded (after truncation)
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        for part in (model_name, prefix, text):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get_many(self, model_name, prefix, texts):
+        """
+        Look up cached embeddings for several texts.
+
+        Args:
+            model_name (str): Embedding model name
+            prefix (str): Embedding prefix ("query" or "passage")
+            texts (list): Texts to look up
+
+        Returns:
+            dict: Mapping of position in texts to cached embedding
+        """
+        keys = [self.make_key(model_name, prefix, text) for text in texts]
+        positions = {}
+        for position, key in enumerate(keys):
+            positions.setdefault(key, []).append(position)
+
+        found = {}
+        unique_keys = list(positions)
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    embedding = np.frombuffer(vector, dtype=np.float32)
+                    for position in positions[key]:
+                        found[position] = embedding
+
+            if found:
+                now = time.time()
+                hit_keys = {keys[position] for position in found}
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in hit_keys]
+                )
+                self._connection.commit()
+
+        return found
+
+    def put_many(self, model_name, prefix, texts, embeddings):
+        """
+        Store embeddings for several texts, evicting old entries if needed.
+
+        Args:
+            model_name (str): Embedding model name
+            prefix (str): Embedding prefix ("query" or "passage")
+            texts (list): Embedded texts
+            embeddings: Embeddings, one per text
+        """
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, prefix, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        """Delete the least recently used entries above max_entries."""
+        if self.max_entries is None:
+            return
+
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC, rowid ASC LIMIT ?)", (excess,)
+            )
+
+    def clear(self):
+        """Remove every cached embedding."""
+        with self._lock:
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe in-memory LRU cache of query embeddings.
+
+    Repeated queries (retries, re-issued editor requests, feedback-loop
+    lookups) are answered from memory instead of running the model again.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Initialize the query cache.
+
+        Args:
+            capacity (int): Maximum number of cached query embeddings
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        """
+        Look up a query embedding, marking it as recently used.
+
+        Args:
+            text (str): Query text
+
+        Returns:
+            numpy.ndarray: Cached read-only embedding, or None on a miss
+        """
+        with self._lock:
+            embedding = self._entries.get(text)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return embedding
+
+    def put(self, text, embedding):
+        """
+        Store a query embedding, evicting the least recently used one if full.
+
+        Args:
+            text (str): Query text
+            embedding (numpy.ndarray): Query embedding
+        """
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[text] = embedding
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached embedding and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        Returns:
+            dict: Hits, misses, hit rate, current size and capacity
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'capacity': self.capacity,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,336 @@
+# embedding_index.py - Binary on-disk storage for example embeddings
+
+import base64
+import json
+import os
+import numpy as np
+
+INDEX_VERSION = 1
+METADATA_FILE = "metadata.json"
+INPUT_EMBEDDINGS_FILE = "input_embeddings.npy"
+OUTPUT_EMBEDDINGS_FILE = "output_embeddings.npy"
+OUTPUT_TOKENS_FILE = "output_tokens.npy"
+OUTPUT_TOKEN_OFFSETS_FILE = "output_token_offsets.npy"
+CHANGES_FILE = "changes.jsonl"
+
+class EmbeddingIndex:
+    """
+    Example texts and their embeddings stored as float32 matrices.
+
+    On disk an index is a directory holding two .npy matrices (input and
+    output embeddings) and a metadata.json sidecar with the example ids,
+    texts, and the model name/dimension. Loading maps the matrices with
+    np.memmap instead of reading them into memory.
+
+    The token ids of every example output can be stored alongside, as one
+    flat int32 array plus offsets, so prompt assembly never re-tokenizes
+    examples. The tokenizer's encoding name is recorded in the metadata.
+
+    Upserts and deletes made after the index was written are appended to a
+    changes.jsonl journal next to it; save() folds them into the matrices and
+    clears the journal.
+    """
+
+    def __init__(self, ids, inputs, outputs, input_embeddings, output_embeddings, model_name=None,
+                 output_token_ids=None, tokenizer_name=None):
+        """
+        Initialize an embedding index.
+
+        Args:
+            ids (list): Example ids
+            inputs (list): Example input texts
+            outputs (list): Example output texts
+            input_embeddings (numpy.ndarray): L2-normalized input embedding matrix
+            output_embeddings (numpy.ndarray): Output embedding matrix
+            model_name (str): Name of the embedding model that produced the vectors
+            output_token_ids (list): Optional token ids of each output
+            tokenizer_name (str): Encoding name of the tokenizer that produced them
+        """
+        self.ids = list(ids)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.input_embeddings = input_embeddings
+        self.output_embeddings = output_embeddings
+        self.model_name = model_name
+        self.tokenizer_name = tokenizer_name
+        self.token_ids = None
+        self.token_offsets = None
+        if output_token_ids is not None:
+            if len(output_token_ids) != len(self.ids):
+                raise ValueError(f"Got token ids for {len(output_token_ids)} of {len(self.ids)} examples")
+            self.token_ids, self.token_offsets = _pack_token_ids(output_token_ids)
+
+    @property
+    def has_token_ids(self):
+        """Whether output token ids are stored in the index."""
+        return self.token_offsets is not None
+
+    @property
+    def token_counts(self):
+        """Token count of each output (None without stored token ids)."""
+        return np.diff(self.token_offsets) if self.has_token_ids else None
+
+    def output_token_ids(self, position):
+        """
+        Token ids of one example output.
+
+        Args:
+            position (int): Example position
+
+        Returns:
+            numpy.ndarray: int32 token ids (a view into the index array)
+        """
+        return self.token_ids[self.token_offsets[position]:self.token_offsets[position + 1]]
+
+    def output_token_id_list(self):
+        """Token ids of every output as a list of views (None without stored token ids)."""
+        if not self.has_token_ids:
+            return None
+        return [self.output_token_ids(position) for position in range(len(self))]
+
+    @property
+    def dimension(self):
+        """Embedding dimension (0 for an empty index)."""
+        return self.input_embeddings.shape[1] if self.input_embeddings.ndim == 2 else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_vector_db(cls, vector_db, ids=None, model_name=None, tokenizer=None):
+        """
+        Build an index from an in-memory vector database.
+
+        Args:
+            vector_db (list): (input, output, input_embedding, output_embedding) tuples
+            ids (list): Optional example ids (defaults to row numbers)
+            model_name (str): Name of the embedding model
+            tokenizer: Optional tokenizer; when given and named (see
+                src.tokenizer_utils.tokenizer_name), the token ids of every
+                output are computed now and stored with the index
+
+        Returns:
+            EmbeddingIndex: Index with normalized input embeddings
+        """
+        if ids is None:
+            ids = [str(i) for i in range(len(vector_db))]
+        if len(ids) != len(vector_db):
+            raise ValueError(f"Got {len(ids)} ids for {len(vector_db)} examples")
+
+        inputs = [entry[0] for entry in vector_db]
+        outputs = [entry[1] for entry in vector_db]
+        input_embeddings = _stack([entry[2] for entry in vector_db])
+        output_embeddings = _stack([entry[3] for entry in vector_db])
+
+        norms = np.linalg.norm(input_embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        input_embeddings /= norms
+
+        output_token_ids = None
+        name = None
+        if tokenizer is not None:
+            from src.tokenizer_utils import tokenizer_name
+            name = tokenizer_name(tokenizer)
+        if name is not None:
+            output_token_ids = [tokenizer.encode(output) for output in outputs]
+
+        return cls(ids, inputs, outputs, input_embeddings, output_embeddings, model_name, output_token_ids, name)
+
+    def to_vector_db(self):
+        """
+        Convert the index back to vector database tuples.
+
+        Returns:
+            list: (input, output, input_embedding, output_embedding) tuples whose
+                embeddings are row views into the index matrices
+        """
+        return list(zip(self.inputs, self.outputs, self.input_embeddings, self.output_embeddings))
+
+    def save(self, index_path):
+        """
+        Write the index to a directory and clear its change journal.
+
+        Files are written under temporary names and renamed into place, so a
+        process that has the previous matrices memory-mapped keeps reading
+        them undisturbed.
+
+        Args:
+            index_path (str): Output directory (created if missing)
+        """
+        os.makedirs(index_path, exist_ok=True)
+
+        _save_array(os.path.join(index_path, INPUT_EMBEDDINGS_FILE), self.input_embeddings)
+        _save_array(os.path.join(index_path, OUTPUT_EMBEDDINGS_FILE), self.output_embeddings)
+        for file_name, array in ((OUTPUT_TOKENS_FILE, self.token_ids), (OUTPUT_TOKEN_OFFSETS_FILE, self.token_offsets)):
+            file_path = os.path.join(index_path, file_name)
+            if array is not None:
+                _save_array(file_path, array, array.dtype)
+            elif os.path.exists(file_path):
+                os.remove(file_path)
+
+        metadata = {
+            'version': INDEX_VERSION,
+            'model_name': self.model_name,
+            'dimension': self.dimension,
+            'count': len(self),
+            'tokenizer': self.tokenizer_name if self.has_token_ids else None,
+            'ids': self.ids,
+            'inputs': self.inputs,
+            'outputs': self.outputs,
+        }
+        metadata_path = os.path.join(index_path, METADATA_FILE)
+        with open(metadata_path + '.tmp', 'w') as file:
+            json.dump(metadata, file, separators=(',', ':'))
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+        changes_path = os.path.join(index_path, CHANGES_FILE)
+        if os.path.exists(changes_path):
+            os.remove(changes_path)
+
+    @classmethod
+    def load(cls, index_path, mmap=True):
+        """
+        Open an index directory.
+
+        Args:
+            index_path (str): Directory written by save()
+            mmap (bool): Map the embedding matrices read-only instead of loading them
+
+        Returns:
+            EmbeddingIndex: Loaded index
+        """
+        with open(os.path.join(index_path, METADATA_FILE), 'r') as file:
+            metadata = json.load(file)
+
+        if metadata.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported embedding index version: {metadata.get('version')}")
+
+        mmap_mode = 'r' if mmap else None
+        input_embeddings = np.load(os.path.join(index_path, INPUT_EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        output_embeddings = np.load(os.path.join(index_path, OUTPUT_EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+
+        if len(input_embeddings) != metadata['count']:
+            raise ValueError(f"Embedding index at {index_path} is inconsistent with its metadata")
+
+        index = cls(metadata['ids'], metadata['inputs'], metadata['outputs'],
+                    input_embeddings, output_embeddings, metadata.get('model_name'))
+
+        # Indexes written before token ids were stored simply have none
+        tokens_path = os.path.join(index_path, OUTPUT_TOKENS_FILE)
+        offsets_path = os.path.join(index_path, OUTPUT_TOKEN_OFFSETS_FILE)
+        if metadata.get('tokenizer') and os.path.exists(tokens_path) and os.path.exists(offsets_path):
+            index.token_offsets = np.load(offsets_path, mmap_mode=mmap_mode)
+            index.token_ids = np.load(tokens_path, mmap_mode=mmap_mode)
+            index.tokenizer_name = metadata['tokenizer']
+            if len(index.token_offsets) != metadata['count'] + 1:
+                raise ValueError(f"Token ids at {index_path} are inconsistent with its metadata")
+        return index
+
+    @staticmethod
+    def exists(index_path):
+        """Check whether a directory holds an embedding index."""
+        return bool(index_path) and os.path.isfile(os.path.join(index_path, METADATA_FILE))
+
+    @staticmethod
+    def append_changes(index_path, changes):
+        """
+        Append upserts and deletes to an index directory's change journal.
+
+        Args:
+            index_path (str): Index directory
+            changes (list): Dicts with 'op' ('upsert' or 'delete') and 'id';
+                upserts also carry 'input', 'output', 'input_embedding' and
+                'output_embedding'
+        """
+        changes_path = os.path.join(index_path, CHANGES_FILE)
+        # A torn line from an interrupted write would hide everything after it
+        _truncate_torn_line(changes_path)
+        with open(changes_path, 'a') as file:
+            for change in changes:
+                record = dict(change)
+                for key in ('input_embedding', 'output_embedding'):
+                    if key in record:
+                        record[key] = _encode_vector(record[key])
+                file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def load_changes(index_path):
+        """
+        Read the change journal of an index directory.
+
+        A torn last line (from a crash mid-write) is ignored.
+
+        Args:
+            index_path (str): Index directory
+
+        Returns:
+            list: Changes in the order they were made
+        """
+        changes_path = os.path.join(index_path, CHANGES_FILE)
+        if not os.path.exists(changes_path):
+            return []
+
+        changes = []
+        with open(changes_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                for key in ('input_embedding', 'output_embedding'):
+                    if key in record:
+                        record[key] = _decode_vector(record[key])
+                changes.append(record)
+        return changes
+
+def _stack(embeddings):
+    """Stack embeddings into a contiguous float32 matrix."""
+    if len(embeddings) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.ascontiguousarray(np.vstack(embeddings), dtype=np.float32)
+
+def _save_array(file_path, array, dtype=np.float32):
+    """Write an .npy file atomically."""
+    with open(file_path + '.tmp', 'wb') as file:
+        np.save(file, np.asarray(array, dtype=dtype))
+    os.replace(file_path + '.tmp', file_path)
+
+def _truncate_torn_line(file_path, chunk_size=4096):
+    """Cut a journal back to just after its last newline."""
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            file.truncate(position)
+            file.flush()
+            os.fsync(file.fileno())
+
+def _pack_token_ids(token_id_lists):
+    """Concatenate per-example token ids into a flat int32 array plus int64 offsets."""
+    counts = np.fromiter((len(token_ids) for token_ids in token_id_lists), dtype=np.int64, count=len(token_id_lists))
+    offsets = np.zeros(len(token_id_lists) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    flat = np.empty(int(offsets[-1]), dtype=np.int32)
+    for position, token_ids in enumerate(token_id_lists):
+        flat[offsets[position]:offsets[position + 1]] = token_ids
+    return flat, offsets
+
+def _encode_vector(vector):
+    """Encode an embedding as base64 float32 bytes."""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+
+def _decode_vector(text):
+    """Decode an embedding written by _encode_vector."""
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32).copy()
@@ -0,0 +1,388 @@
+# embedding_worker.py - Shared embedding model process for many copilot sessions
+
+import argparse
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# Shared secret of the worker and its clients when none is passed explicitly
+AUTHKEY_ENV = 'OML_EMBEDDING_WORKER_AUTHKEY'
+
+def default_socket_path():
+    """
+    Socket path of the worker, in a directory private to this user.
+
+    Returns:
+        str: embeddings.sock in $XDG_RUNTIME_DIR/oml-copilot, or in a per-user
+            directory of the temporary directory if XDG_RUNTIME_DIR is unset
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        directory = os.path.join(runtime_dir, 'oml-copilot')
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f'oml-copilot-{os.getuid()}')
+    return os.path.join(directory, 'embeddings.sock')
+
+def private_socket_directory(address):
+    """
+    Create the directory of a socket path with mode 0700, or check an existing one.
+
+    Args:
+        address (str): Unix socket path
+
+    Returns:
+        str: The directory
+
+    Raises:
+        PermissionError: If the directory belongs to another user or other users can access it
+    """
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Socket directory {directory} must belong to this user and have mode 0700")
+    return directory
+
+def _require_authkey(authkey):
+    """The authkey as bytes, falling back to $OML_EMBEDDING_WORKER_AUTHKEY."""
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"The embedding worker needs an authkey (pass one or set {AUTHKEY_ENV})")
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+class _EncodeRequest:
+    """A client's texts waiting to be encoded in the next micro-batch."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class EmbeddingWorker:
+    """
+    Local server that holds one embedding model and encodes for many clients.
+
+    Clients connect over a Unix socket in a directory only this user can
+    access, and must present the worker's authkey before anything they send
+    is unpickled. Requests that arrive within max_wait_ms of each other are
+    merged into a single forward pass of up to max_batch_size texts, so
+    concurrent sessions share both the model memory and the batching
+    throughput.
+    """
+
+    def __init__(self, address, model_name='intfloat/multilingual-e5-large-instruct', model=None,
+                 max_batch_size=64, max_wait_ms=5, authkey=None):
+        """
+        Initialize the worker.
+
+        Args:
+            address (str): Unix socket path to listen on
+            model_name (str): Sentence transformer model to load
+            model: Optional already-loaded model with an encode() method
+            max_batch_size (int): Maximum texts per forward pass
+            max_wait_ms (float): How long to wait for more requests before encoding
+            authkey (bytes): Shared secret clients must present (defaults to
+                $OML_EMBEDDING_WORKER_AUTHKEY; one of them is required)
+        """
+        self.address = address
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.authkey = _require_authkey(authkey)
+        self.batches = 0
+        self.texts_encoded = 0
+
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+        self.model = model
+
+        self._requests = queue.Queue()
+        self._listener = None
+        self._running = False
+        self._threads = []
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start accepting clients and batching requests in background threads.
+
+        Returns:
+            EmbeddingWorker: self
+        """
+        private_socket_directory(self.address)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        self._running = True
+
+        for target in (self._accept_loop, self._batch_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def serve_forever(self):
+        """Run the worker until interrupted."""
+        self.start()
+        try:
+            while self._running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the worker, disconnect its clients and remove its socket."""
+        if not self._running:
+            return
+        self._running = False
+        self._requests.put(None)
+        self._listener.close()
+        with self._connections_lock:
+            for connection in self._connections:
+                # Shutting the socket down wakes the thread waiting in recv(), which then closes it
+                with socket.fromfd(connection.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+                    client_socket.shutdown(socket.SHUT_RDWR)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _accept_loop(self):
+        """Accept client connections, serving each one in its own thread."""
+        while self._running:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        """Answer one client's requests until it disconnects."""
+        with self._connections_lock:
+            self._connections.add(connection)
+        try:
+            self._answer(connection)
+        finally:
+            with self._connections_lock:
+                self._connections.discard(connection)
+            connection.close()
+
+    def _answer(self, connection):
+        """Answer requests on a connection until it or the worker closes."""
+        while self._running:
+            try:
+                command, payload = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if command == 'info':
+                connection.send(('ok', {
+                    'model_name': self.model_name,
+                    'dimension': self.model.get_sentence_embedding_dimension(),
+                }))
+            elif command == 'encode':
+                request = self._encode(list(payload))
+                try:
+                    if request.error is not None:
+                        connection.send(('error', request.error))
+                    else:
+                        connection.send(('ok', request.result))
+                except OSError:
+                    break
+            else:
+                connection.send(('error', f"Unknown command: {command}"))
+
+    def _encode(self, texts):
+        """
+        Queue texts for the next micro-batch and wait until they are encoded.
+
+        Args:
+            texts (list): Texts to encode
+
+        Returns:
+            _EncodeRequest: The finished request, with its result or error
+        """
+        request = _EncodeRequest(texts)
+        self._requests.put(request)
+        # A request queued after the batch loop stopped would never be picked up
+        while not request.done.wait(self.max_wait + 0.1):
+            if not self._running:
+                request.error = "Embedding worker is shutting down"
+                break
+        return request
+
+    def _batch_loop(self):
+        """Collect concurrent requests into micro-batches and encode them."""
+        try:
+            self._collect_batches()
+        finally:
+            self._fail_pending()
+
+    def _collect_batches(self):
+        """Encode micro-batches until the shutdown sentinel is read."""
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            batch_texts = len(request.texts)
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while batch_texts < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                batch_texts += len(request.texts)
+
+            self._encode_batch(batch)
+            if stop:
+                return
+
+    def _fail_pending(self):
+        """Fail every request still queued once batching has stopped."""
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.error = "Embedding worker is shutting down"
+                request.done.set()
+
+    def _encode_batch(self, batch):
+        """Run one forward pass for a micro-batch and hand each client its rows."""
+        texts = [text for request in batch for text in request.texts]
+        try:
+            embeddings = self.model.encode(texts, batch_size=self.max_batch_size)
+        except Exception as e:
+            for request in batch:
+                request.error = f"Encoding failed: {e}"
+                request.done.set()
+            return
+
+        self.batches += 1
+        self.texts_encoded += len(texts)
+
+        start = 0
+        for request in batch:
+            request.result = embeddings[start:start + len(request.texts)]
+            start += len(request.texts)
+            request.done.set()
+
+class EmbeddingWorkerClient:
+    """
+    Connection to an EmbeddingWorker that can stand in for a SentenceTransformer.
+
+    Only encode() and get_sentence_embedding_dimension() are provided, which
+    is all EmbeddingManager uses. If the worker restarts, the next request
+    reconnects and is sent again.
+    """
+
+    def __init__(self, address, authkey=None):
+        """
+        Connect to a running worker.
+
+        Args:
+            address (str): Unix socket path of the worker
+            authkey (bytes): Shared secret of the worker (defaults to
+                $OML_EMBEDDING_WORKER_AUTHKEY)
+        """
+        self.address = address
+        self._authkey = _require_authkey(authkey)
+        self._connection = Client(address, family='AF_UNIX', authkey=self._authkey)
+        self._lock = threading.Lock()
+        self._info = self._call('info', None)
+
+    @property
+    def model_name(self):
+        """Name of the model loaded by the worker."""
+        return self._info['model_name']
+
+    def get_sentence_embedding_dimension(self):
+        """Embedding dimension of the worker's model."""
+        return self._info['dimension']
+
+    def encode(self, texts, batch_size=None):
+        """
+        Encode texts in the worker.
+
+        Args:
+            texts: A text or list of texts
+            batch_size: Ignored; the worker decides its own batching
+
+        Returns:
+            numpy.ndarray: One embedding, or a matrix with one row per text
+        """
+        if isinstance(texts, str):
+            return self._call('encode', [texts])[0]
+        return self._call('encode', list(texts))
+
+    def close(self):
+        """Close the connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _call(self, command, payload):
+        """Send one request and wait for its reply, reconnecting once if the worker went away."""
+        with self._lock:
+            try:
+                self._connection.send((command, payload))
+                status, result = self._connection.recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self._reconnect()
+                self._connection.send((command, payload))
+                status, result = self._connection.recv()
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    def _reconnect(self):
+        """Connect to the restarted worker, which must serve the same model."""
+        self._connection.close()
+        self._connection = Client(self.address, family='AF_UNIX', authkey=self._authkey)
+        self._connection.send(('info', None))
+        status, info = self._connection.recv()
+        if status != 'ok' or info['model_name'] != self._info['model_name']:
+            raise RuntimeError(f"Embedding worker at {self.address} no longer serves {self._info['model_name']}")
+        self._info = info
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a shared embedding worker for OML Copilot sessions')
+    parser.add_argument('--socket', '-s', type=str, default=default_socket_path(),
+                        help='Unix socket path to listen on (its directory is created with mode 0700)')
+    parser.add_argument('--model', '-m', type=str, default='intfloat/multilingual-e5-large-instruct',
+                        help='Sentence transformer model name')
+    parser.add_argument('--batch-size', '-b', type=int, default=64, help='Maximum texts per forward pass')
+    parser.add_argument('--wait-ms', '-w', type=float, default=5, help='Micro-batching window in milliseconds')
+    args = parser.parse_args()
+    # The secret is only read from the environment: command lines are visible to every local user
+    if not os.environ.get(AUTHKEY_ENV):
+        parser.error(f"${AUTHKEY_ENV} must hold the shared secret clients present")
+
+    worker = EmbeddingWorker(args.socket, args.model, max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+    print(f"Serving {args.model} embeddings on {args.socket}")
+    worker.serve_forever()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
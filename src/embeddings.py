@@ -1,28 +1,112 @@
 # embeddings.py - Embedding model implementation
 
-from sentence_transformers import SentenceTransformer
+import logging
+import threading
+import numpy as np
+from tqdm import tqdm
+from src.embedding_cache import QueryEmbeddingCache
+from src.instrumentation import get_instrumentation
+
+logger = logging.getLogger(__name__)
 
 class EmbeddingManager:
-    def __init__(self, model_name='intfloat/multilingual-e5-large-instruct'):
+    def __init__(self, model_name='intfloat/multilingual-e5-large-instruct', batch_size=64, num_workers=None, cache=None,
+                 query_cache_size=1024, worker_address=None, worker_authkey=None):
         """
         Initialize the embedding manager with a specified model.
         
+        Args:
+            model_name (str): Name of the sentence transformer model to use
+            batch_size (int): Number of texts per forward pass when encoding in bulk
+            num_workers (int): Number of CPU worker processes for bulk encoding
+                (None or 1 encodes in the current process)
+            cache: Optional EmbeddingCache consulted before calling the model
+            query_cache_size (int): Capacity of the in-memory LRU cache of query
+                embeddings (0 disables it)
+            worker_address (str): Optional Unix socket of a shared EmbeddingWorker;
+                when set, encoding is delegated to it instead of loading the model
+            worker_authkey (bytes): Shared secret of the worker (defaults to
+                $OML_EMBEDDING_WORKER_AUTHKEY)
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.cache = cache
+        self.query_cache = QueryEmbeddingCache(query_cache_size) if query_cache_size else None
+        self.worker_address = worker_address
+        self.worker_authkey = worker_authkey
+
+        # The model (or worker connection) is loaded on first encode
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The sentence transformer model (or shared worker client), loaded on first use."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        """Load the model locally, or connect to the shared embedding worker."""
+        if self.worker_address:
+            from src.embedding_worker import EmbeddingWorkerClient
+            client = EmbeddingWorkerClient(self.worker_address, self.worker_authkey)
+            if client.model_name != self.model_name:
+                client.close()
+                raise ValueError(
+                    f"Embedding worker at {self.worker_address} serves {client.model_name}, "
+                    f"not {self.model_name}"
+                )
+            return client
+
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name)
+
+    @property
+    def is_model_loaded(self):
+        """Whether the model has been loaded yet."""
+        return self._model is not None
+
+    def set_model(self, model_name):
+        """
+        Switch to a different embedding model.
+        
+        The new model is loaded on next use, and the query cache is cleared
+        because its embeddings belong to the old model.
+        
         Args:
             model_name (str): Name of the sentence transformer model to use
         """
-        self.model = SentenceTransformer(model_name)
+        with self._model_lock:
+            self._model = None
+            self.model_name = model_name
+        if self.query_cache is not None:
+            self.query_cache.clear()
         
     def get_query_embedding(self, text):
         """
         Get embedding for a query text.
         
+        Repeated queries are served from the LRU query cache.
+        
         Args:
             text (str): Query text
             
         Returns:
             numpy.ndarray: Embedding vector
         """
-        return self.model.encode(f"query: {text}")
+        if self.query_cache is None:
+            return self._embed('query', [text])[0]
+
+        embedding = self.query_cache.get(text)
+        get_instrumentation().increment('oml_query_cache_lookups_total', result='miss' if embedding is None else 'hit')
+        if embedding is None:
+            embedding = self._embed('query', [text])[0]
+            self.query_cache.put(text, embedding)
+        return embedding
     
     def get_passage_embedding(self, text):
         """
@@ -34,23 +118,129 @@ class EmbeddingManager:
         Returns:
             numpy.ndarray: Embedding vector
         """
-        return self.model.encode(f"passage: {text}")
+        return self._embed('passage', [text])[0]
+
+    def get_query_embeddings(self, texts, batch_size=None, show_progress=False):
+        """
+        Get embeddings for many query texts in batched forward passes.
+        
+        Args:
+            texts (list): Query texts
+            batch_size (int): Texts per forward pass (defaults to self.batch_size)
+            show_progress (bool): Whether to display a progress bar
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (len(texts), dim)
+        """
+        return self._embed('query', texts, batch_size, show_progress)
+
+    def get_passage_embeddings(self, texts, batch_size=None, show_progress=False):
+        """
+        Get embeddings for many passage texts in batched forward passes.
+        
+        Args:
+            texts (list): Passage texts
+            batch_size (int): Texts per forward pass (defaults to self.batch_size)
+            show_progress (bool): Whether to display a progress bar
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (len(texts), dim)
+        """
+        return self._embed('passage', texts, batch_size, show_progress)
+
+    def _embed(self, prefix, texts, batch_size=None, show_progress=False):
+        """
+        Embed texts with an E5 prefix, reusing cached embeddings when possible.
+        
+        Args:
+            prefix (str): "query" or "passage"
+            texts (list): Texts to embed (without prefix)
+            batch_size (int): Texts per forward pass (defaults to self.batch_size)
+            show_progress (bool): Whether to display a progress bar
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (len(texts), dim)
+        """
+        if self.cache is None or not texts:
+            return self.encode_batch([f"{prefix}: {text}" for text in texts], batch_size, show_progress)
+
+        cached = self.cache.get_many(self.model_name, prefix, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if not missing:
+            return np.vstack([cached[i] for i in range(len(texts))])
+
+        missing_texts = [texts[i] for i in missing]
+        new_embeddings = self.encode_batch([f"{prefix}: {text}" for text in missing_texts], batch_size, show_progress)
+        self.cache.put_many(self.model_name, prefix, missing_texts, new_embeddings)
+
+        embeddings = np.empty((len(texts), new_embeddings.shape[1]), dtype=new_embeddings.dtype)
+        embeddings[missing] = new_embeddings
+        for i, embedding in cached.items():
+            embeddings[i] = embedding
+        return embeddings
+
+    def encode_batch(self, texts, batch_size=None, show_progress=False):
+        """
+        Encode already-prefixed texts in length-sorted batches.
+        
+        Texts are sorted by length so each batch pads to a similar size, then
+        the embeddings are returned in the original order. When num_workers is
+        greater than one (and no shared worker is used) the batches are spread
+        over a pool of CPU processes.
+        
+        Args:
+            texts (list): Texts including their "query: "/"passage: " prefix
+            batch_size (int): Texts per forward pass (defaults to self.batch_size)
+            show_progress (bool): Whether to display a progress bar
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (len(texts), dim)
+        """
+        batch_size = batch_size or self.batch_size
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        sorted_texts = [texts[i] for i in order]
+
+        if self.num_workers and self.num_workers > 1 and not self.worker_address:
+            pool = self.model.start_multi_process_pool(target_devices=['cpu'] * self.num_workers)
+            try:
+                sorted_embeddings = self.model.encode_multi_process(sorted_texts, pool, batch_size=batch_size)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        else:
+            batches = range(0, len(sorted_texts), batch_size)
+            sorted_embeddings = np.vstack([
+                self.model.encode(sorted_texts[start:start + batch_size], batch_size=batch_size)
+                for start in tqdm(batches, desc='Encoding', unit='batch', disable=not show_progress)
+            ])
+
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings
     
-    def build_database(self, examples, tokenizer=None, max_tokens=4096):
+    def build_database(self, examples, tokenizer=None, max_tokens=4096, batch_size=None, show_progress=True):
         """
         Build a vector database from examples.
         
+        Inputs and outputs are embedded in bulk with encode_batch rather than
+        one forward pass per string.
+        
         Args:
             examples (list): List of examples as dicts with 'input' and 'output' keys
             tokenizer: Optional tokenizer for truncation
             max_tokens: Max tokens for truncation
+            batch_size (int): Texts per forward pass (defaults to self.batch_size)
+            show_progress (bool): Whether to display progress bars
             
         Returns:
             list: Vector database with input, output, and embeddings
         """
-        vector_db = []
+        input_texts = []
+        output_texts = []
         
-        for i, example in enumerate(examples):
+        for example in examples:
             input_text = example['input']
             output_text = example['output']
             
@@ -59,12 +249,15 @@ class EmbeddingManager:
                 input_text = self._truncate_text(tokenizer, input_text, max_tokens)
                 output_text = self._truncate_text(tokenizer, output_text, max_tokens)
             
-            # Create embeddings
-            input_embedding = self.get_query_embedding(input_text)
-            output_embedding = self.get_passage_embedding(output_text)
+            input_texts.append(input_text)
+            output_texts.append(output_text)
             
-            vector_db.append((input_text, output_text, input_embedding, output_embedding))
-            print(f'Added example {i+1}/{len(examples)} to the database')
+        # Create embeddings
+        input_embeddings = self.get_query_embeddings(input_texts, batch_size, show_progress)
+        output_embeddings = self.get_passage_embeddings(output_texts, batch_size, show_progress)
+        
+        vector_db = list(zip(input_texts, output_texts, input_embeddings, output_embeddings))
+        logger.info('Added %d examples to the database', len(vector_db))
             
         return vector_db
     
@@ -1,9 +1,13 @@
 # examples_processor.py - Processing and storing examples
 
 import json
+import logging
 import os
 from src.embeddings import EmbeddingManager
-import tiktoken
+from src.embedding_index import EmbeddingIndex
+from src.tokenizer_utils import get_tokenizer
+
+logger = logging.getLogger(__name__)
 
 class ExamplesProcessor:
     def __init__(self, embedding_manager=None):
@@ -14,7 +18,7 @@ class ExamplesProcessor:
             embedding_manager: Optional embedding manager instance
         """
         self.embedding_manager = embedding_manager or EmbeddingManager()
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = get_tokenizer()
         
     def load_examples(self, file_path):
         """
@@ -30,7 +34,7 @@ class ExamplesProcessor:
         with open(file_path, 'r') as file:
             for line in file:
                 examples.append(json.loads(line))
-        print(f'Loaded {len(examples)} entries from {file_path}')
+        logger.info('Loaded %d entries from %s', len(examples), file_path)
         return examples
     
     def process_examples(self, examples, max_tokens=4096):
@@ -108,29 +112,22 @@ class ExamplesProcessor:
                     'output': chunk_text
                 })
                 
-        print(f'Split {len(examples)} examples into {len(expanded_examples)} chunks')
+        logger.info('Split %d examples into %d chunks', len(examples), len(expanded_examples))
         return expanded_examples
     
-    def save_processed_examples(self, vector_db, file_path):
+    def save_processed_examples(self, vector_db, index_path, ids=None):
         """
-        Save processed examples to a file.
+        Save processed examples as a binary embedding index.
+        
+        The token ids of every example output are stored with the index, so
+        retrieval and prompt assembly never tokenize the examples again.
         
         Args:
             vector_db (list): Vector database
-            file_path (str): Output file path
+            index_path (str): Output index directory
+            ids (list): Optional example ids, one per vector_db entry
         """
-        # Convert vector_db to serializable format
-        serializable_db = []
-        
-        for input_text, output_text, input_embedding, output_embedding in vector_db:
-            serializable_db.append({
-                'input': input_text,
-                'output': output_text,
-                'input_embedding': input_embedding.tolist(),
-                'output_embedding': output_embedding.tolist()
-            })
-            
-        with open(file_path, 'w') as file:
-            json.dump(serializable_db, file)
+        index = EmbeddingIndex.from_vector_db(vector_db, ids, self.embedding_manager.model_name, self.tokenizer)
+        index.save(index_path)
             
-        print(f'Saved processed examples to {file_path}')
+        logger.info('Saved processed examples to %s', index_path)
@@ -0,0 +1,380 @@
+# instrumentation.py - Stage timing spans and metrics for the generation pipeline
+
+import bisect
+import contextvars
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages timed with spans ('request' wraps one end-to-end generation)
+STAGES = (
+    'request',
+    'query_embedding',
+    'index_scan',
+    'prompt_build',
+    'token_count',
+    'llm_first_token',
+    'llm_total',
+    'parse_validate',
+    'feedback_iteration',
+)
+
+STAGE_DURATION_METRIC = 'oml_stage_duration_seconds'
+STAGE_ERRORS_METRIC = 'oml_stage_errors_total'
+
+# Histogram upper bounds in seconds (Prometheus client defaults plus the sub-millisecond range)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar('oml_current_span', default=None)
+_span_ids = itertools.count(1)
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record one observation."""
+        self.count += 1
+        self.sum += value
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+
+    def cumulative_counts(self):
+        """Observations less than or equal to each bucket bound."""
+        return list(itertools.accumulate(self.counts))
+
+class MetricsRegistry:
+    """
+    Thread-safe store of labelled counters and histograms.
+
+    Metrics are identified by name and a set of label values. They can be
+    exported as JSON lines (one series per line) or in the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize an empty registry.
+
+        Args:
+            buckets (tuple): Histogram bucket upper bounds
+        """
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): Metric name
+            value (float): Amount to add
+            **labels: Label values identifying the series
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Record a histogram observation.
+
+        Args:
+            name (str): Metric name
+            value (float): Observed value
+            **labels: Label values identifying the series
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Current value of a counter (0 if it was never incremented)."""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        """Histogram of a series, or None if nothing was observed."""
+        with self._lock:
+            return self._histograms.get((name, _label_key(labels)))
+
+    def reset(self):
+        """Drop every metric."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_records(self):
+        """
+        Snapshot every series as a dict.
+
+        Returns:
+            list: Counter and histogram records, sorted by name and labels
+        """
+        with self._lock:
+            records = [
+                {'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._counters.items()
+            ]
+            for (name, labels), histogram in self._histograms.items():
+                records.append({
+                    'type': 'histogram',
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': {_format_bound(bound): count for bound, count
+                                in zip(histogram.buckets, histogram.cumulative_counts())},
+                })
+        return sorted(records, key=lambda record: (record['name'], sorted(record['labels'].items())))
+
+    def to_json_lines(self):
+        """
+        Export the metrics as JSON lines.
+
+        Returns:
+            str: One JSON object per series
+        """
+        return ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in self.to_records())
+
+    def to_prometheus(self):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: Metric families with TYPE headers
+        """
+        lines = []
+        typed = set()
+        for record in self.to_records():
+            name = record['name']
+            if name not in typed:
+                lines.append(f"# TYPE {name} {record['type']}")
+                typed.add(name)
+
+            labels = record['labels']
+            if record['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(record['value'])}")
+                continue
+
+            for bound, count in record['buckets'].items():
+                lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {record['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(record['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {record['count']}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+class Span:
+    """A timed pipeline stage; nested spans share the request id of the outermost one."""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.request_id = parent.request_id if parent is not None else self.span_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Attach attributes to the span."""
+        self.attributes.update(attributes)
+
+    def to_record(self):
+        """The span as a JSON-serializable dict."""
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'request_id': self.request_id,
+            'start': self.start,
+            'duration': self.duration,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+class Instrumentation:
+    """
+    Records spans into a metrics registry and forwards them to sinks.
+
+    Every finished span is observed in the oml_stage_duration_seconds
+    histogram (labelled by stage) and passed to each sink as a dict. Sinks are
+    plain callables, e.g. a JsonLinesSink or a SpanRecorder.
+    """
+
+    def __init__(self, registry=None, sinks=None):
+        """
+        Initialize the instrumentation.
+
+        Args:
+            registry (MetricsRegistry): Metrics store (a new one by default)
+            sinks (list): Callables that receive each finished span record
+        """
+        self.registry = registry or MetricsRegistry()
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink):
+        """Forward finished spans to another callable."""
+        self.sinks.append(sink)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time a block as a pipeline stage.
+
+        Args:
+            name (str): Stage name (see STAGES)
+            **attributes: Extra span attributes
+
+        Yields:
+            Span: The running span
+        """
+        span = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span, time.perf_counter() - start)
+
+    def record(self, name, seconds, **attributes):
+        """
+        Record a stage whose duration was measured elsewhere (e.g. time to first token).
+
+        Args:
+            name (str): Stage name
+            seconds (float): Duration
+            **attributes: Extra span attributes
+        """
+        span = Span(name, _current_span.get(), **attributes)
+        span.start = time.time() - seconds
+        self._finish(span, seconds)
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter in the registry."""
+        self.registry.increment(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        """Record a histogram observation in the registry."""
+        self.registry.observe(name, value, **labels)
+
+    def _finish(self, span, seconds):
+        """Observe a finished span and hand it to the sinks."""
+        span.duration = seconds
+        self.registry.observe(STAGE_DURATION_METRIC, seconds, stage=span.name)
+        if span.error is not None:
+            self.registry.increment(STAGE_ERRORS_METRIC, stage=span.name)
+
+        if self.sinks:
+            record = span.to_record()
+            for sink in self.sinks:
+                try:
+                    sink(record)
+                except Exception as e:
+                    logging.getLogger(__name__).warning("Span sink failed: %s", e)
+
+class SpanRecorder:
+    """Sink that keeps the most recent span records in memory."""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+            if len(self.records) > self.capacity:
+                del self.records[:len(self.records) - self.capacity]
+
+    def by_request(self, request_id):
+        """Spans of one request, in the order they finished."""
+        with self._lock:
+            return [record for record in self.records if record['request_id'] == request_id]
+
+class JsonLinesSink:
+    """Sink that appends span records to a JSON lines file."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+        with self._lock:
+            with open(self.file_path, 'a') as file:
+                file.write(line)
+
+_instrumentation = Instrumentation()
+
+def get_instrumentation():
+    """The process-wide Instrumentation used by the pipeline components."""
+    return _instrumentation
+
+def set_instrumentation(instrumentation):
+    """
+    Replace the process-wide Instrumentation.
+
+    Args:
+        instrumentation (Instrumentation): New instance
+
+    Returns:
+        Instrumentation: The previous instance
+    """
+    global _instrumentation
+    previous = _instrumentation
+    _instrumentation = instrumentation
+    return previous
+
+def span(name, **attributes):
+    """Time a block with the process-wide Instrumentation."""
+    return _instrumentation.span(name, **attributes)
+
+def configure_logging(level='INFO'):
+    """
+    Send OML Copilot log messages to stderr.
+
+    Args:
+        level (str): Minimum level ('DEBUG', 'INFO', 'WARNING', ...)
+    """
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO), format='%(message)s')
+
+def _label_key(labels):
+    """Hashable, ordered form of a label dict."""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_bound(bound):
+    """Bucket bound as Prometheus prints it."""
+    return repr(float(bound))
+
+def _format_value(value):
+    """Sample value as Prometheus prints it."""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labels, **extra):
+    """Prometheus label set, e.g. {stage="index_scan",le="0.1"}."""
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
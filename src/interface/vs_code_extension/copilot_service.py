@@ -2,40 +2,56 @@
 
 import os
 import json
-from src.rag.retriever import OMLRetriever
-from src.rag.embeddings import EmbeddingManager
-from src.rag.examples_processor import ExamplesProcessor
+from src.retriever import OMLRetriever
+from src.embeddings import EmbeddingManager
+from src.embedding_index import EmbeddingIndex
+from src.examples_processor import ExamplesProcessor
 from src.validation.validator import OMLValidator
+from src.validation.result_cache import VALIDATION_CACHE_ENV, ValidationCache
 from src.validation.error_handler import ErrorHandler
 from src.validation.feedback_loop import FeedbackLoop
 from src.dependency.vocabulary_manager import VocabularyManager
+from src.instrumentation import span
 
 class OMLCopilotService:
     """Service that coordinates OML Copilot components for VS Code integration"""
     
-    def __init__(self, workspace_path=None, examples_path=None, grammar_path=None, llm_client=None):
+    def __init__(self, workspace_path=None, examples_path=None, grammar_path=None, llm_client=None,
+                 embedding_worker_address=None):
         """
         Initialize the OML Copilot service.
         
         Args:
             workspace_path (str): Path to workspace
-            examples_path (str): Path to examples database
+            examples_path (str): Path to examples database (a JSONL file, or an
+                embedding index directory built by scripts/build_database.py)
             grammar_path (str): Path to grammar file
             llm_client: LLM client for code generation
+            embedding_worker_address (str): Unix socket of a shared embedding worker
+                (defaults to the OML_EMBEDDING_WORKER environment variable, with
+                its authkey in OML_EMBEDDING_WORKER_AUTHKEY); when unset the
+                service loads its own embedding model
         """
         self.workspace_path = workspace_path
         
-        # Set up embedding manager
-        self.embedding_manager = EmbeddingManager()
+        # Set up embedding manager, sharing a host-wide worker when available
+        worker_address = embedding_worker_address or os.environ.get('OML_EMBEDDING_WORKER')
+        self.embedding_manager = EmbeddingManager(worker_address=worker_address)
         
-        # Set up examples database
-        self.examples_db = self._load_examples(examples_path)
+        # Create retriever, mapping a prebuilt index when one is available
+        if EmbeddingIndex.exists(examples_path):
+            self.retriever = OMLRetriever.from_index(examples_path, self.embedding_manager)
+            self.examples_db = self.retriever.vector_db
+        else:
+            self.examples_db = self._load_examples(examples_path)
+            self.retriever = OMLRetriever(self.examples_db, self.embedding_manager)
         
-        # Create retriever
-        self.retriever = OMLRetriever(self.examples_db, self.embedding_manager)
+        # Set up validator; unchanged code is answered from the result cache, trees included
+        self.validator = OMLValidator(grammar_path, result_cache=ValidationCache(
+            capacity=256, cache_path=os.environ.get(VALIDATION_CACHE_ENV) or None, keep_trees=True))
         
-        # Set up validator
-        self.validator = OMLValidator(grammar_path)
+        # Editor validation consults the result cache, then re-parses only the statements changed since the last call
+        self.statement_validator = self.validator.statement_validator()
         
         # Set up error handler
         self.error_handler = ErrorHandler(self.retriever)
@@ -68,24 +84,27 @@ class OMLCopilotService:
         Returns:
             dict: Result with code and status
         """
-        # Check dependencies
-        all_available, missing_vocabs = self.vocabulary_manager.check_dependencies(query)
-        
-        if not all_available:
-            return {
-                'success': False,
-                'message': f"Missing vocabularies: {', '.join(missing_vocabs)}.\nPlease import them before proceeding.",
-                'code': None
-            }
+        with span('request', operation='generate_oml_code') as request_span:
+            # Check dependencies
+            all_available, missing_vocabs = self.vocabulary_manager.check_dependencies(query)
             
-        # Retrieve relevant examples
-        retrieved_knowledge = self.retriever.retrieve(query)
-        
-        # Create instruction prompt
-        instruction_prompt = self._create_instruction_prompt(query, retrieved_knowledge)
-        
-        # Generate and refine code
-        code, iterations, success = self.feedback_loop.generate_and_refine(query, instruction_prompt)
+            if not all_available:
+                request_span.set(success=False)
+                return {
+                    'success': False,
+                    'message': f"Missing vocabularies: {', '.join(missing_vocabs)}.\nPlease import them before proceeding.",
+                    'code': None
+                }
+                
+            # Retrieve relevant examples
+            retrieved_knowledge = self.retriever.retrieve(query)
+            
+            # Create instruction prompt
+            instruction_prompt = self._create_instruction_prompt(query, retrieved_knowledge)
+            
+            # Generate and refine code
+            code, iterations, success = self.feedback_loop.generate_and_refine(query, instruction_prompt)
+            request_span.set(success=success, iterations=iterations)
         
         return {
             'success': success,
@@ -95,29 +114,35 @@ class OMLCopilotService:
     
     def _create_instruction_prompt(self, query, retrieved_knowledge):
         """Create instruction prompt with retrieved knowledge and vocabulary restrictions"""
-        base_prompt = 'You are an OML code generation assistant. Use only the following context to generate syntactically correct OML code:\n\n'
-        
-        # Add vocabulary restrictions
-        vocab_restrictions = self.vocabulary_manager.format_vocabulary_restrictions()
-        base_prompt += vocab_restrictions + "\n\n"
-        
-        # Add retrieved knowledge
-        for example, score in retrieved_knowledge:
-            base_prompt += f"EXAMPLE:\n{example}\n\n"
+        with span('prompt_build', examples=len(retrieved_knowledge)):
+            base_prompt = 'You are an OML code generation assistant. Use only the following context to generate syntactically correct OML code:\n\n'
+            
+            # Add vocabulary restrictions
+            vocab_restrictions = self.vocabulary_manager.format_vocabulary_restrictions()
+            base_prompt += vocab_restrictions + "\n\n"
             
-        return base_prompt
+            # Add retrieved knowledge
+            for example, score in retrieved_knowledge:
+                base_prompt += f"EXAMPLE:\n{example}\n\n"
+                
+            return base_prompt
     
     def validate_oml_code(self, code):
         """
         Validate OML code.
         
+        The editor validates the whole document after every edit. Code the
+        result cache has seen is a lookup; otherwise only the statements that
+        changed since the last call are parsed again.
+        
         Args:
             code (str): OML code to validate
             
         Returns:
             dict: Validation result
         """
-        is_valid, result = self.validator.validate(code)
+        validator = self.statement_validator or self.validator
+        is_valid, result = validator.validate(code)
         
         if is_valid:
             return {
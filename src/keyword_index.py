@@ -0,0 +1,152 @@
+# keyword_index.py - Inverted index from OML keywords to examples
+
+import re
+
+# Identifiers and qualified names (e.g. concept, hasId, rdfs:comment)
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_\-\.~%\$]+(?::[A-Za-z0-9_\-\.~%\$]+)?')
+
+# Keywords that start multi-word OML constructs (relation entity, scalar property, ...)
+PHRASE_PREFIXES = {'relation', 'scalar', 'annotation', 'inverse', 'ref', 'vocabulary', 'description'}
+
+class KeywordIndex:
+    """
+    Inverted index mapping OML keywords and identifiers to examples.
+
+    Every example is tokenized once into identifiers plus two-word phrases
+    that begin with an OML keyword (e.g. "relation entity", "scalar
+    property"). Each posting list is ordered by example token length, so the
+    shortest example using a keyword is always at the front.
+    """
+
+    def __init__(self, inputs, outputs, token_lengths):
+        """
+        Build the index.
+
+        Args:
+            inputs (list): Example input texts
+            outputs (list): Example output texts
+            token_lengths (list): Token count of each example output
+        """
+        self.token_lengths = list(token_lengths)
+        postings = {}
+
+        for position, (input_text, output_text) in enumerate(zip(inputs, outputs)):
+            for term in self.terms(input_text) | self.terms(output_text):
+                postings.setdefault(term, []).append(position)
+
+        self.postings = {
+            term: sorted(positions, key=lambda position: self.token_lengths[position])
+            for term, positions in postings.items()
+        }
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into OML identifier tokens.
+
+        Args:
+            text (str): Text to tokenize
+
+        Returns:
+            list: Tokens in order of appearance
+        """
+        return TOKEN_PATTERN.findall(text)
+
+    @classmethod
+    def terms(cls, text):
+        """
+        Extract the indexed terms of a text.
+
+        Args:
+            text (str): Text to index
+
+        Returns:
+            set: Tokens plus keyword-initial two-word phrases
+        """
+        tokens = cls.tokenize(text)
+        terms = set(tokens)
+        for first, second in zip(tokens, tokens[1:]):
+            if first in PHRASE_PREFIXES:
+                terms.add(f"{first} {second}")
+        return terms
+
+    @classmethod
+    def normalize_keyword(cls, keyword):
+        """
+        Convert a lookup keyword to an index term.
+
+        Args:
+            keyword (str): Keyword such as "concept", "@rdfs:comment" or "relation entity"
+
+        Returns:
+            str: Index term, or None if the keyword cannot be looked up in the index
+        """
+        tokens = cls.tokenize(keyword or '')
+        if len(tokens) == 1:
+            return tokens[0]
+        if len(tokens) == 2 and tokens[0] in PHRASE_PREFIXES:
+            return f"{tokens[0]} {tokens[1]}"
+        return None
+
+    def add(self, position, input_text, output_text, token_length):
+        """
+        Index a new example without rebuilding the posting lists.
+
+        Args:
+            position (int): Position of the example (after all indexed positions)
+            input_text (str): Example input text
+            output_text (str): Example output text
+            token_length (int): Token count of the example output
+        """
+        while len(self.token_lengths) <= position:
+            self.token_lengths.append(0)
+        self.token_lengths[position] = token_length
+
+        for term in self.terms(input_text) | self.terms(output_text):
+            positions = self.postings.setdefault(term, [])
+            # Walk back from the end; equal lengths keep position order
+            index = len(positions)
+            while index > 0 and self.token_lengths[positions[index - 1]] > token_length:
+                index -= 1
+            positions.insert(index, position)
+
+    def remove(self, position, input_text, output_text):
+        """
+        Drop an example from the posting lists.
+
+        Args:
+            position (int): Position of the example
+            input_text (str): Example input text it was indexed with
+            output_text (str): Example output text it was indexed with
+        """
+        for term in self.terms(input_text) | self.terms(output_text):
+            positions = self.postings.get(term)
+            if positions and position in positions:
+                positions.remove(position)
+                if not positions:
+                    del self.postings[term]
+
+    def lookup(self, keyword):
+        """
+        Find every example that uses a keyword.
+
+        Args:
+            keyword (str): Keyword to look up
+
+        Returns:
+            list: Example positions, shortest example first
+        """
+        return self.postings.get(self.normalize_keyword(keyword), [])
+
+    def shortest(self, keyword):
+        """
+        Find the shortest example that uses a keyword.
+
+        Args:
+            keyword (str): Keyword to look up
+
+        Returns:
+            int: Example position, or None if no example uses the keyword
+        """
+        positions = self.lookup(keyword)
+        return positions[0] if positions else None
@@ -1,37 +1,61 @@
 # prompt_engineering.py - Prompt templates and construction
 
 import re
-from src.tokenizer_utils import truncate_text
+from src.tokenizer_utils import count_tokens, get_tokenizer, truncate_text
+from src.instrumentation import span
 
-def create_instruction_prompt(retrieved_knowledge, previous_oml_code=None, previous_error_message=None, max_tokens=4096):
+def create_instruction_prompt(retrieved_knowledge, previous_oml_code=None, previous_error_message=None, max_tokens=4096,
+                              tokenizer=None):
     """
     Create an instruction prompt for the LLM using retrieved examples.
     
+    The prompt length is tracked as the sum of the token counts of its parts,
+    which come from the token cache (retrieved examples are seeded there by
+    the retriever), so the assembled prompt is only re-encoded when it may
+    exceed max_tokens.
+    
     Args:
         retrieved_knowledge (list): List of (example, similarity) tuples
         previous_oml_code (str): Previous generated code (for debugging)
         previous_error_message (str): Previous error message (for debugging)
         max_tokens (int): Maximum tokens for prompt
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
         
     Returns:
         str: Formatted instruction prompt
     """
-    # Base instruction prompt
-    instruction_prompt = 'You are an OML code generation assistant.\nUse only the following context to generate syntactically correct OML code:\n'
-
-    # Add retrieved knowledge chunks, ensuring token limit
-    for chunk, similarity in retrieved_knowledge:
-        # Truncate each chunk
-        truncated_chunk = truncate_text(chunk, 300)
-        instruction_prompt += f' - {truncated_chunk}\n'
-
-    # Add previous debugging info if available
-    if previous_oml_code and previous_error_message:
-        debugging_prompt = format_debugging_prompt(previous_oml_code, previous_error_message)
-        instruction_prompt += "\n" + truncate_text(debugging_prompt, 500)
-
-    # Truncate final instruction prompt
-    return truncate_text(instruction_prompt, max_tokens)
+    with span('prompt_build', examples=len(retrieved_knowledge)):
+        if tokenizer is None:
+            tokenizer = get_tokenizer()
+
+        # Base instruction prompt
+        instruction_prompt = 'You are an OML code generation assistant.\nUse only the following context to generate syntactically correct OML code:\n'
+        parts = [instruction_prompt]
+        prompt_tokens = count_tokens(instruction_prompt, tokenizer)
+        separator_tokens = count_tokens(' - ', tokenizer) + count_tokens('\n', tokenizer)
+
+        # Add retrieved knowledge chunks, ensuring token limit
+        for chunk, similarity in retrieved_knowledge:
+            # Truncate each chunk
+            truncated_chunk = truncate_text(chunk, 300, tokenizer)
+            parts.append(f' - {truncated_chunk}\n')
+            prompt_tokens += min(count_tokens(chunk, tokenizer), 300) + separator_tokens
+
+        # Add previous debugging info if available
+        if previous_oml_code and previous_error_message:
+            debugging_prompt = format_debugging_prompt(previous_oml_code, previous_error_message)
+            parts.append("\n" + truncate_text(debugging_prompt, 500, tokenizer))
+            prompt_tokens += min(count_tokens(debugging_prompt, tokenizer), 500) + count_tokens("\n", tokenizer)
+
+        instruction_prompt = ''.join(parts)
+
+        # Tokens can merge or split where parts meet, so allow one token per
+        # boundary before trusting the estimate
+        if prompt_tokens + len(parts) <= max_tokens:
+            return instruction_prompt
+
+        # Truncate final instruction prompt
+        return truncate_text(instruction_prompt, max_tokens, tokenizer)
 
 def format_debugging_prompt(code, error_message):
     """
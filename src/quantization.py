@@ -0,0 +1,186 @@
+# quantization.py - Reduced-precision storage for embedding matrices
+
+import numpy as np
+
+QUANTIZATION_MODES = ('float16', 'int8')
+
+def quantized_index_file(mode):
+    """File name of a quantized input embedding matrix inside an index directory."""
+    return f"input_embeddings.{mode}.npz"
+
+class QuantizedMatrix:
+    """
+    Embedding matrix stored as float16 or scalar-quantized int8.
+
+    int8 rows are quantized symmetrically with one float32 scale per row
+    (scale = max |x| / 127). Scores are computed in float32 over row chunks,
+    so the full matrix is never expanded back to float32 in memory.
+    """
+
+    def __init__(self, codes, scales=None):
+        """
+        Initialize a quantized matrix.
+
+        Args:
+            codes (numpy.ndarray): float16 or int8 matrix of shape (n, dim)
+            scales (numpy.ndarray): Per-row float32 scales (int8 only)
+        """
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def mode(self):
+        """Quantization mode ('float16' or 'int8')."""
+        return 'int8' if self.codes.dtype == np.int8 else 'float16'
+
+    @property
+    def nbytes(self):
+        """Memory used by the codes and scales."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @classmethod
+    def quantize(cls, matrix, mode, chunk_rows=16384):
+        """
+        Quantize a float matrix chunk by chunk.
+
+        Args:
+            matrix (numpy.ndarray): float32 matrix (may be memory-mapped)
+            mode (str): 'float16' or 'int8'
+            chunk_rows (int): Rows converted at a time
+
+        Returns:
+            QuantizedMatrix: Quantized copy of the matrix
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+
+        if mode == 'float16':
+            codes = np.empty(matrix.shape, dtype=np.float16)
+            for start in range(0, matrix.shape[0], chunk_rows):
+                codes[start:start + chunk_rows] = matrix[start:start + chunk_rows]
+            return cls(codes)
+
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], chunk_rows):
+            chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+            chunk_scales = np.abs(chunk).max(axis=1) / 127.0
+            chunk_scales[chunk_scales == 0] = 1.0
+            codes[start:start + chunk_rows] = np.clip(np.rint(chunk / chunk_scales[:, None]), -127, 127)
+            scales[start:start + chunk_rows] = chunk_scales
+        return cls(codes, scales)
+
+    def score(self, query, chunk_rows=16384):
+        """
+        Approximate dot products between every row and a query.
+
+        Args:
+            query (numpy.ndarray): float32 query vector
+            chunk_rows (int): Rows expanded to float32 at a time
+
+        Returns:
+            numpy.ndarray: Approximate score per row
+        """
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), chunk_rows):
+            scores[start:start + chunk_rows] = self.codes[start:start + chunk_rows].astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def rows(self, indices):
+        """
+        Dequantize selected rows.
+
+        Args:
+            indices (numpy.ndarray): Row indices
+
+        Returns:
+            numpy.ndarray: float32 rows
+        """
+        rows = self.codes[indices].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[indices, None]
+        return rows
+
+    def save(self, file_path):
+        """
+        Save the quantized matrix to an .npz file.
+
+        Args:
+            file_path (str): Output file path
+        """
+        if self.scales is None:
+            np.savez(file_path, codes=self.codes)
+        else:
+            np.savez(file_path, codes=self.codes, scales=self.scales)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load a quantized matrix saved with save().
+
+        Args:
+            file_path (str): File written by save()
+
+        Returns:
+            QuantizedMatrix: Loaded matrix
+        """
+        with np.load(file_path) as data:
+            return cls(data['codes'], data['scales'] if 'scales' in data else None)
+
+def benchmark_quantization(matrix, queries, k=10, rescore_factor=4, modes=QUANTIZATION_MODES, exclude=None):
+    """
+    Measure memory saved and recall lost by quantized search.
+
+    Args:
+        matrix (numpy.ndarray): L2-normalized float32 embedding matrix
+        queries (numpy.ndarray): L2-normalized query matrix
+        k (int): Number of neighbours per query
+        rescore_factor (int): Candidates per result rescored exactly
+        modes (tuple): Quantization modes to evaluate
+        exclude (numpy.ndarray): Optional row per query that is left out of its
+            results, for leave-one-out queries taken from the matrix itself
+
+    Returns:
+        list: One dict per mode with bytes used, bytes saved, and recall@k
+            before and after exact rescoring
+    """
+    full_bytes = matrix.shape[0] * matrix.shape[1] * np.dtype(np.float32).itemsize
+    if exclude is None:
+        exclude = [None] * len(queries)
+    exact = [set(_top_k(matrix @ query, k, row).tolist()) for query, row in zip(queries, exclude)]
+
+    results = []
+    for mode in modes:
+        quantized = QuantizedMatrix.quantize(matrix, mode)
+        approximate_hits = 0
+        rescored_hits = 0
+
+        for query, truth, row in zip(queries, exact, exclude):
+            scores = quantized.score(query)
+            approximate_hits += len(truth.intersection(_top_k(scores, k, row).tolist()))
+
+            pool = min(k * rescore_factor, len(scores))
+            candidates = np.argpartition(-scores, pool - 1)[:pool]
+            candidates = candidates[np.isfinite(scores[candidates])]
+            exact_scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+            rescored_hits += len(truth.intersection(candidates[np.argsort(-exact_scores)[:k]].tolist()))
+
+        results.append({
+            'mode': mode,
+            'bytes': quantized.nbytes,
+            'bytes_saved': full_bytes - quantized.nbytes,
+            'recall': approximate_hits / (k * len(queries)),
+            'rescored_recall': rescored_hits / (k * len(queries)),
+        })
+    return results
+
+def _top_k(scores, k, excluded_row=None):
+    """Indices of the k highest scores (unordered), leaving out one row if given."""
+    if excluded_row is not None:
+        scores[excluded_row] = -np.inf
+    return np.argpartition(-scores, k - 1)[:k]
@@ -1,11 +1,37 @@
 # retriever.py - Core document retrieval functionality
 
-import tiktoken
+import logging
+import os
+import threading
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from src.embedding_index import EmbeddingIndex
+from src.ann_index import IVFIndex, ANN_INDEX_FILE
+from src.keyword_index import KeywordIndex
+from src.bm25_index import BM25Index
+from src.quantization import QUANTIZATION_MODES, QuantizedMatrix, quantized_index_file
+from src.instrumentation import span
+from src.tokenizer_utils import get_tokenizer, get_token_cache, tokenizer_name, truncate_text
+
+logger = logging.getLogger(__name__)
+
+FUSION_MODES = ('dense', 'rrf', 'weighted')
+
+# Compaction never runs for fewer stale rows than this, however small the corpus
+MIN_COMPACTION_ROWS = 64
+
+def _is_memory_mapped(array):
+    """Whether an array is, or is a view into, a memory-mapped file."""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
 
 class OMLRetriever:
-    def __init__(self, vector_db, embedding_model, tokenizer=None, max_tokens=4096):
+    def __init__(self, vector_db, embedding_model, tokenizer=None, max_tokens=4096, embedding_matrix=None,
+                 ann_index=None, ann_threshold=50000, fusion='dense', dense_weight=0.5, rrf_k=60,
+                 quantization=None, quantized_matrix=None, rescore_factor=4, ids=None, index_path=None,
+                 compaction_ratio=0.25, output_token_ids=None):
         """
         Initialize the OML retriever with a vector database and embedding model.
         
@@ -14,70 +40,835 @@ class OMLRetriever:
             embedding_model: Model for embedding queries
             tokenizer: Tokenizer for managing context length
             max_tokens: Maximum tokens for context window
+            embedding_matrix: Optional pre-normalized float32 matrix of input
+                embeddings (e.g. memory-mapped from an EmbeddingIndex)
+            ann_index: Optional prebuilt IVFIndex over the embedding matrix
+            ann_threshold: Corpus size from which an IVFIndex is built and used
+                instead of exact search (None to always search exactly)
+            fusion: Default retrieval mode: 'dense', 'rrf' (reciprocal rank fusion
+                of dense and BM25) or 'weighted' (min-max normalized score blend)
+            dense_weight: Weight of the dense score in 'weighted' fusion
+            rrf_k: Rank offset used by reciprocal rank fusion
+            quantization: Optional 'float16' or 'int8' copy of the embedding
+                matrix used for the exhaustive scan; unless the float32 matrix is
+                memory-mapped (or an IVF index needs it), it is not kept in memory
+            quantized_matrix: Optional prebuilt QuantizedMatrix (overrides quantization)
+            rescore_factor: With quantization, top_n * rescore_factor candidates
+                are rescored exactly against the float32 matrix or stored vectors
+            ids: Optional example ids, one per vector_db entry (defaults to row
+                numbers); upsert() and delete() address examples by id
+            index_path: Optional EmbeddingIndex directory that upserts and
+                deletes are journaled to and that compaction rewrites
+            compaction_ratio: Compact once deleted plus newly added rows
+                exceed this fraction of the compacted corpus
+            output_token_ids: Optional token ids of each example output (e.g.
+                stored in an EmbeddingIndex), so outputs are not tokenized again
         """
-        self.vector_db = vector_db
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode: {fusion}")
+
         self.embedding_model = embedding_model
-        self.tokenizer = tokenizer or tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = tokenizer or get_tokenizer()
         self.max_tokens = max_tokens
+
+        self.ann_threshold = ann_threshold
+        self.quantization = quantized_matrix.mode if quantized_matrix is not None else quantization
+        self.rescore_factor = rescore_factor
+
+        # Lexical index for hybrid retrieval
+        self.fusion = fusion
+        self.dense_weight = dense_weight
+        self.rrf_k = rrf_k
+
+        self.index_path = index_path
+        self.model_name = getattr(embedding_model, 'model_name', None)
+        self.compaction_ratio = compaction_ratio
+        self._lock = threading.RLock()
+
+        self._load_examples(vector_db, ids, embedding_matrix, ann_index, quantized_matrix, output_token_ids)
+
+    def _load_examples(self, vector_db, ids=None, embedding_matrix=None, ann_index=None, quantized_matrix=None,
+                       output_token_ids=None):
+        """
+        Index a compacted set of examples, replacing any previous state.
+        
+        Rows of embedding_matrix (the "base") are covered by the IVF index and
+        the quantized matrix. Examples upserted later go to a separate "delta"
+        buffer that is scanned exactly, and deleted or replaced examples are
+        only tombstoned, until compact() folds both back into a new base.
+        
+        Args:
+            vector_db (list): (input, output, input_embedding, output_embedding) tuples
+            ids (list): Example ids (defaults to row numbers)
+            embedding_matrix: Optional pre-normalized input embedding matrix
+            ann_index: Optional prebuilt IVFIndex over embedding_matrix
+            quantized_matrix: Optional prebuilt QuantizedMatrix of embedding_matrix
+            output_token_ids (list): Optional token ids of each output, produced
+                by this retriever's tokenizer
+        """
+        if ids is None:
+            ids = [str(i) for i in range(len(vector_db))]
+        if len(ids) != len(vector_db):
+            raise ValueError(f"Got {len(ids)} ids for {len(vector_db)} examples")
+
+        self.vector_db = list(vector_db)
+        self.ids = list(ids)
+        self.input_texts = [input_text for input_text, _, _, _ in self.vector_db]
+        self.output_texts = [output_text for _, output_text, _, _ in self.vector_db]
+
+        # Pre-normalized (n, dim) float32 matrix of input embeddings, so that
+        # scoring a query is a single matrix-vector product
+        if embedding_matrix is None:
+            embedding_matrix = self._build_embedding_matrix(
+                [input_embedding for _, _, input_embedding, _ in self.vector_db]
+            )
+        self.embedding_matrix = embedding_matrix
+        self._base_count = len(self.vector_db)
+
+        # Rows added since the last compaction; capacity doubles as needed
+        self._delta_matrix = None
+        self._delta_count = 0
+
+        # Liveness of every position; a repeated id keeps only its last entry
+        self._alive = np.ones(self._base_count, dtype=bool)
+        self._positions = {}
+        for position, example_id in enumerate(self.ids):
+            if example_id in self._positions:
+                self._alive[self._positions[example_id]] = False
+            self._positions[example_id] = position
+        self._deleted_count = self._base_count - len(self._positions)
+
+        # Approximate search for large corpora
+        if (ann_index is None and self.ann_threshold is not None and self._base_count > 0
+                and self._base_count >= self.ann_threshold):
+            ann_index = IVFIndex().build(embedding_matrix)
+        self.ann_index = ann_index
+
+        # Reduced-precision scan; float32 rows are only read for rescoring. A
+        # memory-mapped matrix is kept, since only the rescored rows are paged
+        # in, but an in-memory one would just duplicate the stored vectors
+        if quantized_matrix is None and self.quantization is not None and self._base_count > 0:
+            quantized_matrix = QuantizedMatrix.quantize(embedding_matrix, self.quantization)
+        self.quantized_matrix = quantized_matrix
+        if quantized_matrix is not None and ann_index is None and not _is_memory_mapped(embedding_matrix):
+            self.embedding_matrix = None
+
+        # Inverted keyword index for retrieve_by_keyword
+        if output_token_ids is None:
+            output_token_ids = [np.asarray(self.tokenizer.encode(text), dtype=np.int32) for text in self.output_texts]
+        self.output_token_ids = list(output_token_ids)
+        self.output_token_counts = [len(token_ids) for token_ids in self.output_token_ids]
+        self.keyword_index = KeywordIndex(self.input_texts, self.output_texts, self.output_token_counts)
+        for position in np.flatnonzero(~self._alive):
+            self.keyword_index.remove(int(position), self.input_texts[position], self.output_texts[position])
+
+        # BM25 is rebuilt lazily, on the first hybrid query after a change
+        self._bm25_index = None
+
+    @property
+    def bm25_index(self):
+        """BM25 index over every position (tombstoned ones are masked when scoring)."""
+        if self._bm25_index is None:
+            self._bm25_index = BM25Index(
+                [f"{input_text}\n{output_text}" for input_text, output_text in zip(self.input_texts, self.output_texts)]
+            )
+        return self._bm25_index
+
+    def __len__(self):
+        """Number of live examples."""
+        return len(self._positions)
+
+    def __contains__(self, example_id):
+        return example_id in self._positions
+
+    @classmethod
+    def from_index(cls, index_path, embedding_model, tokenizer=None, max_tokens=4096, ann_threshold=50000,
+                   fusion='dense', quantization=None):
+        """
+        Create a retriever from an on-disk embedding index.
+        
+        The index matrices are memory-mapped, so no examples are re-embedded.
+        A saved IVF clustering in the index directory is loaded if present,
+        and changes journaled since the index was last written are replayed.
+        Later upserts and deletes are journaled to the same directory.
+        
+        Args:
+            index_path (str): Directory written by EmbeddingIndex.save
+            embedding_model: Model for embedding queries
+            tokenizer: Tokenizer for managing context length
+            max_tokens: Maximum tokens for context window
+            ann_threshold: Corpus size from which approximate search is used
+            fusion: Default retrieval mode ('dense', 'rrf' or 'weighted')
+            quantization: Optional 'float16' or 'int8' scan matrix; a saved one in
+                the index directory is loaded, otherwise it is built from the index
+            
+        Returns:
+            OMLRetriever: Retriever over the indexed examples
+        """
+        index = EmbeddingIndex.load(index_path)
+
+        model_name = getattr(embedding_model, 'model_name', None)
+        if index.model_name and model_name and index.model_name != model_name:
+            raise ValueError(
+                f"Index at {index_path} was built with {index.model_name}, "
+                f"but the embedding model is {model_name}"
+            )
+
+        ann_index = None
+        ann_path = os.path.join(index_path, ANN_INDEX_FILE)
+        if ann_threshold is not None and len(index) >= ann_threshold and os.path.exists(ann_path):
+            ann_index = IVFIndex.load(ann_path, index.input_embeddings)
+
+        quantized_matrix = None
+        if quantization is not None:
+            quantized_path = os.path.join(index_path, quantized_index_file(quantization))
+            if os.path.exists(quantized_path):
+                quantized_matrix = QuantizedMatrix.load(quantized_path)
+                if len(quantized_matrix) != len(index):
+                    quantized_matrix = None
+
+        # Token ids stored at build time are reused when the tokenizer matches
+        tokenizer = tokenizer or get_tokenizer()
+        output_token_ids = None
+        name = tokenizer_name(tokenizer)
+        if index.has_token_ids and name is not None and index.tokenizer_name == name:
+            output_token_ids = index.output_token_id_list()
+
+        retriever = cls(index.to_vector_db(), embedding_model, tokenizer, max_tokens,
+                        embedding_matrix=index.input_embeddings, ann_index=ann_index,
+                        ann_threshold=ann_threshold, fusion=fusion,
+                        quantization=quantization, quantized_matrix=quantized_matrix,
+                        ids=index.ids, output_token_ids=output_token_ids)
+        retriever.model_name = retriever.model_name or index.model_name
+
+        with retriever._lock:
+            for change in EmbeddingIndex.load_changes(index_path):
+                retriever._apply_change(change)
+            retriever.index_path = index_path
+            if retriever._needs_compaction():
+                retriever.compact()
+        return retriever
     
-    def retrieve(self, query, top_n=3):
+    def upsert(self, example_id, input_text, output_text, input_embedding=None, output_embedding=None):
+        """
+        Add an example, or replace the example with the same id.
+        
+        The example is appended to the delta buffer without touching the
+        existing matrices or indexes. A replaced example is tombstoned.
+        
+        Args:
+            example_id (str): Example id
+            input_text (str): Example input text
+            output_text (str): Example output (OML) text
+            input_embedding: Optional input embedding (computed with the
+                embedding model's query format if omitted)
+            output_embedding: Optional output embedding (computed with the
+                embedding model's passage format if omitted)
+        """
+        if input_embedding is None:
+            input_embedding = self.embedding_model.get_query_embedding(input_text)
+        if output_embedding is None:
+            output_embedding = self.embedding_model.get_passage_embedding(output_text)
+
+        change = {
+            'op': 'upsert',
+            'id': example_id,
+            'input': input_text,
+            'output': output_text,
+            'input_embedding': np.asarray(input_embedding, dtype=np.float32),
+            'output_embedding': np.asarray(output_embedding, dtype=np.float32),
+        }
+        with self._lock:
+            self._apply_change(change)
+            self._record_change(change)
+
+    def delete(self, example_id):
+        """
+        Remove an example.
+        
+        Args:
+            example_id (str): Example id
+            
+        Returns:
+            bool: Whether an example with this id existed
+        """
+        with self._lock:
+            if example_id not in self._positions:
+                return False
+            change = {'op': 'delete', 'id': example_id}
+            self._apply_change(change)
+            self._record_change(change)
+            return True
+
+    def compact(self):
+        """
+        Fold added rows into the base matrix and drop tombstoned examples.
+        
+        The IVF index, quantized matrix and keyword index are rebuilt over the
+        live examples. With an index_path, the compacted index is written there
+        (clearing the change journal) and its matrices are re-mapped from disk.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive[:len(self.ids)])
+            base_rows = live[live < self._base_count]
+            delta_rows = live[live >= self._base_count] - self._base_count
+
+            ids = [self.ids[position] for position in live]
+            vector_db = [self.vector_db[position] for position in live]
+            if len(live) > 0:
+                embedding_matrix = np.ascontiguousarray(np.concatenate([
+                    self._base_rows(base_rows),
+                    self._delta_matrix[delta_rows] if len(delta_rows) else
+                    np.zeros((0, self._dimension()), dtype=np.float32),
+                ]))
+            else:
+                embedding_matrix = np.zeros((0, 0), dtype=np.float32)
+
+            if self.index_path is None:
+                self._load_examples(vector_db, ids, embedding_matrix,
+                                    output_token_ids=[self.output_token_ids[position] for position in live])
+                return
+
+            output_embeddings = (np.vstack([entry[3] for entry in vector_db]).astype(np.float32)
+                                 if vector_db else np.zeros((0, 0), dtype=np.float32))
+            EmbeddingIndex(ids, [entry[0] for entry in vector_db], [entry[1] for entry in vector_db],
+                           embedding_matrix, output_embeddings, self.model_name,
+                           [self.output_token_ids[position] for position in live],
+                           tokenizer_name(self.tokenizer)).save(self.index_path)
+
+            index = EmbeddingIndex.load(self.index_path)
+            self._load_examples(index.to_vector_db(), index.ids, index.input_embeddings,
+                                output_token_ids=index.output_token_id_list())
+            self._save_derived_indexes()
+
+    def save(self, index_path):
+        """
+        Compact the retriever and write it as an EmbeddingIndex.
+        
+        Later upserts and deletes are journaled to the same directory.
+        
+        Args:
+            index_path (str): Index directory
+        """
+        with self._lock:
+            self.index_path = index_path
+            self.compact()
+
+    def _apply_change(self, change):
+        """Apply a journaled upsert or delete to the in-memory state."""
+        example_id = change['id']
+        if example_id in self._positions:
+            self._tombstone(self._positions.pop(example_id))
+        if change['op'] == 'delete':
+            return
+
+        vector = self._normalize(np.asarray(change['input_embedding'], dtype=np.float32).reshape(-1))
+        dimension = self._dimension()
+        if dimension and len(vector) != dimension:
+            raise ValueError(f"Embedding has dimension {len(vector)}, expected {dimension}")
+
+        self._reserve_delta(1, len(vector))
+        position = len(self.ids)
+        self._delta_matrix[self._delta_count] = vector
+        self._delta_count += 1
+        self._alive[position] = True
+
+        input_text, output_text = change['input'], change['output']
+        self.ids.append(example_id)
+        self._positions[example_id] = position
+        self.vector_db.append((input_text, output_text, change['input_embedding'], change['output_embedding']))
+        self.input_texts.append(input_text)
+        self.output_texts.append(output_text)
+        self.output_token_ids.append(np.asarray(self.tokenizer.encode(output_text), dtype=np.int32))
+        self.output_token_counts.append(len(self.output_token_ids[-1]))
+        self.keyword_index.add(position, input_text, output_text, self.output_token_counts[-1])
+        self._bm25_index = None
+
+    def _record_change(self, change):
+        """Journal a change to the on-disk index and compact when due."""
+        if self.index_path is not None:
+            EmbeddingIndex.append_changes(self.index_path, [change])
+        if self._needs_compaction():
+            self.compact()
+
+    def _tombstone(self, position):
+        """Mark a position deleted; its rows stay in place until compaction."""
+        self._alive[position] = False
+        self._deleted_count += 1
+        self.keyword_index.remove(position, self.input_texts[position], self.output_texts[position])
+
+    def _needs_compaction(self):
+        """Whether stale and unindexed rows outweigh the compaction ratio."""
+        pending = self._deleted_count + self._delta_count
+        return pending >= MIN_COMPACTION_ROWS and pending > self.compaction_ratio * self._base_count
+
+    def _dimension(self):
+        """Embedding dimension (0 while the retriever holds no vectors)."""
+        matrix = self.embedding_matrix if self.embedding_matrix is not None else self.quantized_matrix.codes
+        if self._base_count and matrix.ndim == 2:
+            return matrix.shape[1]
+        if self._delta_matrix is not None:
+            return self._delta_matrix.shape[1]
+        return 0
+
+    def _reserve_delta(self, rows, dimension):
+        """Make room for more delta rows, doubling the buffers when full."""
+        needed = self._delta_count + rows
+        capacity = 0 if self._delta_matrix is None else len(self._delta_matrix)
+        if needed > capacity:
+            capacity = max(needed, capacity * 2, 16)
+            delta_matrix = np.zeros((capacity, dimension), dtype=np.float32)
+            if self._delta_count:
+                delta_matrix[:self._delta_count] = self._delta_matrix[:self._delta_count]
+            self._delta_matrix = delta_matrix
+
+        if len(self.ids) + rows > len(self._alive):
+            alive = np.zeros(max(len(self.ids) + rows, len(self._alive) * 2, 16), dtype=bool)
+            alive[:len(self.ids)] = self._alive[:len(self.ids)]
+            self._alive = alive
+
+    def _save_derived_indexes(self):
+        """Write the IVF and quantized indexes next to a freshly saved index."""
+        ann_path = os.path.join(self.index_path, ANN_INDEX_FILE)
+        if self.ann_index is not None:
+            self.ann_index.save(ann_path)
+        elif os.path.exists(ann_path):
+            os.remove(ann_path)
+
+        for mode in QUANTIZATION_MODES:
+            quantized_path = os.path.join(self.index_path, quantized_index_file(mode))
+            if self.quantized_matrix is not None and self.quantized_matrix.mode == mode:
+                self.quantized_matrix.save(quantized_path)
+            elif os.path.exists(quantized_path):
+                os.remove(quantized_path)
+
+    def retrieve(self, query, top_n=3, fusion=None):
         """
         Retrieve the most relevant examples for a given query.
         
         Args:
             query (str): The query to find examples for
             top_n (int): Number of examples to retrieve
+            fusion: 'dense', 'rrf' or 'weighted' (defaults to the retriever's mode)
             
         Returns:
-            list: Top N relevant examples with similarity scores
+            list: Top N relevant examples with similarity (or fused) scores
         """
+        fusion = fusion or self.fusion
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode: {fusion}")
+
         # Truncate query to token limit
         query = self._truncate_to_token_limit(query)
 
         # Use E5 model's query format for embedding
-        query_embedding = self.embedding_model.get_query_embedding(query)
-
-        similarities = []
-        for input_text, output_text, input_embedding, output_embedding in self.vector_db:
-            # Calculate similarity
-            similarity = self._calculate_cosine_similarity(query_embedding, input_embedding)
-            similarities.append((output_text, similarity))
+        with span('query_embedding'):
+            query_embedding = self.embedding_model.get_query_embedding(query)
 
-        # Sort by similarity in descending order
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Score the examples and keep only the top N
+        with self._lock, span('index_scan', fusion=fusion, top_n=top_n):
+            if fusion == 'dense':
+                top_indices, top_scores = self._search(query_embedding, top_n)
+            else:
+                top_indices, top_scores = self._hybrid_search(query, query_embedding, top_n, fusion)
+            similarities = self._results(top_indices, top_scores)
 
-        # Print the retrieved RAGs for debugging
-        print("\nRetrieved RAGs:")
-        for i, (output_text, similarity) in enumerate(similarities[:top_n]):
-            # Truncate output for display
-            display_text = self._truncate_to_token_limit(output_text, max_tokens=100)
-            print(f"Rank {i+1}: Similarity = {similarity:.4f} -> {display_text}")
+        # Log the retrieved RAGs for debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Retrieved RAGs:")
+            for i, (output_text, similarity) in enumerate(similarities[:top_n]):
+                # Truncate output for display
+                display_text = self._truncate_to_token_limit(output_text, max_tokens=100)
+                logger.debug("Rank %d: Similarity = %.4f -> %s", i + 1, similarity, display_text)
 
         # Return the top N most relevant outputs
         return similarities[:top_n]
     
+    def retrieve_many(self, queries, top_n=3, chunk_size=256):
+        """
+        Retrieve the most relevant examples for many queries at once.
+        
+        Queries are processed in chunks: each chunk is embedded in one batched
+        encode and scored with a single matrix-matrix product, so memory stays
+        bounded by chunk_size x corpus size. Nothing is logged per query.
+        
+        Args:
+            queries (list): Queries to find examples for
+            top_n (int): Number of examples to retrieve per query
+            chunk_size (int): Number of queries embedded and scored together
+            
+        Returns:
+            list: One list of (example, similarity) tuples per query
+        """
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            chunk = [self._truncate_to_token_limit(query) for query in queries[start:start + chunk_size]]
+            with span('query_embedding', queries=len(chunk)):
+                query_embeddings = self._embed_queries(chunk)
+
+            with self._lock, span('index_scan', queries=len(chunk), top_n=top_n):
+                if self.ann_index is not None or self.quantized_matrix is not None:
+                    for query_embedding in query_embeddings:
+                        indices, scores = self._search(query_embedding, top_n)
+                        results.append(self._results(indices, scores))
+                    continue
+
+                for indices, scores in zip(*self._top_k_rows(self._score_many(query_embeddings), top_n)):
+                    # Tombstoned examples score -inf
+                    found = np.isfinite(scores)
+                    results.append(self._results(indices[found], scores[found]))
+
+        return results
+
     def retrieve_by_keyword(self, keyword):
         """
         Fetches an example statement that correctly uses the specified keyword.
         
+        Keywords and identifiers are looked up in the inverted keyword index,
+        which returns the shortest example using them. Other keywords (e.g.
+        punctuation) fall back to a substring scan.
+        
         Args:
             keyword (str): The keyword to search for
             
         Returns:
             str: Example that uses the keyword
         """
-        for input_text, output_text, _, _ in self.vector_db:
-            if keyword and (keyword in input_text or keyword in output_text):
-                return output_text  # Return the first relevant example found
+        with self._lock:
+            if keyword and KeywordIndex.normalize_keyword(keyword) is not None:
+                position = self.keyword_index.shortest(keyword)
+                if position is not None:
+                    self._seed_token_cache([position])
+                    return self.output_texts[position]
+            elif keyword:
+                for position, (input_text, output_text) in enumerate(zip(self.input_texts, self.output_texts)):
+                    if self._alive[position] and (keyword in input_text or keyword in output_text):
+                        return output_text  # Return the first relevant example found
 
         return "No relevant example found in the database."  # Fallback case
     
-    def _calculate_cosine_similarity(self, a, b):
-        """Calculate cosine similarity between two vectors."""
-        dot_product = sum([x * y for x, y in zip(a, b)])
-        norm_a = sum([x ** 2 for x in a]) ** 0.5
-        norm_b = sum([x ** 2 for x in b]) ** 0.5
-        return dot_product / (norm_a * norm_b)
+    def _results(self, indices, scores):
+        """
+        Build (example, score) results and seed the token cache with their stored token ids.
+        
+        Prompt assembly can then count and truncate the examples without
+        tokenizing them again.
+        
+        Args:
+            indices: Example positions
+            scores: Scores of the examples
+            
+        Returns:
+            list: (example, score) tuples
+        """
+        self._seed_token_cache(indices)
+        return [(self.output_texts[i], float(score)) for i, score in zip(indices, scores)]
+
+    def _seed_token_cache(self, positions):
+        """Put the stored token ids of examples into the shared token cache."""
+        token_cache = get_token_cache()
+        for position in positions:
+            token_cache.put(self.tokenizer, self.output_texts[position], self.output_token_ids[position])
+
+    def _base_rows(self, positions):
+        """
+        Normalized float32 input embeddings of base rows.
+        
+        Rows come from the embedding matrix, or from the stored vectors when a
+        quantized retriever keeps no float32 matrix in memory.
+        
+        Args:
+            positions (numpy.ndarray): Base row positions
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (len(positions), dim)
+        """
+        if self.embedding_matrix is not None:
+            return np.asarray(self.embedding_matrix[positions], dtype=np.float32).reshape(
+                len(positions), self._dimension())
+        if len(positions) == 0:
+            return np.zeros((0, self._dimension()), dtype=np.float32)
+        return self._normalize(np.vstack([self.vector_db[position][2] for position in positions]).astype(np.float32))
+
+    def _build_embedding_matrix(self, embeddings):
+        """
+        Stack embeddings into a contiguous, L2-normalized float32 matrix.
+        
+        Args:
+            embeddings (list): Embedding vectors of equal dimension
+            
+        Returns:
+            numpy.ndarray: Matrix of shape (n, dim) with unit-length rows
+        """
+        if len(embeddings) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        matrix = np.ascontiguousarray(np.vstack(embeddings), dtype=np.float32)
+        return self._normalize(matrix)
+
+    def _normalize(self, vectors):
+        """L2-normalize a vector or the rows of a matrix, leaving zero rows as zeros."""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _search(self, query_embedding, top_n):
+        """
+        Find the top N examples for a query embedding.
+        
+        Uses the IVF index when one is available, otherwise scores every example.
+        Rows added since the last compaction are always scored exactly, and
+        tombstoned examples are never returned.
+        
+        Args:
+            query_embedding: Query embedding vector
+            top_n (int): Number of examples to return
+            
+        Returns:
+            tuple: (indices, scores) ordered by descending score
+        """
+        if self.ann_index is None and self.quantized_matrix is None:
+            scores = self._score(query_embedding)
+            top_indices = self._top_k(scores, top_n)
+            top_indices = top_indices[np.isfinite(scores[top_indices])]
+            return top_indices, scores[top_indices]
+
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        if self.ann_index is not None:
+            indices, scores = self._ann_search(query, top_n)
+        else:
+            indices, scores = self._quantized_search(query, top_n)
+        return self._merge_delta(query, indices, scores, top_n)
+
+    def _ann_search(self, query, top_n):
+        """
+        Search the IVF index, widening the search until top_n live rows are found.
+        
+        Args:
+            query (numpy.ndarray): Normalized query vector
+            top_n (int): Number of examples to return
+            
+        Returns:
+            tuple: (indices, scores) of live base rows, best first
+        """
+        k = top_n
+        while True:
+            indices, scores = self.ann_index.search(query, k)
+            if self._deleted_count == 0:
+                return indices, scores
+
+            live = self._alive[indices]
+            if live.sum() >= top_n or len(indices) < k:
+                return indices[live][:top_n], scores[live][:top_n]
+            k *= 2
+
+    def _quantized_search(self, query, top_n):
+        """
+        Scan the quantized matrix, then rescore the best candidates exactly.
+        
+        Args:
+            query (numpy.ndarray): Normalized query vector
+            top_n (int): Number of examples to return
+            
+        Returns:
+            tuple: (indices, exact scores) of live base rows, best first
+        """
+        if self._base_count == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        approximate_scores = self.quantized_matrix.score(query)
+        if self._deleted_count:
+            approximate_scores[~self._alive[:self._base_count]] = -np.inf
+
+        # Sorted candidates keep reads from a memory-mapped matrix sequential
+        candidates = np.sort(self._top_k(approximate_scores, top_n * self.rescore_factor))
+        candidates = candidates[np.isfinite(approximate_scores[candidates])]
+        exact_scores = self._base_rows(candidates) @ query
+
+        top = self._top_k(exact_scores, top_n)
+        return candidates[top], exact_scores[top]
+
+    def _merge_delta(self, query, indices, scores, top_n):
+        """
+        Merge base search results with exact scores of the delta rows.
+        
+        Args:
+            query (numpy.ndarray): Normalized query vector
+            indices (numpy.ndarray): Base result positions
+            scores (numpy.ndarray): Base result scores
+            top_n (int): Number of examples to return
+            
+        Returns:
+            tuple: (indices, scores) ordered by descending score
+        """
+        if self._delta_count == 0:
+            return indices, scores
+
+        delta_positions = np.arange(self._base_count, self._base_count + self._delta_count)
+        live = self._alive[delta_positions]
+        delta_scores = self._delta_matrix[:self._delta_count][live] @ query
+
+        indices = np.concatenate([indices, delta_positions[live]])
+        scores = np.concatenate([scores, delta_scores])
+        top = self._top_k(scores, top_n)
+        return indices[top], scores[top]
+
+    def _hybrid_search(self, query, query_embedding, top_n, fusion):
+        """
+        Fuse dense and BM25 rankings.
+        
+        Both rankings contribute a candidate pool larger than top_n; the pools
+        are merged and re-ranked by the fused score.
+        
+        Args:
+            query (str): Query text for BM25
+            query_embedding: Query embedding vector
+            top_n (int): Number of examples to return
+            fusion (str): 'rrf' or 'weighted'
+            
+        Returns:
+            tuple: (indices, fused scores) ordered by descending score
+        """
+        pool_size = max(top_n * 10, 50)
+        dense_indices, dense_scores = self._search(query_embedding, pool_size)
+
+        lexical_scores = self.bm25_index.score(query)
+        if self._deleted_count:
+            lexical_scores[~self._alive[:len(lexical_scores)]] = 0.0
+        lexical_indices = self._top_k(lexical_scores, pool_size)
+        lexical_indices = lexical_indices[lexical_scores[lexical_indices] > 0]
+
+        candidates = np.union1d(dense_indices, lexical_indices).astype(np.int64)
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+
+        if fusion == 'rrf':
+            # Candidates missing from a ranking are treated as ranked just after its pool
+            fused = np.zeros(len(candidates), dtype=np.float32)
+            for ranked in (dense_indices, lexical_indices):
+                ranks = np.full(len(candidates), len(ranked) + 1, dtype=np.float32)
+                ranks[np.searchsorted(candidates, ranked)] = np.arange(1, len(ranked) + 1)
+                fused += 1.0 / (self.rrf_k + ranks)
+        else:
+            # Candidates outside the dense pool get the pool's lowest score
+            dense = np.full(len(candidates), dense_scores.min() if len(dense_scores) else 0.0, dtype=np.float32)
+            dense[np.searchsorted(candidates, dense_indices)] = dense_scores
+            fused = (self.dense_weight * self._min_max(dense)
+                     + (1 - self.dense_weight) * self._min_max(lexical_scores[candidates]))
+
+        top = self._top_k(fused, top_n)
+        return candidates[top], fused[top]
+
+    def _min_max(self, scores):
+        """Scale scores to [0, 1] (all zeros if they are constant)."""
+        low, high = scores.min(), scores.max()
+        if high - low == 0:
+            return np.zeros_like(scores)
+        return (scores - low) / (high - low)
+
+    def _score(self, query_embedding):
+        """
+        Calculate cosine similarity between a query and every example.
+        
+        Args:
+            query_embedding: Query embedding vector
+            
+        Returns:
+            numpy.ndarray: Similarity score for each position (-inf for
+                tombstoned examples)
+        """
+        if len(self.ids) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        if self._delta_count == 0 and self._deleted_count == 0:
+            return self.embedding_matrix @ query
+
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        if self._base_count:
+            scores[:self._base_count] = self.embedding_matrix @ query
+        if self._delta_count:
+            scores[self._base_count:] = self._delta_matrix[:self._delta_count] @ query
+        scores[~self._alive[:len(self.ids)]] = -np.inf
+        return scores
+
+    def _embed_queries(self, queries):
+        """Embed queries in one batch when the embedding model supports it."""
+        if hasattr(self.embedding_model, 'get_query_embeddings'):
+            return np.asarray(self.embedding_model.get_query_embeddings(queries), dtype=np.float32)
+        return np.vstack([self.embedding_model.get_query_embedding(query) for query in queries]).astype(np.float32)
+
+    def _score_many(self, query_embeddings):
+        """
+        Calculate cosine similarity between several queries and every example.
+        
+        Args:
+            query_embeddings (numpy.ndarray): Query matrix of shape (q, dim)
+            
+        Returns:
+            numpy.ndarray: Score matrix of shape (q, n) (-inf for tombstoned examples)
+        """
+        if len(self.ids) == 0:
+            return np.zeros((len(query_embeddings), 0), dtype=np.float32)
+
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if self._delta_count == 0 and self._deleted_count == 0:
+            return queries @ self.embedding_matrix.T
+
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        if self._base_count:
+            scores[:, :self._base_count] = queries @ self.embedding_matrix.T
+        if self._delta_count:
+            scores[:, self._base_count:] = queries @ self._delta_matrix[:self._delta_count].T
+        scores[:, ~self._alive[:len(self.ids)]] = -np.inf
+        return scores
+
+    def _top_k_rows(self, scores, k):
+        """
+        Find the k highest scores in every row of a score matrix.
+        
+        Args:
+            scores (numpy.ndarray): Score matrix of shape (q, n)
+            k (int): Number of results per row
+            
+        Returns:
+            tuple: (indices, scores) matrices of shape (q, k), best first
+        """
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            empty = np.zeros((scores.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    def _top_k(self, scores, k):
+        """
+        Find the indices of the k highest scores, best first.
+        
+        Uses argpartition so that only the k selected scores are sorted.
+        
+        Args:
+            scores (numpy.ndarray): Similarity scores
+            k (int): Number of indices to return
+            
+        Returns:
+            numpy.ndarray: Indices ordered by descending score
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
     
     def _truncate_to_token_limit(self, text, max_tokens=None):
         """
@@ -93,8 +884,4 @@ class OMLRetriever:
         if max_tokens is None:
             max_tokens = self.max_tokens
             
-        tokens = self.tokenizer.encode(text)
-        if len(tokens) > max_tokens:
-            truncated_tokens = tokens[:max_tokens]
-            return self.tokenizer.decode(truncated_tokens)
-        return text
+        return truncate_text(text, max_tokens, self.tokenizer)
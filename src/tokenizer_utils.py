@@ -1,11 +1,122 @@
 # tokenizer_utils.py - Tokenization with tiktoken
 
+import functools
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
 import tiktoken
+from src.instrumentation import span
 
+class TokenCache:
+    """
+    Bounded, thread-safe LRU cache of token ids keyed by tokenizer and text.
+    
+    Retrieved examples, the system prompt and other recurring texts are
+    encoded once; counting or truncating them again is a dictionary lookup.
+    Token ids are stored as read-only int32 arrays.
+    """
+    
+    def __init__(self, capacity=8192):
+        """
+        Initialize the token cache.
+        
+        Args:
+            capacity (int): Maximum number of cached texts
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, tokenizer, text):
+        """
+        Look up the token ids of a text, marking them as recently used.
+        
+        Args:
+            tokenizer: Tokenizer the ids were produced with
+            text (str): Encoded text
+            
+        Returns:
+            numpy.ndarray: Cached token ids, or None on a miss
+        """
+        key = (_cache_key(tokenizer), text)
+        with self._lock:
+            token_ids = self._entries.get(key)
+            if token_ids is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return token_ids
+            
+    def put(self, tokenizer, text, token_ids):
+        """
+        Store the token ids of a text, evicting the least recently used entry if full.
+        
+        Args:
+            tokenizer: Tokenizer the ids were produced with
+            text (str): Encoded text
+            token_ids: Token ids (list or array)
+            
+        Returns:
+            numpy.ndarray: The stored read-only int32 ids
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int32)
+        if token_ids.flags.writeable:
+            token_ids.setflags(write=False)
+        key = (_cache_key(tokenizer), text)
+        with self._lock:
+            self._entries[key] = token_ids
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return token_ids
+        
+    def clear(self):
+        """Drop every cached entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            
+    def stats(self):
+        """
+        Report cache usage.
+        
+        Returns:
+            dict: Hits, misses, hit rate, current size and capacity
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'capacity': self.capacity,
+            }
+            
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+_token_cache = TokenCache()
+
+def get_token_cache():
+    """The process-wide TokenCache used by encode, count_tokens and truncate_text."""
+    return _token_cache
+
+@functools.lru_cache(maxsize=None)
 def get_tokenizer(encoding_name="cl100k_base"):
     """
     Get a tokenizer for the specified encoding.
     
+    The encoder is created once per encoding name and shared process-wide.
+    
     Args:
         encoding_name (str): Name of the encoding to use
         
@@ -14,21 +125,67 @@ def get_tokenizer(encoding_name="cl100k_base"):
     """
     return tiktoken.get_encoding(encoding_name)
 
+def tokenizer_name(tokenizer):
+    """
+    Name a tokenizer for matching token ids stored with an index.
+    
+    Args:
+        tokenizer: Tokenizer with an encode() method
+        
+    Returns:
+        str: The encoding name of tiktoken encoders or the tokenizer's own
+            'name' attribute, or None if it has no name
+    """
+    name = getattr(tokenizer, 'name', None)
+    return name if isinstance(name, str) else None
+
+def _cache_key(tokenizer):
+    """
+    Key of a tokenizer in the TokenCache: its name, or a weak reference to it.
+    
+    Unlike id(), a weak reference never equals one to a later tokenizer that
+    reuses the address of a collected one.
+    """
+    name = tokenizer_name(tokenizer)
+    if name is not None:
+        return name
+    try:
+        return weakref.ref(tokenizer)
+    except TypeError:
+        raise TypeError(f"{type(tokenizer).__name__} needs a 'name' attribute to cache its token ids") from None
+
+def encode(text, tokenizer=None):
+    """
+    Encode text, reusing cached token ids.
+    
+    Args:
+        text (str): Text to encode
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
+        
+    Returns:
+        numpy.ndarray: Read-only int32 token ids
+    """
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+        
+    token_ids = _token_cache.get(tokenizer, text)
+    if token_ids is None:
+        with span('token_count', chars=len(text)):
+            token_ids = _token_cache.put(tokenizer, text, tokenizer.encode(text))
+    return token_ids
+
 def count_tokens(text, tokenizer=None):
     """
     Count the number of tokens in text.
     
     Args:
         text (str): Text to count tokens for
-        tokenizer: Optional tokenizer (creates one if not provided)
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
         
     Returns:
         int: Number of tokens
     """
-    if tokenizer is None:
-        tokenizer = get_tokenizer()
-        
-    return len(tokenizer.encode(text))
+    return len(encode(text, tokenizer))
 
 def truncate_text(text, max_tokens, tokenizer=None):
     """
@@ -37,7 +194,7 @@ def truncate_text(text, max_tokens, tokenizer=None):
     Args:
         text (str): Text to truncate
         max_tokens (int): Maximum tokens allowed
-        tokenizer: Optional tokenizer (creates one if not provided)
+        tokenizer: Optional tokenizer (defaults to the shared cl100k_base encoder)
         
     Returns:
         str: Truncated text
@@ -45,25 +202,40 @@ def truncate_text(text, max_tokens, tokenizer=None):
     if tokenizer is None:
         tokenizer = get_tokenizer()
         
-    tokens = tokenizer.encode(text)
+    tokens = encode(text, tokenizer)
     if len(tokens) > max_tokens:
-        truncated_tokens = tokens[:max_tokens]
+        truncated_tokens = tokens[:max_tokens].tolist()
         return tokenizer.decode(truncated_tokens)
     return text
 
-def fit_examples_in_context(examples, system_prompt, max_tokens=4096, tokenizer=None):
+def fit_examples_in_context(examples, system_prompt, max_tokens=4096, tokenizer=None, reserve_tokens=500,
+                            packing='prefix', excerpt='statements', return_token_counts=False):
     """
-    Fit as many examples as possible within context window.
+    Fit the most useful examples within the context window.
+    
+    By default (packing='prefix'), examples are taken in rank order until the
+    first one that does not fit. With packing='knapsack', examples are chosen
+    to maximize total relevance within the remaining budget, and large
+    examples can be shortened to excerpts instead of crowding out everything
+    ranked after them (see src.context_packing.pack_examples).
     
     Args:
-        examples (list): List of (text, score) tuples
+        examples (list): List of (text, score) tuples, best first
         system_prompt (str): System prompt text
         max_tokens (int): Maximum context window size
         tokenizer: Optional tokenizer
+        reserve_tokens (int): Tokens kept free for the user query and the response
+        packing (str): 'prefix' or 'knapsack'
+        excerpt (str): Excerpts used by knapsack packing: 'statements',
+            'truncate' or None
+        return_token_counts (bool): Return (text, score, tokens) triples
         
     Returns:
-        list: List of examples that fit in context
+        list: Examples that fit in context, in rank order, as (text, score)
+            tuples or (text, score, tokens) triples
     """
+    if packing not in ('knapsack', 'prefix'):
+        raise ValueError(f"Unknown packing mode: {packing}")
     if tokenizer is None:
         tokenizer = get_tokenizer()
         
@@ -71,7 +243,14 @@ def fit_examples_in_context(examples, system_prompt, max_tokens=4096, tokenizer=
     system_tokens = count_tokens(system_prompt, tokenizer)
     
     # Reserve some tokens for user query and LLM response
-    available_tokens = max_tokens - system_tokens - 500  # Reserve 500 for query/response
+    available_tokens = max_tokens - system_tokens - reserve_tokens
+    
+    if packing == 'knapsack':
+        from src.context_packing import pack_examples
+        packed = pack_examples(examples, available_tokens, tokenizer, excerpt=excerpt)
+        if return_token_counts:
+            return [(item['text'], item['score'], item['tokens']) for item in packed]
+        return [(item['text'], item['score']) for item in packed]
     
     fitted_examples = []
     tokens_used = 0
@@ -80,7 +259,7 @@ def fit_examples_in_context(examples, system_prompt, max_tokens=4096, tokenizer=
         example_tokens = count_tokens(example, tokenizer)
         
         if tokens_used + example_tokens <= available_tokens:
-            fitted_examples.append((example, score))
+            fitted_examples.append((example, score, example_tokens) if return_token_counts else (example, score))
             tokens_used += example_tokens
         else:
             break
@@ -1,5 +1,24 @@
-# __init__.py - Package initialization
+# __init__.py - Package initialization (attributes are imported on first access)
 
-from src.validation.validator import OMLValidator
-from src.validation.error_handler import ErrorHandler
-from src.validation.feedback_loop import FeedbackLoop
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "OMLValidator": "src.validation.validator",
+    "ErrorHandler": "src.validation.error_handler",
+    "FeedbackLoop": "src.validation.feedback_loop",
+    "CodeFenceDetector": "src.validation.streaming",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,237 @@
+# batch.py - Validate many OML files in parallel and report the results
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
+
+STATE_VERSION = 2
+
+# Validator of a pool worker process, compiled once by _init_worker
+_worker_validator = None
+
+def content_hash(text):
+    """
+    Hash the content of an OML file or grammar.
+
+    Args:
+        text (str): File content
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def order_largest_first(paths):
+    """
+    Order files by size, largest first.
+
+    Large files take longest to parse, so starting them first keeps the
+    pool busy until the end instead of leaving one worker on a big file.
+
+    Args:
+        paths (list): File paths
+
+    Returns:
+        list: The paths, largest first (ties by path)
+    """
+    return sorted(paths, key=lambda path: (-os.path.getsize(path), path))
+
+def load_state(state_file):
+    """
+    Load the file hashes and verdicts of the last run.
+
+    Args:
+        state_file (str): JSON state file written by save_state
+
+    Returns:
+        dict: The state, or an empty state if the file is missing or unreadable
+    """
+    try:
+        with open(state_file, 'r') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return {'version': STATE_VERSION, 'grammar': None, 'parser': None, 'files': {}}
+    if state.get('version') != STATE_VERSION:
+        return {'version': STATE_VERSION, 'grammar': None, 'parser': None, 'files': {}}
+    return state
+
+def save_state(state_file, grammar_hash, results, parser='auto'):
+    """
+    Save file hashes and verdicts for the next --changed-since run.
+
+    Args:
+        state_file (str): JSON state file
+        grammar_hash (str): Hash of the grammar the files were validated with
+        results (list): Result dictionaries of every file
+        parser (str): Parser mode the files were validated with
+    """
+    state = {
+        'version': STATE_VERSION,
+        'grammar': grammar_hash,
+        'parser': parser,
+        'files': {result['path']: {'sha256': result['sha256'], 'valid': result['valid'], 'error': result['error']}
+                  for result in results},
+    }
+    directory = os.path.dirname(os.path.abspath(state_file))
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+def grammar_file_hash(grammar_file=None):
+    """Hash of the grammar file validate_files would use."""
+    from src.validation.validator import default_grammar_file
+    with open(grammar_file or default_grammar_file(), 'r') as file:
+        return content_hash(file.read())
+
+def validate_files(paths, grammar_file=None, parser='auto', jobs=1, state=None, on_result=None):
+    """
+    Validate OML files, in a process pool when jobs > 1.
+
+    Each pool worker compiles its own OMLValidator once (loaded from the
+    parser disk cache) and validates files largest-first. With a state
+    from load_state, files whose content hash, grammar and parser mode are
+    unchanged are not parsed again and keep their previous verdict.
+
+    Args:
+        paths (list): OML file paths
+        grammar_file (str): Grammar file (defaults to the validator's default)
+        parser (str): Parser mode of OMLValidator
+        jobs (int): Worker processes (1 validates in this process)
+        state (dict): Optional state of the last run
+        on_result (callable): Optional callback for each result as it completes
+
+    Returns:
+        list: One result dictionary per file, in the order of paths, with
+            path, size, sha256, valid, error, parse_time and skipped
+    """
+    grammar_hash = grammar_file_hash(grammar_file)
+    unchanged = state and state.get('grammar') == grammar_hash and state.get('parser') == parser
+    previous = state['files'] if unchanged else {}
+
+    results = {}
+    pending = []
+    for path in order_largest_first(paths):
+        with open(path, 'r') as file:
+            content = file.read()
+        digest = content_hash(content)
+        last = previous.get(path)
+        if last is not None and last['sha256'] == digest:
+            results[path] = _result(path, content, digest, last['valid'], last['error'], 0.0, skipped=True)
+            if on_result is not None:
+                on_result(results[path])
+        else:
+            pending.append((path, content, digest))
+
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending)), initializer=_init_worker,
+                                 initargs=(grammar_file, parser)) as executor:
+            # Submitted largest-first; each idle worker takes the next file
+            futures = [executor.submit(_validate_in_worker, *item) for item in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['path']] = result
+                if on_result is not None:
+                    on_result(result)
+    else:
+        _init_worker(grammar_file, parser)
+        for item in pending:
+            result = _validate_in_worker(*item)
+            results[result['path']] = result
+            if on_result is not None:
+                on_result(result)
+
+    return [results[path] for path in paths]
+
+def summarize(results):
+    """
+    Count the results.
+
+    Args:
+        results (list): Result dictionaries
+
+    Returns:
+        dict: Numbers of files, valid, invalid and skipped files, and total parse time
+    """
+    valid = sum(1 for result in results if result['valid'])
+    return {
+        'files': len(results),
+        'valid': valid,
+        'invalid': len(results) - valid,
+        'skipped': sum(1 for result in results if result['skipped']),
+        'parse_time': sum(result['parse_time'] for result in results),
+    }
+
+def write_json_report(results, report_file):
+    """
+    Write a JSON report with a summary and per-file results.
+
+    Args:
+        results (list): Result dictionaries
+        report_file (str): Output path
+    """
+    with open(report_file, 'w') as file:
+        json.dump({'summary': summarize(results), 'files': results}, file, indent=2)
+
+def write_junit_report(results, report_file, suite_name='oml-validation'):
+    """
+    Write a JUnit XML report with one test case per file.
+
+    Invalid files are failures carrying the parser error, skipped (unchanged)
+    files are marked skipped, and each case's time is its parse time.
+
+    Args:
+        results (list): Result dictionaries
+        report_file (str): Output path
+        suite_name (str): Name of the test suite
+    """
+    summary = summarize(results)
+    suite = ElementTree.Element('testsuite', {
+        'name': suite_name,
+        'tests': str(summary['files']),
+        'failures': str(summary['invalid']),
+        'errors': '0',
+        'skipped': str(summary['skipped']),
+        'time': f"{summary['parse_time']:.6f}",
+    })
+    for result in results:
+        case = ElementTree.SubElement(suite, 'testcase', {
+            'classname': suite_name,
+            'name': result['path'],
+            'time': f"{result['parse_time']:.6f}",
+        })
+        if not result['valid']:
+            failure = ElementTree.SubElement(case, 'failure', {'message': (result['error'].splitlines() or [''])[0]})
+            failure.text = result['error']
+        elif result['skipped']:
+            ElementTree.SubElement(case, 'skipped', {'message': 'unchanged since the last run'})
+    ElementTree.ElementTree(suite).write(report_file, encoding='utf-8', xml_declaration=True)
+
+def _init_worker(grammar_file, parser):
+    """Compile the validator of this process."""
+    global _worker_validator
+    from src.validation.validator import OMLValidator
+    _worker_validator = OMLValidator(grammar_file, parser=parser)
+
+def _validate_in_worker(path, content, digest):
+    """Validate one file with the validator of this process."""
+    start = time.perf_counter()
+    is_valid, result = _worker_validator.validate(content, return_tree=False)
+    parse_time = time.perf_counter() - start
+    return _result(path, content, digest, is_valid, None if is_valid else result, parse_time)
+
+def _result(path, content, digest, valid, error, parse_time, skipped=False):
+    """Result dictionary of one file."""
+    return {
+        'path': path,
+        'size': len(content),
+        'sha256': digest,
+        'valid': valid,
+        'error': error,
+        'parse_time': parse_time,
+        'skipped': skipped,
+    }
@@ -0,0 +1,512 @@
+# constrained.py - Grammar-constrained decoding for local token-level models
+
+import threading
+from collections import OrderedDict
+from copy import copy
+import numpy as np
+import regex
+from lark import Token, UnexpectedCharacters, UnexpectedInput, UnexpectedToken
+from lark.lexer import LexerThread, LineCounter
+
+WHITESPACE = ' \t\r\n'
+
+class DecodingState:
+    """
+    Parse of a generated prefix: the parser after its complete tokens and the text after them.
+
+    States are immutable; GrammarConstraint.advance returns a new one.
+    """
+
+    __slots__ = ('parser_state', 'pending')
+
+    def __init__(self, parser_state, pending):
+        self.parser_state = parser_state
+        self.pending = pending
+
+class GrammarConstraint:
+    """
+    Decides which continuations keep generated code a viable prefix of valid OML.
+
+    Tokens followed by whitespace are final and are fed to Lark's
+    interactive LALR parser, as in IncrementalParse. The text after them must
+    lex into tokens the parser accepts, possibly ending with the beginning of
+    a terminal it accepts next (e.g. "xsd:" on its way to "xsd:string"),
+    which is checked with the partial matching of the regex module. The
+    terminals accepted by a parser state are computed once per LALR state
+    stack.
+    """
+
+    def __init__(self, parser, start='ontology', cache_size=4096):
+        """
+        Initialize the constraint.
+
+        Args:
+            parser: Lark LALR parser (e.g. OMLValidator().lalr_parser)
+            start (str): Start rule
+            cache_size (int): Maximum number of cached allowed-terminal sets
+        """
+        interactive = parser.parse_interactive('', start=start)
+        self._interactive = interactive
+        self._lexer = interactive.lexer_thread.lexer
+        # Generated prefixes need no parse tree, so reductions skip the tree builders
+        parse_conf = copy(interactive.parser_state.parse_conf)
+        parse_conf.callbacks = {}
+        self._initial = interactive.parser_state.copy(deepcopy_values=False)
+        self._initial.parse_conf = parse_conf
+        self._patterns = {}
+        for terminal in parser.terminals:
+            pattern = terminal.pattern.to_regexp()
+            if terminal.pattern.flags:
+                pattern = f"(?{''.join(terminal.pattern.flags)}:{pattern})"
+            self._patterns[terminal.name] = regex.compile(pattern)
+        self._ignore = frozenset(parser.lexer_conf.ignore)
+        self.cache_size = cache_size
+        self._allowed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def initial_state(self):
+        """The state before any code has been generated."""
+        return DecodingState(self._initial, '')
+
+    def advance(self, state, text):
+        """
+        Extend a prefix with generated text.
+
+        Args:
+            state (DecodingState): State of the prefix
+            text (str): Generated text
+
+        Returns:
+            DecodingState: State of the longer prefix, or None if it can no
+                longer be extended to valid OML
+        """
+        full = state.pending + text
+        parser_state = state.parser_state.copy(deepcopy_values=False)
+        # Tokens ending at or before the last whitespace cannot change any more
+        boundary = max(full.rfind(char) for char in WHITESPACE)
+        committed = 0
+        if boundary >= 0:
+            try:
+                for token in self._lex(full, parser_state):
+                    if token.end_pos > boundary or _opens_long_string(full, token):
+                        break
+                    parser_state.feed_token(token)
+                    committed = token.end_pos
+            except UnexpectedCharacters as e:
+                # An unterminated string may still be closed by later text
+                if e.pos_in_stream < boundary and full[e.pos_in_stream] not in '"\'':
+                    return None
+            except UnexpectedToken as e:
+                if e.token.end_pos is None or e.token.end_pos <= boundary:
+                    return None
+
+        pending = full[committed:]
+        if not self._viable_tail(parser_state, pending):
+            return None
+        return DecodingState(parser_state, pending)
+
+    def allowed_terminals(self, state):
+        """
+        Terminals the parser accepts after the complete tokens of a prefix.
+
+        Args:
+            state (DecodingState): State of the prefix
+
+        Returns:
+            frozenset: Terminal names ('$END' if the code may end here)
+        """
+        return self._accepts(state.parser_state)
+
+    def is_complete(self, state):
+        """
+        Whether a prefix is valid OML as it stands.
+
+        Args:
+            state (DecodingState): State of the prefix
+
+        Returns:
+            bool: True if the code may end here
+        """
+        parser_state = state.parser_state.copy(deepcopy_values=False)
+        pending = state.pending
+        last_token = None
+        try:
+            for token in self._lex(pending, parser_state):
+                parser_state.feed_token(token)
+                last_token = token
+            end_token = Token.new_borrow_pos('$END', '', last_token) if last_token else Token('$END', '')
+            parser_state.feed_token(end_token, True)
+        except UnexpectedInput:
+            return False
+        return True
+
+    def _viable_tail(self, parser_state, tail):
+        """Whether text after the complete tokens can still be lexed and parsed."""
+        if self._skip_ignored(tail, 0) == len(tail):
+            return True
+
+        # Lex and parse as far as possible, remembering the parser before each token
+        probe = parser_state.copy(deepcopy_values=False)
+        starts = [(self._skip_ignored(tail, 0), probe.copy(deepcopy_values=False))]
+        try:
+            for token in self._lex(tail, probe):
+                probe.feed_token(token)
+                start = self._skip_ignored(tail, token.end_pos)
+                if start == len(tail):
+                    return True
+                starts.append((start, probe.copy(deepcopy_values=False)))
+            return True
+        except UnexpectedInput:
+            pass
+
+        # The last word may be an unfinished token, possibly merging several lexed ones
+        for start, state in reversed(starts):
+            rest = tail[start:]
+            for name in self._accepts(state) | self._ignore:
+                pattern = self._patterns.get(name)
+                if pattern is not None and pattern.fullmatch(rest, partial=True):
+                    return True
+        return False
+
+    def _skip_ignored(self, text, position):
+        """Position after the whitespace and comments at a position of text."""
+        moved = True
+        while moved and position < len(text):
+            moved = False
+            for name in self._ignore:
+                match = self._patterns[name].match(text, position)
+                if match and match.end() > position:
+                    position = match.end()
+                    moved = True
+        return position
+
+    def _accepts(self, parser_state):
+        """Terminals a parser state can shift next, cached by its state stack."""
+        key = tuple(parser_state.state_stack)
+        with self._lock:
+            allowed = self._allowed.get(key)
+            if allowed is not None:
+                self._allowed.move_to_end(key)
+                return allowed
+
+        actions = parser_state.parse_conf.states[parser_state.position]
+        accepted = set()
+        for name in actions:
+            if not name.isupper():
+                continue
+            probe = parser_state.copy(deepcopy_values=False)
+            try:
+                probe.feed_token(Token(name, ''), name == '$END')
+            except UnexpectedToken:
+                continue
+            accepted.add(name)
+        allowed = frozenset(accepted)
+
+        with self._lock:
+            self._allowed[key] = allowed
+            while len(self._allowed) > self.cache_size:
+                self._allowed.popitem(last=False)
+        return allowed
+
+    def _lex(self, text, parser_state):
+        """Lex text in the context of a parser state."""
+        thread = LexerThread.from_text(self._lexer, text)
+        thread.state.line_ctr = LineCounter('\n')
+        return thread.lex(parser_state)
+
+def _opens_long_string(text, token):
+    """Whether a token is an empty string whose next quote opens a triple-quoted string."""
+    return token.value in ('""', "''") and text[token.end_pos:token.end_pos + 1] == token.value[0]
+
+class TokenConstraint:
+    """
+    Allowed-token callback and logits mask for a token-level model.
+
+    The vocabulary is walked as a character trie, so tokens sharing a prefix
+    share its parse and every token below a prefix that is no longer viable
+    is skipped at once. The decoding state of every generated prefix is
+    cached by its token ids (bounded, least recently used first out), so each
+    step only extends the state of the previous one; the states of the last
+    step's allowed tokens are kept until the next step, so the chosen token's
+    state is already known.
+    """
+
+    def __init__(self, constraint, vocabulary, eos_token_id=None, cache_size=4096):
+        """
+        Initialize the token constraint.
+
+        Args:
+            constraint (GrammarConstraint): Grammar constraint
+            vocabulary (list): Text of each token id
+            eos_token_id (int): End-of-sequence token, allowed once the code is complete
+            cache_size (int): Maximum number of cached prefix states
+        """
+        self.constraint = constraint
+        self.vocabulary = list(vocabulary)
+        self.eos_token_id = eos_token_id
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._trie = _token_trie(self.vocabulary, eos_token_id)
+        self._states = OrderedDict()
+        self._candidates = (None, {})
+        self._lock = threading.Lock()
+
+    def state(self, token_ids):
+        """
+        Decoding state of a generated prefix.
+
+        Args:
+            token_ids (list): Generated token ids
+
+        Returns:
+            DecodingState: State of the prefix, or None if it is not viable
+        """
+        key = tuple(token_ids)
+        with self._lock:
+            parent, candidates = self._candidates
+            if key and key[:-1] == parent and key[-1] in candidates:
+                self.hits += 1
+                state = candidates[key[-1]]
+                self._remember(key, state)
+                return state
+
+            # Walk back to the longest prefix whose state is known
+            known = len(key)
+            while known > 0 and key[:known] not in self._states:
+                known -= 1
+            if known == len(key) and known > 0:
+                self.hits += 1
+            else:
+                self.misses += 1
+            state = self._states[key[:known]] if known else self.constraint.initial_state()
+            if known:
+                self._states.move_to_end(key[:known])
+
+        for length in range(known + 1, len(key) + 1):
+            if state is None:
+                break
+            state = self.constraint.advance(state, self._text(key[length - 1]))
+            with self._lock:
+                self._remember(key[:length], state)
+        return state
+
+    def allowed_tokens(self, token_ids):
+        """
+        Token ids that keep the prefix viable.
+
+        Args:
+            token_ids (list): Generated token ids
+
+        Returns:
+            list: Allowed token ids in ascending order
+        """
+        key = tuple(token_ids)
+        state = self.state(key)
+        if state is None:
+            return []
+
+        candidates = {}
+        stack = [(self._trie, state)]
+        while stack:
+            (branches, token_ids_here), node_state = stack.pop()
+            for token_id in token_ids_here:
+                candidates[token_id] = node_state
+            for char, child in branches.items():
+                # No text that starts with a prefix that is not viable is viable
+                child_state = self.constraint.advance(node_state, char)
+                if child_state is not None:
+                    stack.append((child, child_state))
+        with self._lock:
+            self._candidates = (key, candidates)
+
+        allowed = sorted(candidates)
+        if self.eos_token_id is not None and self.constraint.is_complete(state):
+            allowed = sorted(allowed + [self.eos_token_id])
+        return allowed
+
+    def mask(self, token_ids):
+        """
+        Boolean mask over the vocabulary of the allowed next tokens.
+
+        Args:
+            token_ids (list): Generated token ids
+
+        Returns:
+            numpy.ndarray: True for allowed token ids
+        """
+        mask = np.zeros(len(self.vocabulary), dtype=bool)
+        mask[self.allowed_tokens(token_ids)] = True
+        return mask
+
+    def __call__(self, token_ids, logits):
+        """
+        Mask the logits of disallowed tokens, as a logits processor.
+
+        Args:
+            token_ids (list): Generated token ids
+            logits: Next-token logits over the vocabulary
+
+        Returns:
+            numpy.ndarray: Copy of the logits with -inf for disallowed tokens
+        """
+        logits = np.array(logits, dtype=np.float32)
+        logits[~self.mask(token_ids)] = -np.inf
+        return logits
+
+    def _text(self, token_id):
+        """Text of a token id (the end-of-sequence token has none)."""
+        return '' if token_id == self.eos_token_id else self.vocabulary[token_id]
+
+    def _remember(self, key, state):
+        """Cache the state of a prefix, evicting the least recently used one if full (call with the lock held)."""
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self.cache_size:
+            self._states.popitem(last=False)
+
+def _token_trie(vocabulary, eos_token_id):
+    """
+    Character trie of a vocabulary.
+
+    Returns:
+        tuple: Root node; each node is (branches, token_ids), with branches
+            mapping a character to the next node and token_ids the tokens
+            whose text ends at the node
+    """
+    root = ({}, [])
+    for token_id, text in enumerate(vocabulary):
+        if token_id == eos_token_id:
+            continue
+        node = root
+        for char in text:
+            node = node[0].setdefault(char, ({}, []))
+        node[1].append(token_id)
+    return root
+
+class StandInModel:
+    """
+    Deterministic stand-in for a local token-level model, for tests and demos.
+
+    It has memorized one answer and scores the tokens that continue it
+    highest, longest first. Tokens it was steered to that are not part of
+    the answer are skipped over, so after a detour it picks up the answer
+    where it left off. Every other token gets a fixed lower score by id, and
+    the end-of-sequence token wins once the answer is complete.
+    """
+
+    def __init__(self, vocabulary, answer, eos_token_id):
+        """
+        Initialize the stand-in model.
+
+        Args:
+            vocabulary (list): Text of each token id
+            answer (str): Text the model wants to generate
+            eos_token_id (int): End-of-sequence token id
+        """
+        self.vocabulary = list(vocabulary)
+        self.answer = answer
+        self.eos_token_id = eos_token_id
+
+    def __call__(self, messages, token_ids):
+        """
+        Next-token logits.
+
+        Args:
+            messages (list): Chat messages (ignored by the stand-in)
+            token_ids (list): Generated token ids
+
+        Returns:
+            numpy.ndarray: One score per vocabulary token
+        """
+        position = 0
+        for token_id in token_ids:
+            text = self.vocabulary[token_id]
+            if token_id != self.eos_token_id and self.answer.startswith(text, position):
+                position += len(text)
+
+        size = len(self.vocabulary)
+        logits = -1.0 - np.arange(size, dtype=np.float32) / size
+        for token_id, text in enumerate(self.vocabulary):
+            if token_id != self.eos_token_id and text and self.answer.startswith(text, position):
+                logits[token_id] = 10.0 + len(text)
+        if self.eos_token_id is not None:
+            logits[self.eos_token_id] = 100.0 if position == len(self.answer) else -100.0
+        return logits
+
+def generate(model, messages, eos_token_id, constraint=None, max_tokens=512):
+    """
+    Greedy decoding with an optional grammar constraint.
+
+    Args:
+        model: Callable (messages, token_ids) -> next-token logits
+        messages (list): Chat messages for the model
+        eos_token_id (int): End-of-sequence token id
+        constraint (TokenConstraint): Optional constraint masking the logits
+        max_tokens (int): Maximum number of generated tokens
+
+    Yields:
+        int: Each generated token id (the end-of-sequence token is not yielded)
+    """
+    token_ids = []
+    while len(token_ids) < max_tokens:
+        logits = model(messages, token_ids)
+        if constraint is not None:
+            logits = constraint(token_ids, logits)
+        token_id = int(np.argmax(logits))
+        if token_id == eos_token_id or np.isneginf(logits[token_id]):
+            return
+        token_ids.append(token_id)
+        yield token_id
+
+class LocalChatClient:
+    """
+    Chat client for a local token-level model, usable as FeedbackLoop's llm_client.
+
+    The reply is the generated code in an ```oml block, streamed token by
+    token. With a TokenConstraint, every reply that finishes is valid OML,
+    so the feedback loop needs a single iteration.
+    """
+
+    def __init__(self, model, vocabulary, eos_token_id, constraint=None, max_tokens=512):
+        """
+        Initialize the client.
+
+        Args:
+            model: Callable (messages, token_ids) -> next-token logits
+            vocabulary (list): Text of each token id
+            eos_token_id (int): End-of-sequence token id
+            constraint (TokenConstraint): Optional grammar constraint
+            max_tokens (int): Default maximum number of generated tokens
+        """
+        self.model = model
+        self.vocabulary = list(vocabulary)
+        self.eos_token_id = eos_token_id
+        self.constraint = constraint
+        self.max_tokens = max_tokens
+
+    def chat(self, model, messages, stream=False, options=None):
+        """
+        Generate a reply in the Ollama chat format.
+
+        Args:
+            model (str): Model name (ignored)
+            messages (list): Chat messages
+            stream (bool): Return an iterator of chunks
+            options (dict): Optional options; num_predict limits the tokens
+
+        Returns:
+            dict or iterator: The reply, or its chunks when streaming
+        """
+        max_tokens = (options or {}).get('num_predict') or self.max_tokens
+        chunks = self._stream(messages, max_tokens)
+        if stream:
+            return chunks
+        return {'message': {'content': ''.join(chunk['message']['content'] for chunk in chunks)}}
+
+    def _stream(self, messages, max_tokens):
+        """Yield the fenced reply one token at a time."""
+        yield {'message': {'content': '```oml\n'}}
+        for token_id in generate(self.model, messages, self.eos_token_id, self.constraint, max_tokens):
+            yield {'message': {'content': self.vocabulary[token_id]}}
+        yield {'message': {'content': '\n```'}}
@@ -1,7 +1,10 @@
 # error_handler.py - Error processing for feedback
 
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 class ErrorHandler:
     def __init__(self, retriever=None):
         """
@@ -49,6 +52,84 @@ class ErrorHandler:
         
         return error_info
     
+    def process_errors(self, oml_code, errors):
+        """
+        Create debugging information for every error found in one validation pass.
+        
+        Args:
+            oml_code (str): OML code with errors
+            errors (list): Structured error records from
+                OMLValidator.check(oml_code, recover=True)
+            
+        Returns:
+            list: Structured error information, one dict per error
+        """
+        code_lines = oml_code.split("\n")
+        error_infos = []
+        for error in errors:
+            line = error.get('line')
+            error_line = code_lines[line - 1] if line and line <= len(code_lines) else "Unknown"
+            statement = error.get('statement') or error_line.strip()
+            keyword = self.extract_keyword(statement)
+            error_infos.append({
+                'line_number': str(line) if line else "Unknown",
+                'column_number': str(error['column']) if error.get('column') else "Unknown",
+                'unexpected_token': error.get('token') or "Unknown",
+                'expected_tokens': ", ".join(error.get('expected') or []) or "Unknown",
+                'error_line': error_line,
+                'statement': statement,
+                'keyword': keyword,
+                'example': self.retrieve_example(keyword) if self.retriever else None
+            })
+        return error_infos
+        
+    def format_errors_prompt(self, error_infos):
+        """
+        Format one debugging prompt asking to fix every error at once.
+        
+        Args:
+            error_infos (list): Structured error information from process_errors
+            
+        Returns:
+            str: Formatted debugging prompt
+        """
+        if len(error_infos) == 1:
+            return self.format_debugging_prompt(error_infos[0])
+            
+        debugging_prompt = f"""
+        The code has {len(error_infos)} syntax errors. Fix all of them in the next version.
+        """
+        examples = {}
+        for number, error_info in enumerate(error_infos, 1):
+            debugging_prompt += f"""
+        ### Error {number}: line {error_info['line_number']}, column {error_info['column_number']}
+        Unexpected **{error_info['unexpected_token']}**, expected one of: {error_info['expected_tokens']}
+
+        ```oml
+        {error_info['statement']}
+        ```
+        """
+            if error_info['example'] and error_info['keyword'] not in examples:
+                examples[error_info['keyword']] = error_info['example']
+                
+        for keyword, example in examples.items():
+            debugging_prompt += f"""
+        ### Correct usage of **{keyword}**:
+
+        ```oml
+        {example}
+        ```
+        """
+            
+        debugging_prompt += """
+        ### Suggested Fix:
+        Ensure that {} are only used for the overall vocabulary definitions, and for no other subpart definition of the vocabulary.
+        Check and ensure that all extensions are properly formatted to follow the correct schema, like: extends <link> as id
+        Correct every statement above, keep the rest of the code unchanged, and regenerate valid OML Code.
+        """
+        
+        return debugging_prompt
+        
     def format_debugging_prompt(self, error_info):
         """
         Format a debugging prompt from error information.
@@ -91,12 +172,13 @@ class ErrorHandler:
         Returns:
             tuple: Line number, column number, unexpected token, expected tokens
         """
-        # Extract line and column number
-        line_col_match = re.search(r'at line (\d+) col (\d+)', error_message)
+        # Extract line and column number ("at line 3 col 5" or "at line 3, column 5")
+        line_col_match = re.search(r'at line (\d+),? col(?:umn)? (\d+)', error_message)
         line_number, column_number = line_col_match.groups() if line_col_match else ("Unknown", "Unknown")
 
-        # Extract unexpected token (e.g., 'C' in "No terminal matches 'C'")
-        unexpected_token_match = re.search(r"No terminal matches '(.+?)'", error_message)
+        # Extract unexpected token (e.g., 'C' in "No terminal matches 'C'" or "Unexpected token Token('ID', 'C')")
+        unexpected_token_match = (re.search(r"No terminal matches '(.+?)'", error_message)
+                                  or re.search(r"Unexpected token Token\('\w+', '(.*?)'\)", error_message))
         unexpected_token = unexpected_token_match.group(1) if unexpected_token_match else "Unknown"
 
         # Extract expected tokens list
@@ -135,5 +217,5 @@ class ErrorHandler:
         try:
             return self.retriever.retrieve_by_keyword(keyword)
         except Exception as e:
-            print(f"Error retrieving example: {e}")
+            logger.warning("Error retrieving example: %s", e)
             return None
@@ -1,9 +1,20 @@
 # feedback_loop.py - Iterative feedback and regeneration
 
+import logging
 import time
+from src.instrumentation import get_instrumentation, span
+from src.validation.streaming import CodeFenceDetector
+
+logger = logging.getLogger(__name__)
+
+def print_chunk(text):
+    """Echo a streamed response chunk to stdout."""
+    print(text, end='', flush=True)
 
 class FeedbackLoop:
-    def __init__(self, llm_client, validator, error_handler, max_iterations=3):
+    def __init__(self, llm_client, validator, error_handler, max_iterations=3, on_chunk=print_chunk,
+                 early_stop=True, max_response_tokens=None, incremental_validation=True,
+                 collect_all_errors=True):
         """
         Initialize the feedback loop.
         
@@ -12,11 +23,28 @@ class FeedbackLoop:
             validator: OML validator
             error_handler: Error handler for feedback
             max_iterations (int): Maximum iterations
+            on_chunk: Callable receiving each streamed response chunk (None to
+                stream silently)
+            early_stop (bool): Stop streaming once the code block is closed
+            max_response_tokens (int): Optional response limit passed to the
+                model (num_predict); tokens saved by an early stop are
+                measured against it
+            incremental_validation (bool): Parse the code while it streams
+                and stop as soon as it can no longer become valid OML (needs
+                a validator with incremental())
+            collect_all_errors (bool): Report every syntax error of a
+                candidate in one debugging prompt instead of only the first
+                (needs a validator with check(code, recover=True))
         """
         self.llm_client = llm_client
         self.validator = validator
         self.error_handler = error_handler
         self.max_iterations = max_iterations
+        self.on_chunk = on_chunk
+        self.early_stop = early_stop
+        self.max_response_tokens = max_response_tokens
+        self.incremental_validation = incremental_validation
+        self.collect_all_errors = collect_all_errors
         
     def generate_and_refine(self, query, instruction_prompt=None):
         """
@@ -32,73 +60,199 @@ class FeedbackLoop:
         iterations = 0
         previous_code = None
         previous_error = None
+        previous_errors = None
         
         while iterations < self.max_iterations:
-            # Create messages
-            messages = [
-                {'role': 'system', 'content': instruction_prompt or "You are an OML code generation assistant."},
-                {'role': 'user', 'content': query}
-            ]
-            
-            # Add debugging info from previous iteration if available
-            if previous_code and previous_error:
-                error_info = self.error_handler.process_error(previous_code, previous_error)
-                debugging_prompt = self.error_handler.format_debugging_prompt(error_info)
-                messages.append({'role': 'system', 'content': debugging_prompt})
-            
-            # Generate response
-            print(f"\nAttempt {iterations + 1}/{self.max_iterations}...")
-            response = self.generate_response(messages)
-            
-            # Extract code
-            oml_code = self.validator.extract_code_from_response(response)
-            
-            if not oml_code:
-                print("No OML code found in response")
-                iterations += 1
-                continue
-                
-            # Validate code
-            is_valid, result = self.validator.validate(oml_code)
-            
-            if is_valid:
-                print("\nValid OML code generated!")
+            with span('feedback_iteration', iteration=iterations + 1) as iteration_span:
+                outcome, oml_code, result, errors = self._iterate(query, instruction_prompt, previous_code,
+                                                                  previous_error, previous_errors, iterations)
+                iteration_span.set(outcome=outcome)
+            get_instrumentation().increment('oml_feedback_iterations_total', outcome=outcome)
+
+            if outcome == 'valid':
+                logger.info("Valid OML code generated!")
                 return oml_code, iterations + 1, True
-            else:
-                print(f"\nInvalid OML code. Error: {result}")
+
+            if outcome == 'invalid':
+                logger.info("Invalid OML code. Error: %s", result)
+                if errors and len(errors) > 1:
+                    logger.info("%d syntax errors found in one pass", len(errors))
                 previous_code = oml_code
                 previous_error = result
-                iterations += 1
+                previous_errors = errors
+            iterations += 1
                 
         # Max iterations reached
-        print(f"\nMaximum iterations ({self.max_iterations}) reached without success.")
+        logger.warning("Maximum iterations (%d) reached without success.", self.max_iterations)
         return previous_code, iterations, False
+
+    def _iterate(self, query, instruction_prompt, previous_code, previous_error, previous_errors, iterations):
+        """
+        Run one generate-and-validate attempt.
+        
+        Args:
+            query (str): User query
+            instruction_prompt (str): Optional instruction prompt
+            previous_code (str): Code from the previous invalid attempt
+            previous_error (str): Validation error of the previous attempt
+            previous_errors (list): Every syntax error of the previous
+                attempt as structured records, or None
+            iterations (int): Attempts made so far
+            
+        Returns:
+            tuple: (outcome, oml_code, result, errors) where outcome is
+                'valid', 'invalid' or 'no_code', and errors lists every
+                syntax error of invalid code when they could be collected
+        """
+        # Create messages
+        messages = [
+            {'role': 'system', 'content': instruction_prompt or "You are an OML code generation assistant."},
+            {'role': 'user', 'content': query}
+        ]
+        
+        # Add debugging info from previous iteration if available
+        if previous_code and previous_error:
+            with span('prompt_build', kind='debugging'):
+                if previous_errors and len(previous_errors) > 1:
+                    error_infos = self.error_handler.process_errors(previous_code, previous_errors)
+                    debugging_prompt = self.error_handler.format_errors_prompt(error_infos)
+                else:
+                    error_info = self.error_handler.process_error(previous_code, previous_error)
+                    debugging_prompt = self.error_handler.format_debugging_prompt(error_info)
+            messages.append({'role': 'system', 'content': debugging_prompt})
+        
+        # Generate response
+        logger.info("Attempt %d/%d...", iterations + 1, self.max_iterations)
+        response, abort = self._generate(messages)
+        
+        # The stream was cut at invalid code; repair it from the parser error
+        if abort is not None:
+            oml_code, error = abort
+            logger.info("Generation stopped at invalid code")
+            return 'invalid', oml_code, error, None
+            
+        # Extract code
+        oml_code = self.validator.extract_code_from_response(response)
+        
+        if not oml_code:
+            logger.warning("No OML code found in response")
+            return 'no_code', None, None, None
+            
+        # Validate code
+        is_valid, result = self.validator.validate(oml_code)
+        if is_valid:
+            return 'valid', oml_code, result, None
+        return 'invalid', oml_code, result, self._collect_errors(oml_code)
+        
+    def _collect_errors(self, oml_code):
+        """Every syntax error of invalid code, or None if the validator cannot recover from errors."""
+        check = getattr(self.validator, 'check', None)
+        if not self.collect_all_errors or check is None:
+            return None
+        return check(oml_code, recover=True).get('errors')
     
     def generate_response(self, messages):
         """
         Generate response from LLM.
         
+        With early_stop, the stream is cut as soon as the code block is
+        closed: the rest of the generation is cancelled and the response
+        ends at the closing fence. Each streamed chunk counts as one token.
+        
         Args:
             messages (list): List of message dictionaries
             
         Returns:
             str: LLM response
         """
+        return self._generate(messages)[0]
+        
+    def _generate(self, messages):
+        """
+        Stream a response, cutting it short at the closing fence or at invalid code.
+        
+        Args:
+            messages (list): List of message dictionaries
+            
+        Returns:
+            tuple: (response, abort) where abort is (partial_code, error) if
+                incremental validation stopped the stream, otherwise None
+        """
+        instrumentation = get_instrumentation()
+        options = {'num_predict': self.max_response_tokens} if self.max_response_tokens else None
+        start = time.perf_counter()
         try:
             # Stream response for better user experience
+            detector = CodeFenceDetector()
+            incremental = self._start_incremental()
+            code_fed = 0
             full_response = ""
-            for chunk in self.llm_client.chat(
-                model="mistral",  # Or dynamic model parameter
-                messages=messages,
-                stream=True
-            ):
-                message = chunk['message']['content']
-                full_response += message
-                print(message, end='', flush=True)
+            tokens = 0
+            stop_reason = None
+            with span('llm_total', stream=True) as llm_span:
+                stream = self._chat(messages, options, stream=True)
+                for chunk in stream:
+                    if tokens == 0:
+                        instrumentation.record('llm_first_token', time.perf_counter() - start)
+                    tokens += 1
+                    message = chunk['message']['content']
+                    
+                    if detector.feed(message) is not None:
+                        if self.early_stop:
+                            # Echo up to the closing fence and cancel the rest of the generation
+                            message = message[:len(message) - (len(detector.text) - detector.end)]
+                            stop_reason = 'fence'
+                    elif incremental is not None and detector.code_start is not None:
+                        code = detector.partial_code()
+                        if not incremental.feed(code[code_fed:]):
+                            stop_reason = 'invalid'
+                        code_fed = len(code)
+                        
+                    full_response += message
+                    if self.on_chunk is not None and message:
+                        self.on_chunk(message)
+                    if stop_reason is not None:
+                        close = getattr(stream, 'close', None)
+                        if close is not None:
+                            close()
+                        break
+                        
+                llm_span.set(chars=len(full_response), tokens=tokens, stopped_early=stop_reason is not None)
+                if stop_reason is not None:
+                    llm_span.set(stop_reason=stop_reason)
+                    instrumentation.increment('oml_llm_early_stops_total')
+                    if stop_reason == 'invalid':
+                        instrumentation.increment('oml_incremental_aborts_total')
+                    if self.max_response_tokens:
+                        tokens_saved = max(self.max_response_tokens - tokens, 0)
+                        llm_span.set(tokens_saved=tokens_saved)
+                        instrumentation.increment('oml_llm_tokens_saved_total', tokens_saved)
+                        logger.debug("Stopped after %d tokens, %d tokens saved", tokens, tokens_saved)
                 
-            return full_response
+            if stop_reason == 'invalid':
+                return full_response, (incremental.text, incremental.error_message())
+            return full_response, None
         except Exception as e:
-            print(f"Error generating response: {e}")
+            logger.warning("Error generating response: %s", e)
             # Fallback - non-streaming response
-            response = self.llm_client.chat(model="mistral", messages=messages)
-            return response['message']['content']
+            with span('llm_total', stream=False):
+                response = self._chat(messages, options)
+            return response['message']['content'], None
+            
+    def _start_incremental(self):
+        """Incremental parse for the next response, or None if disabled or unsupported."""
+        if not self.incremental_validation:
+            return None
+        incremental = getattr(self.validator, 'incremental', None)
+        return incremental() if incremental is not None else None
+        
+    def _chat(self, messages, options, stream=False):
+        """Call the LLM client, passing options only when there are any."""
+        kwargs = {'options': options} if options else {}
+        if stream:
+            kwargs['stream'] = True
+        return self.llm_client.chat(
+            model="mistral",  # Or dynamic model parameter
+            messages=messages,
+            **kwargs
+        )
@@ -0,0 +1,116 @@
+# incremental.py - Validate OML while it is being generated
+
+from copy import copy
+from lark import UnexpectedCharacters, UnexpectedInput, UnexpectedToken
+from lark.lexer import LexerThread
+
+WHITESPACE = ' \t\r\n'
+
+class IncrementalParse:
+    """
+    Feeds streamed OML code into Lark's interactive LALR parser.
+
+    Only tokens that end before the last whitespace of the stream are given
+    to the parser, because the last word may still grow (e.g. "xsd:"
+    becoming "xsd:string"). The parser and lexer positions after the last accepted
+    token are kept as a checkpoint, so each chunk is lexed once. As soon as
+    a complete token cannot continue the parse, the prefix can no longer be
+    extended to valid OML and feed() returns False.
+
+    The LALR contextual lexer decides here, so code that only the Earley
+    fallback of OMLValidator would accept is reported as a dead prefix.
+    """
+
+    def __init__(self, parser, start='ontology'):
+        """
+        Start an incremental parse.
+
+        Args:
+            parser: Lark LALR parser
+            start (str): Start rule
+        """
+        interactive = parser.parse_interactive('', start=start)
+        self.text = ''
+        self.error = None
+        self.tokens = 0
+        self._interactive = interactive
+        self._lexer = interactive.lexer_thread.lexer
+        self._line_ctr = copy(interactive.lexer_thread.state.line_ctr)
+        self._last_token = None
+
+    @property
+    def alive(self):
+        """Whether the code seen so far can still be completed to valid OML."""
+        return self.error is None
+
+    def feed(self, chunk):
+        """
+        Add a chunk of code and parse every token that is now complete.
+
+        Args:
+            chunk (str): Next piece of the code
+
+        Returns:
+            bool: False once the prefix can no longer be extended to valid OML
+        """
+        self.text += chunk
+        if self.error is not None:
+            return False
+
+        # Tokens ending at or before the last whitespace cannot change any more
+        boundary = max(self.text.rfind(char) for char in WHITESPACE)
+        if boundary < self._line_ctr.char_pos:
+            return True
+
+        try:
+            for token in self._lex():
+                if token.end_pos > boundary or self._opens_long_string(token):
+                    break
+                self._interactive.feed_token(token)
+                self.tokens += 1
+                self._line_ctr = copy(self._interactive.lexer_thread.state.line_ctr)
+                self._last_token = token
+        except UnexpectedCharacters as e:
+            # An unterminated string may still be closed by later chunks
+            if e.pos_in_stream < boundary and self.text[e.pos_in_stream] not in '"\'':
+                self.error = e
+        except UnexpectedToken as e:
+            if e.token.end_pos is None or e.token.end_pos <= boundary:
+                self.error = e
+        return self.error is None
+
+    def finish(self):
+        """
+        Parse the rest of the code and the end of input.
+
+        Returns:
+            tuple: (is_valid, result) - Boolean and parse tree or error message
+        """
+        if self.error is None:
+            try:
+                for token in self._lex():
+                    self._interactive.feed_token(token)
+                    self.tokens += 1
+                    self._last_token = token
+                return True, self._interactive.feed_eof(self._last_token)
+            except UnexpectedInput as e:
+                self.error = e
+        return False, str(self.error)
+
+    def error_message(self):
+        """The error with the offending line of code, or None while the prefix is valid."""
+        if self.error is None:
+            return None
+        return f"{self.error}\n{self.error.get_context(self.text)}"
+
+    def _opens_long_string(self, token):
+        """Whether a token is an empty string whose next quote opens a triple-quoted string."""
+        return token.value in ('""', "''") and self.text[token.end_pos:token.end_pos + 1] == token.value[0]
+
+    def _lex(self):
+        """Lex the code from the checkpoint in the parser's current context."""
+        thread = LexerThread.from_text(self._lexer, self.text)
+        thread.state.line_ctr = copy(self._line_ctr)
+        thread.state.last_token = self._last_token
+        self._interactive.lexer_thread = thread
+        return thread.lex(self._interactive.parser_state)
@@ -0,0 +1,113 @@
+# parser_cache.py - Compiled Lark parsers shared per process and cached on disk
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import lark
+from lark import Lark
+
+logger = logging.getLogger(__name__)
+
+PARSER_CACHE_ENV = 'OML_PARSER_CACHE_DIR'
+
+_parsers = {}
+_lock = threading.Lock()
+
+def default_cache_dir():
+    """Directory for compiled parsers ($OML_PARSER_CACHE_DIR or ~/.cache/oml-copilot/parsers)."""
+    cache_dir = os.environ.get(PARSER_CACHE_ENV)
+    if cache_dir:
+        return cache_dir
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'oml-copilot', 'parsers')
+
+def parser_key(grammar_text, parser='lalr', start='ontology'):
+    """
+    Identify a compiled parser.
+
+    Args:
+        grammar_text (str): Grammar source
+        parser (str): Lark parser algorithm ('lalr' or 'earley')
+        start (str): Start rule
+
+    Returns:
+        str: Hex digest of the grammar text, parser options and Lark version
+    """
+    digest = hashlib.sha256()
+    for part in (grammar_text, parser, start, lark.__version__):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def get_parser(grammar_text, parser='lalr', start='ontology', cache_dir=None):
+    """
+    Get a compiled parser, building it at most once per process.
+
+    LALR parsers are also saved to cache_dir and loaded from there by later
+    processes, which takes milliseconds instead of seconds. Earley parsers
+    cannot be serialized by Lark and are only shared in memory. A grammar
+    that fails to compile fails the same way on every call without being
+    compiled again.
+
+    Args:
+        grammar_text (str): Grammar source
+        parser (str): 'lalr' or 'earley'
+        start (str): Start rule
+        cache_dir (str): Directory for compiled LALR parsers (defaults to
+            default_cache_dir(); pass False to skip the disk cache)
+
+    Returns:
+        Lark: The shared parser
+
+    Raises:
+        lark.exceptions.GrammarError: If the grammar does not compile for the parser
+    """
+    key = parser_key(grammar_text, parser, start)
+    with _lock:
+        cached = _parsers.get(key)
+        if cached is None:
+            try:
+                cached = _load_or_build(key, grammar_text, parser, start, cache_dir)
+            except Exception as e:
+                cached = e
+            _parsers[key] = cached
+    if isinstance(cached, Exception):
+        raise cached
+    return cached
+
+def clear_parser_cache():
+    """Forget the parsers of this process (the disk cache is kept)."""
+    with _lock:
+        _parsers.clear()
+
+def _load_or_build(key, grammar_text, parser, start, cache_dir):
+    """Load a compiled parser from disk, or compile it and save it."""
+    if parser != 'lalr' or cache_dir is False:
+        return Lark(grammar_text, start=start, parser=parser)
+
+    cache_dir = cache_dir or default_cache_dir()
+    cache_file = os.path.join(cache_dir, f"{key}.lark")
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as file:
+                return Lark.load(file)
+        except Exception as e:
+            logger.warning("Ignoring unreadable parser cache %s: %s", cache_file, e)
+
+    compiled = Lark(grammar_text, start=start, parser=parser)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial parser
+        descriptor, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                compiled.save(file)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning("Could not save parser cache %s: %s", cache_file, e)
+    return compiled
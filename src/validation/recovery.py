@@ -0,0 +1,148 @@
+# recovery.py - Collect every syntax error of OML code in one pass
+
+import re
+from lark import Token, UnexpectedInput
+from lark.lexer import LexerThread, LineCounter
+
+# First words of the lines that can start a top-level statement, or close the block
+STATEMENT_STARTS = frozenset([
+    '@', '}', 'aspect', 'concept', 'relation', 'scalar', 'annotation', 'rule', 'builtin', 'instance', 'ref',
+    'extends', 'uses', 'includes',
+])
+
+FIRST_WORD_PATTERN = re.compile(r'[ \t]*([@}]|[a-z]+)')
+
+MAX_ERRORS = 20
+
+def statement_starts(code):
+    """
+    Find the lines where parsing can resume after an error.
+
+    Args:
+        code (str): OML code
+
+    Returns:
+        list: Offsets of the first character of every line that starts a
+            top-level statement, and of the last of these lines if it closes
+            the vocabulary/description block
+    """
+    starts = []
+    offset = 0
+    for line in code.splitlines(True):
+        match = FIRST_WORD_PATTERN.match(line)
+        if match and match.group(1) in STATEMENT_STARTS:
+            starts.append(offset + match.start(1))
+        offset += len(line)
+    # Only the last "}" closes the block; earlier ones close braces opened by mistake (e.g. "concept A {")
+    return [start for index, start in enumerate(starts) if code[start] != '}' or index == len(starts) - 1]
+
+def recover_errors(parser, code, start='ontology', max_errors=MAX_ERRORS):
+    """
+    Parse code with an LALR parser, resynchronising at statement boundaries after each error.
+
+    The parser state is checkpointed at every line start where the statement
+    before it is complete, i.e. where the block could be closed with "}".
+    After an error, parsing resumes from the last checkpoint at the next
+    line that starts a statement. The text skipped between them is the
+    offending statement. Errors caused only by skipping it are therefore not
+    reported, and valid statements before and after it are still checked.
+
+    Args:
+        parser: Lark LALR parser
+        code (str): OML code
+        start (str): Start rule
+        max_errors (int): Stop after this many errors
+
+    Returns:
+        list: (error, statement) pairs in order of position, where error is
+            the Lark UnexpectedInput and statement the text that was skipped
+            (empty if the code is valid)
+    """
+    interactive = parser.parse_interactive(code, start=start)
+    lexer = interactive.lexer_thread.lexer
+    resume_points = statement_starts(code)
+    close_terminal = _close_terminal(parser)
+
+    errors = []
+    checkpoint = None
+    resume_at = 0
+    while True:
+        line_ctr = LineCounter('\n')
+        line_ctr.feed(code[:resume_at])
+        thread = LexerThread.from_text(lexer, code)
+        thread.state.line_ctr = line_ctr
+        interactive.lexer_thread = thread
+        state = interactive.parser_state
+        last_token = None
+        feeding = None
+        try:
+            for token in thread.lex(state):
+                if _starts_line(code, token.start_pos) and _can_close(state, close_terminal, token):
+                    checkpoint = (token.start_pos, state.copy(deepcopy_values=False))
+                feeding = token
+                state.feed_token(token)
+                feeding = None
+                last_token = token
+        except UnexpectedInput as e:
+            error = e
+            if feeding is None and _starts_line(code, e.pos_in_stream):
+                # The lexer rejected the first word of a line, before the state could be checkpointed
+                at_error = Token(close_terminal, '}', start_pos=e.pos_in_stream, line=e.line, column=e.column)
+                if _can_close(state, close_terminal, at_error):
+                    checkpoint = (e.pos_in_stream, state.copy(deepcopy_values=False))
+        else:
+            try:
+                end_token = Token.new_borrow_pos('$END', '', last_token) if last_token else Token('$END', '')
+                state.feed_token(end_token, True)
+            except UnexpectedInput as e:
+                # Nothing follows the end of input to resume at
+                checkpoint_position = checkpoint[0] if checkpoint else 0
+                errors.append((e, code[checkpoint_position:].strip()))
+            return errors
+
+        position = error.pos_in_stream
+        if checkpoint is None:
+            errors.append((error, _line_at(code, position)))
+            return errors
+
+        checkpoint_position, checkpoint_state = checkpoint
+        if position > checkpoint_position and position in resume_points:
+            # The statement before this one was left unfinished
+            resume_at = position
+        else:
+            resume_at = next((point for point in resume_points if point > position), None)
+        errors.append((error, code[checkpoint_position:resume_at].strip()))
+        if resume_at is None or len(errors) >= max_errors:
+            return errors
+        interactive.parser_state = checkpoint_state.copy(deepcopy_values=False)
+
+def _close_terminal(parser):
+    """Name of the terminal for "}" in the parser's grammar."""
+    for terminal in parser.terminals:
+        if getattr(terminal.pattern, 'value', None) == '}':
+            return terminal.name
+    return 'RBRACE'
+
+def _can_close(state, close_terminal, token):
+    """
+    Whether the block could be closed before a token, i.e. no statement is left unfinished.
+
+    The "}" is fed to a copy of the state, because LALR parse tables may
+    reduce on a lookahead that later turns out not to be shiftable.
+    """
+    probe = state.copy(deepcopy_values=False)
+    try:
+        probe.feed_token(Token.new_borrow_pos(close_terminal, '}', token))
+    except UnexpectedInput:
+        return False
+    return True
+
+def _starts_line(code, position):
+    """Whether only whitespace precedes a position on its line."""
+    return not code[code.rfind('\n', 0, position) + 1:position].strip()
+
+def _line_at(code, position):
+    """The line of code containing a position."""
+    start = code.rfind('\n', 0, position) + 1
+    end = code.find('\n', position)
+    return code[start:end if end >= 0 else len(code)].strip()
@@ -0,0 +1,215 @@
+# result_cache.py - Content-addressed cache of OML validation results
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+VALIDATION_CACHE_ENV = 'OML_VALIDATION_CACHE'
+
+class ValidationCache:
+    """
+    Bounded cache of validation verdicts keyed by a hash of grammar and code.
+
+    Entries are plain dictionaries with the verdict and the structured error
+    (message, line, column, offending token, expected terminals). They are
+    kept in an in-memory LRU tier and, when cache_path is given, in a SQLite
+    tier that outlives the process and is shared by everything that opens
+    the same file. Parse trees are only kept in memory, and only with
+    keep_trees=True; the disk tier never stores them. The cache holds its own
+    deep copies, so callers may modify the entries and trees they get back.
+    """
+
+    def __init__(self, capacity=1024, cache_path=None, max_disk_entries=None, keep_trees=False):
+        """
+        Initialize the validation cache.
+
+        Args:
+            capacity (int): Maximum number of results held in memory
+            cache_path (str): Optional SQLite file for the on-disk tier
+            max_disk_entries (int): Maximum number of results on disk (None for unbounded)
+            keep_trees (bool): Also keep the parse trees of valid code in memory
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.cache_path = cache_path
+        self.max_disk_entries = max_disk_entries
+        self.keep_trees = keep_trees
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        if cache_path is not None:
+            if cache_path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, result TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+            self._connection.commit()
+
+    @staticmethod
+    def make_key(namespace, code):
+        """
+        Build the cache key for a piece of code.
+
+        Args:
+            namespace (str): Identifies the grammar and parser mode (see
+                OMLValidator.cache_namespace)
+            code (str): Validated code
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        for part in (namespace, code):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result, in memory first and then on disk.
+
+        Args:
+            key (str): Key from make_key
+
+        Returns:
+            dict: A copy of the cached result (with 'tree' only if one was
+                kept), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry)
+
+            if self._connection is not None:
+                row = self._connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._connection.commit()
+                    entry = json.loads(row[0])
+                    self._remember(key, copy.deepcopy(entry))
+                    self.disk_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result, tree=None):
+        """
+        Store a result in memory and on disk.
+
+        Args:
+            key (str): Key from make_key
+            result (dict): JSON-serializable verdict and error information
+            tree: Parse tree of valid code, kept in memory only with keep_trees
+                (a 'tree' in result is ignored)
+
+        Returns:
+            dict: The entry, whose result and tree the cache keeps copies of
+        """
+        result = {name: value for name, value in result.items() if name != 'tree'}
+        entry = dict(result)
+        if tree is not None and self.keep_trees:
+            entry['tree'] = tree
+        stored = copy.deepcopy(entry)
+        with self._lock:
+            self._remember(key, stored)
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO results (key, result, last_used) VALUES (?, ?, ?)",
+                    (key, json.dumps(result), time.time())
+                )
+                self._evict_disk()
+                self._connection.commit()
+        return entry
+
+    def clear(self):
+        """Drop every cached result, in memory and on disk, and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM results")
+                self._connection.commit()
+
+    def close(self):
+        """Close the on-disk tier."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        Returns:
+            dict: Memory and disk hits, misses, hit rate, current size and capacity
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'capacity': self.capacity,
+            }
+
+    def _remember(self, key, entry):
+        """Add an entry to the memory tier, evicting the least recently used one if full."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete the least recently used results above max_disk_entries."""
+        if self.max_disk_entries is None:
+            return
+
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY last_used ASC, rowid ASC LIMIT ?)", (excess,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+_validation_cache = None
+_validation_cache_lock = threading.Lock()
+
+def get_validation_cache():
+    """
+    The process-wide ValidationCache used by OMLValidator by default.
+
+    It is memory-only unless $OML_VALIDATION_CACHE names a SQLite file for
+    the on-disk tier.
+    """
+    global _validation_cache
+    with _validation_cache_lock:
+        if _validation_cache is None:
+            _validation_cache = ValidationCache(cache_path=os.environ.get(VALIDATION_CACHE_ENV) or None)
+        return _validation_cache
@@ -0,0 +1,403 @@
+# statements.py - Statement-level incremental validation of OML documents
+
+import re
+import threading
+from collections import OrderedDict
+from lark import Token, Tree, UnexpectedInput, UnexpectedToken
+from lark.lexer import LexerThread, LineCounter
+from lark.parsers.lalr_interactive_parser import InteractiveParser
+from src.instrumentation import get_instrumentation, span
+from src.validation.recovery import STATEMENT_STARTS, _close_terminal
+
+# First words of the import lines that belong to the header
+IMPORT_WORDS = frozenset(['extends', 'uses', 'includes'])
+
+# Strings, comments and IRIs are skipped whole, so brackets and line starts inside them are ignored.
+# Line breaks are only matched before the first word of a statement, captured in the 'word' group.
+SCAN_PATTERN = re.compile(
+    r'"""[\s\S]*?(?:"""|$)|\'\'\'[\s\S]*?(?:\'\'\'|$)'
+    r'|"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?'
+    r'|//[^\n]*|<[^>\s]*>|[\[\]{]'
+    r'|\n(?=[ \t]*(?P<word>[@}]|(?:' + '|'.join(sorted(w for w in STATEMENT_STARTS if w.isalpha())) + r')(?![a-z])))'
+)
+
+def split_statements(code):
+    """
+    Split a vocabulary or description into its header, top-level statements and closing brace.
+
+    Statements start at lines outside brackets whose first word starts a
+    top-level statement. Annotation lines start the statement they
+    annotate. The header is everything before the first statement (the
+    annotations, the opening line and the imports) and the footer starts
+    at the last line that closes the block.
+
+    Args:
+        code (str): OML code
+
+    Returns:
+        tuple: (starts, footer) - Offsets of the first character of the line
+            of each statement, and of the closing line (len(code) if there
+            is none); the header ends where the first statement or the
+            footer starts
+    """
+    starts = []
+    footer = None
+    opened = False
+    depth = 0
+    previous_word = None
+    for match in SCAN_PATTERN.finditer(code):
+        text = match.group()
+        if text == '[':
+            depth += 1
+        elif text == ']':
+            depth = max(depth - 1, 0)
+        elif text == '{':
+            opened = True
+        elif text == '\n' and opened and depth == 0:
+            word = match.group('word')
+            if word == '}':
+                footer = match.end()
+            elif word in IMPORT_WORDS:
+                # Imports belong to the header, and a misplaced one to the statement before it
+                continue
+            else:
+                footer = None
+                # Consecutive annotations and the statement they annotate are one statement
+                if previous_word != '@':
+                    starts.append(match.end())
+            previous_word = word
+    return starts, footer if footer is not None else len(code)
+
+class StatementValidator:
+    """
+    Validates a document statement by statement, reusing the results of unchanged statements.
+
+    The header is parsed once with the LALR parser and its parser state is
+    kept. Each statement is then parsed from a copy of that state, and the
+    result is cached by the statement's text and the header's LALR state.
+    After an edit, only the statements whose text changed and the header
+    are parsed again, so validating a small edit in a large vocabulary
+    takes about the same time as validating the edited statement.
+
+    The parse tree of a valid document is assembled from the header's and
+    the statements' trees; tokens of cached statements keep the positions
+    they had in their statement. Errors are reported where the full LALR
+    parse would report them.
+    """
+
+    def __init__(self, validator, capacity=4096):
+        """
+        Initialize the statement validator.
+
+        Args:
+            validator (OMLValidator): Validator whose LALR parser parses the
+                statements
+            capacity (int): Maximum number of cached statement results
+        """
+        if validator.lalr_parser is None:
+            raise ValueError("Statement-level validation needs an LALR parser")
+        self.validator = validator
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        parser = validator.lalr_parser
+        self._interactive = parser.parse_interactive('', start='ontology')
+        self._lexer = self._interactive.lexer_thread.lexer
+        self._close_terminal = _close_terminal(parser)
+        self._header = None
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, oml_code, return_tree=True):
+        """
+        Validate OML code, parsing only what changed since earlier calls.
+
+        Code the validator's result cache has seen is a lookup, as with
+        OMLValidator.validate; the results are shared with it.
+
+        Args:
+            oml_code (str): OML code to validate
+            return_tree (bool): Return the parse tree of valid code (None otherwise)
+
+        Returns:
+            tuple: (is_valid, result) - Boolean and parse tree or the message
+                of the first error
+        """
+        return self.validator._cached_validate(oml_code, return_tree, self._validate)
+
+    def _validate(self, oml_code):
+        """Parse the code, returning (is_valid, result, error) like OMLValidator._validate."""
+        tree, errors = self.parse(oml_code)
+        if errors:
+            return False, str(errors[0][0]), errors[0][0]
+        return True, tree, None
+
+    def parse(self, oml_code):
+        """
+        Parse OML code statement by statement.
+
+        Args:
+            oml_code (str): OML code
+
+        Returns:
+            tuple: (tree, errors) - Parse tree (None if invalid) and a list of
+                (error, statement) pairs in order of position, with every
+                broken statement and its Lark UnexpectedInput
+        """
+        starts, footer = split_statements(oml_code)
+        header_end = starts[0] if starts else footer
+        header_text = oml_code[:header_end]
+        with span('parse_validate', chars=len(oml_code), statements=len(starts)) as validate_span:
+            header = self._parse_header(header_text)
+            if header['error'] is not None:
+                validate_span.set(valid=False, reparsed=0)
+                return None, [(header['error'], header_text.strip())]
+
+            errors = []
+            statement_trees = []
+            reparsed = 0
+            # The last token so far, with the offset and line count of its statement
+            last = (header['last'], 0, 0)
+            last_state = header['state']
+            line = 1 + header_text.count('\n')
+            if not header['complete']:
+                error = self._continue(header['state'], oml_code, header_end, line, header['last'])
+                errors.append((error, header_text.strip()))
+            for start, end in zip(starts, starts[1:] + [footer]):
+                text = oml_code[start:end]
+                entry, parsed = self._statement(header, text)
+                reparsed += parsed
+                previous = last
+                if entry['last'] is not None:
+                    last = (entry['last'], start, line - 1)
+                next_line = line + text.count('\n')
+                if entry['error'] is not None:
+                    error = _shifted(entry['error'], start, line - 1, _shifted_token(*previous))
+                    errors.append((error, text.strip()))
+                elif entry['trees'] is None:
+                    error = self._continue(entry['state'], oml_code, end, next_line, _shifted_token(*last))
+                    errors.append((error, text.strip()))
+                else:
+                    statement_trees.extend(entry['trees'])
+                    last_state = entry['state']
+                line = next_line
+            if any(error is None for error, _ in errors):
+                # A statement went on past a line that looked like the start of the next one
+                validate_span.set(split=False)
+                return self._parse_whole(oml_code)
+
+            footer_error = self._continue(last_state, oml_code, footer, line, _shifted_token(*last))
+            if footer_error is not None and not (errors and errors[-1][0].pos_in_stream >= footer):
+                errors.append((footer_error, oml_code[footer:].strip()))
+
+            validate_span.set(valid=not errors, reparsed=reparsed)
+            get_instrumentation().increment('oml_statements_reparsed_total', reparsed)
+        if errors:
+            return None, errors
+        return _assemble(header['tree'], header['children'], statement_trees), []
+
+    def clear(self):
+        """Drop every cached statement result and reset the counters."""
+        with self._lock:
+            self._header = None
+            self._statements.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Report statement cache usage.
+
+        Returns:
+            dict: Hits, misses, current size and capacity
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._statements),
+                'capacity': self.capacity,
+            }
+
+    def _parse_header(self, text):
+        """
+        Parse the header, or reuse the last one if it did not change.
+
+        Returns:
+            dict: 'key' (the LALR state stack statements are parsed from),
+                'state', 'last' (its last token), 'complete' (whether the block could be closed after
+                it), 'tree' and 'children' (the tree of the header with an
+                empty body and the number of children of its body), and
+                'error' (an UnexpectedInput, or None)
+        """
+        with self._lock:
+            if self._header is not None and self._header[0] == text:
+                return self._header[1]
+
+        state = self._interactive.parser_state.copy(deepcopy_values=False)
+        header = {'key': None, 'state': state, 'last': None, 'complete': False, 'tree': None, 'children': 0,
+                  'error': None}
+        thread = self._lex(text)
+        try:
+            for token in thread.lex(state):
+                state.feed_token(token)
+                header['last'] = token
+        except UnexpectedInput as e:
+            header['error'] = self._with_parser(e, state, thread)
+        else:
+            header['key'] = tuple(state.state_stack)
+            tree = self._close(state.copy(deepcopy_values=True))
+            if tree is not None:
+                header.update(complete=True, tree=tree, children=len(_body(tree).children))
+
+        with self._lock:
+            self._header = (text, header)
+        return header
+
+    def _statement(self, header, text):
+        """
+        Parse a statement after the header, or look up its cached result.
+
+        Returns:
+            tuple: (entry, parsed) - 'error' (positioned in the statement),
+                'trees' (its statement trees, None if it is incomplete),
+                'state' (the parser after it) and 'last' (its last token);
+                parsed is 1 if it was parsed
+        """
+        key = (header['key'], text)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is not None:
+                self._statements.move_to_end(key)
+                self.hits += 1
+                return entry, 0
+            self.misses += 1
+
+        # Lark extends the children of left-recursive rules in place, so the header's values are never shared
+        state = header['state'].copy(deepcopy_values=True)
+        entry = {'error': None, 'trees': None, 'state': state, 'last': None}
+        thread = self._lex(text)
+        try:
+            for token in thread.lex(state):
+                state.feed_token(token)
+                entry['last'] = token
+        except UnexpectedInput as e:
+            entry['error'] = self._with_parser(e, state, thread)
+        else:
+            # The statement's trees share values with its state, which is only ever parsed on from a deep copy
+            tree = self._close(state.copy(deepcopy_values=False))
+            if tree is not None:
+                entry['trees'] = _body(tree).children[header['children']:]
+
+        with self._lock:
+            self._statements[key] = entry
+            while len(self._statements) > self.capacity:
+                self._statements.popitem(last=False)
+        return entry, 1
+
+    def _continue(self, state, code, position, line, last_token):
+        """
+        Parse the rest of the code from a position, after a parser state.
+
+        After a statement that leaves the block unclosable, the full parse
+        fails on the next token, which is then the only one lexed here.
+
+        Args:
+            state: Parser state before the position
+            code (str): OML code
+            position (int): Offset of the first character to parse
+            line (int): Line number of the position
+            last_token (Token): Token before the position, for the position of
+                the end of input
+
+        Returns:
+            UnexpectedInput: The first error, or None if the rest parses
+        """
+        state = state.copy(deepcopy_values=True)
+        thread = self._lex(code, position, line)
+        thread.state.last_token = last_token
+        try:
+            for token in thread.lex(state):
+                state.feed_token(token)
+                last_token = token
+            end_token = Token.new_borrow_pos('$END', '', last_token) if last_token else Token('$END', '', 0, 1, 1)
+            state.feed_token(end_token, True)
+        except UnexpectedInput as e:
+            return self._with_parser(e, state, thread)
+        return None
+
+    def _parse_whole(self, oml_code):
+        """Parse the whole document, for code that statement boundaries cannot split."""
+        try:
+            return self.validator.lalr_parser.parse(oml_code), []
+        except UnexpectedInput as e:
+            return None, [(e, '')]
+
+    def _close(self, state):
+        """Close the document after a parser state, returning its tree, or None if it cannot be closed."""
+        try:
+            state.feed_token(Token(self._close_terminal, '}'))
+            return state.feed_token(Token('$END', ''), True)
+        except UnexpectedInput:
+            return None
+
+    def _lex(self, text, position=0, line=1):
+        """Lexer thread over text from a position at the start of a line or at the end of text."""
+        line_ctr = LineCounter('\n')
+        line_ctr.char_pos = position
+        line_ctr.line = line
+        line_ctr.line_start_pos = text.rfind('\n', 0, position) + 1
+        line_ctr.column = position - line_ctr.line_start_pos + 1
+        thread = LexerThread.from_text(self._lexer, text)
+        thread.state.line_ctr = line_ctr
+        return thread
+
+    def _with_parser(self, error, state, thread):
+        """Attach an interactive parser to an error, so its message lists the acceptable tokens."""
+        if isinstance(error, UnexpectedToken) and error.interactive_parser is None:
+            error.interactive_parser = InteractiveParser(self._interactive.parser, state, thread)
+        return error
+
+def _shifted(error, offset, lines, previous_token):
+    """
+    A copy of an error in a statement, moved to the statement's position in the code.
+
+    The statement was lexed on its own, so an error on its first token has
+    no previous token; it is the last token of the code before it.
+    """
+    if not offset:
+        return error
+    # Exceptions cannot be copied with copy(), because their constructors take arguments
+    shifted = error.__class__.__new__(error.__class__)
+    shifted.__dict__.update(error.__dict__)
+    shifted.line = error.line + lines
+    shifted.pos_in_stream = error.pos_in_stream + offset
+    token = getattr(error, 'token', None)
+    if isinstance(token, Token) and token.line is not None:
+        shifted.token = _shifted_token(token, offset, lines)
+    if getattr(error, 'token_history', None) == [None]:
+        shifted.token_history = [previous_token]
+    return shifted
+
+def _shifted_token(token, offset, lines):
+    """A copy of a token in a statement, moved to the statement's position in the code."""
+    if token is None or not offset:
+        return token
+    shifted = token.update()
+    shifted.start_pos = token.start_pos + offset
+    shifted.line = token.line + lines
+    shifted.end_pos = token.end_pos + offset if token.end_pos is not None else None
+    shifted.end_line = token.end_line + lines if token.end_line is not None else None
+    return shifted
+
+def _body(tree):
+    """The vocabulary or description node, below the single-child ontology and box nodes."""
+    while len(tree.children) == 1 and isinstance(tree.children[0], Tree):
+        tree = tree.children[0]
+    return tree
+
+def _assemble(header_tree, header_children, statement_trees):
+    """The document tree: the header's tree with the statements' trees appended to its body."""
+    if isinstance(header_tree, Tree) and len(header_tree.children) == 1 and isinstance(header_tree.children[0], Tree):
+        return Tree(header_tree.data, [_assemble(header_tree.children[0], header_children, statement_trees)])
+    return Tree(header_tree.data, header_tree.children[:header_children] + statement_trees)
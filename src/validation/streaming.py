@@ -0,0 +1,91 @@
+# streaming.py - Incremental detection of the OML code block in a streamed response
+
+import re
+
+# A fenced block with an optional language tag, as extracted by OMLValidator
+CODE_BLOCK_PATTERN = re.compile(r'```(?:[a-zA-Z]+)?\n(.*?)```', re.DOTALL)
+
+# The opening fence of such a block
+OPENING_FENCE_PATTERN = re.compile(r'```(?:[a-zA-Z]+)?\n')
+
+FENCE = '```'
+
+class CodeFenceDetector:
+    """
+    Watches a streamed response for the first complete fenced code block.
+
+    Chunks are appended with feed(). The buffer is only searched again when
+    a new ``` fence has arrived, so a long response costs one scan overall.
+    Once a block is closed, the code is the same as
+    OMLValidator.extract_code_from_response would return for the whole
+    response, and nothing after the closing fence is needed. Before that,
+    partial_code() gives the code received after the opening fence.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.code = None
+        self.code_start = None
+        self.end = None
+        self._search_from = 0
+        self._first_fence = None
+
+    @property
+    def closed(self):
+        """Whether a complete code block has been seen."""
+        return self.code is not None
+
+    def feed(self, chunk):
+        """
+        Add a chunk of the response.
+
+        Args:
+            chunk (str): Next piece of streamed text
+
+        Returns:
+            str: The code block once it is closed, otherwise None
+        """
+        if self.code is not None:
+            return self.code
+
+        previous_length = len(self.text)
+        self.text += chunk
+        if self.code_start is None:
+            if self._first_fence is None:
+                position = self.text.find(FENCE, max(previous_length - len(FENCE) + 1, 0))
+                self._first_fence = position if position >= 0 else None
+            if self._first_fence is not None:
+                # The opening fence is complete once the newline after the language tag arrives
+                opening = OPENING_FENCE_PATTERN.search(self.text, self._first_fence)
+                if opening:
+                    self.code_start = opening.end()
+
+        position = self.text.find(FENCE, self._search_from)
+        if position < 0:
+            # A fence may be split across chunks; rescan the last two characters
+            self._search_from = max(self._search_from, len(self.text) - len(FENCE) + 1)
+            return None
+
+        # Skip every fence that arrived with this chunk before matching
+        while position >= 0:
+            self._search_from = position + len(FENCE)
+            position = self.text.find(FENCE, self._search_from)
+
+        match = CODE_BLOCK_PATTERN.search(self.text)
+        if match:
+            self.code = match.group(1)
+            self.code_start = match.start(1)
+            self.end = match.end()
+        return self.code
+
+    def partial_code(self):
+        """The code received so far, or None before the opening fence is complete."""
+        if self.code is not None:
+            return self.code
+        if self.code_start is None:
+            return None
+        return self.text[self.code_start:]
+
+    def response(self):
+        """The response up to the end of the closed code block (or everything seen so far)."""
+        return self.text if self.end is None else self.text[:self.end]
@@ -1,49 +1,323 @@
 # validator.py - Grammar validation for OML code
 
-from lark import Lark, UnexpectedInput
+from lark import UnexpectedInput
+from lark.exceptions import GrammarError
+import logging
 import os
 import re
+from src.instrumentation import get_instrumentation, span
+from src.validation.constrained import GrammarConstraint
+from src.validation.incremental import IncrementalParse
+from src.validation.parser_cache import get_parser, parser_key
+from src.validation.recovery import recover_errors
+from src.validation.result_cache import ValidationCache, get_validation_cache
+from src.validation.statements import StatementValidator
+from src.validation.streaming import CODE_BLOCK_PATTERN
+
+logger = logging.getLogger(__name__)
+
+PARSER_MODES = ('auto', 'lalr', 'earley')
+
+def default_grammar_file():
+    """Path of the LALR-compatible grammar/oml3_lalr.txt used by default."""
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(root_dir, "grammar", "oml3_lalr.txt")
+
+def error_record(error, message=None):
+    """
+    Describe a Lark syntax error as plain data.
+    
+    Args:
+        error (UnexpectedInput): The parser error (None for other failures)
+        message (str): Error message (defaults to str(error))
+        
+    Returns:
+        dict: message, line, column, token (the offending text) and the
+            sorted expected terminals; line and column are None when unknown
+            or at end of input
+    """
+    if error is None:
+        return {'message': message, 'line': None, 'column': None, 'token': None, 'expected': []}
+    token = getattr(error, 'token', None)
+    if token is None:
+        token = getattr(error, 'char', None)
+    expected = getattr(error, 'expected', None) or getattr(error, 'allowed', None) or ()
+    line = getattr(error, 'line', -1)
+    column = getattr(error, 'column', -1)
+    return {
+        'message': message if message is not None else str(error),
+        'line': line if line != -1 else None,
+        'column': column if column != -1 else None,
+        'token': str(token) if token is not None else None,
+        'expected': sorted(set(expected)),
+    }
 
 class OMLValidator:
-    def __init__(self, grammar_file=None):
+    def __init__(self, grammar_file=None, parser='auto', cache_dir=None, result_cache=None):
         """
         Initialize the OML validator with grammar.
         
         Args:
-            grammar_file (str): Path to grammar file (defaults to standard location)
+            grammar_file (str): Path to grammar file (defaults to the
+                LALR-compatible grammar/oml3_lalr.txt)
+            parser (str): 'lalr', 'earley', or 'auto' to parse with LALR
+                when the grammar is LALR-compatible and with Earley otherwise
+            cache_dir (str): Directory of compiled parsers (see
+                src.validation.parser_cache; False disables the disk cache)
+            result_cache (ValidationCache): Cache of validation results
+                (defaults to the process-wide get_validation_cache(); False
+                disables caching)
         """
+        if parser not in PARSER_MODES:
+            raise ValueError(f"Unknown parser mode: {parser}")
         if grammar_file is None:
-            # Default location
-            root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            grammar_file = os.path.join(root_dir, "src", "grammar", "oml3_lark.txt")
+            grammar_file = default_grammar_file()
             
         # Load the grammar
         with open(grammar_file, "r") as file:
             self.grammar_text = file.read()
             
-        # Create the parser
-        self.parser = Lark(self.grammar_text, start='ontology')  # Adjust start rule as needed
+        # Get the compiled parsers, shared by every validator of this grammar
+        self.parser_mode = parser
+        self.lalr_parser = None
+        self._earley_parser = None
+        if parser != 'earley':
+            try:
+                self.lalr_parser = get_parser(self.grammar_text, 'lalr', cache_dir=cache_dir)
+            except GrammarError:
+                if parser == 'lalr':
+                    raise
+                logger.info("Grammar %s is not LALR-compatible, using Earley", grammar_file)
+        self.parser = self.lalr_parser or self.earley_parser
         
-    def validate(self, oml_code):
+        # Results are keyed by grammar and parser mode as well as the code
+        if result_cache is None:
+            result_cache = get_validation_cache()
+        self.result_cache = result_cache if result_cache is not False else None
+        self.cache_namespace = parser_key(self.grammar_text, parser, 'ontology')
+        self._constraint = None
+        
+    @property
+    def earley_parser(self):
+        """Earley parser for the grammar, built on first use."""
+        if self._earley_parser is None:
+            self._earley_parser = get_parser(self.grammar_text, 'earley')
+        return self._earley_parser
+        
+    def incremental(self):
+        """
+        Start validating code that is still being generated.
+        
+        Returns:
+            IncrementalParse: Parse to feed() code chunks into, or None if the
+                grammar has no LALR parser
+        """
+        if self.lalr_parser is None or self.parser_mode == 'earley':
+            return None
+        return IncrementalParse(self.lalr_parser)
+        
+    def constraint(self):
+        """
+        Grammar constraint for decoding with a local token-level model.
+        
+        The constraint and its cache of allowed terminals are shared by
+        every call, so wrap it in a TokenConstraint per vocabulary.
+        
+        Returns:
+            GrammarConstraint: Constraint over this grammar, or None if the
+                grammar has no LALR parser
+        """
+        if self.lalr_parser is None or self.parser_mode == 'earley':
+            return None
+        if self._constraint is None:
+            self._constraint = GrammarConstraint(self.lalr_parser)
+        return self._constraint
+        
+    def statement_validator(self, capacity=4096):
+        """
+        Start validating a document that is edited and validated repeatedly.
+        
+        Args:
+            capacity (int): Maximum number of cached statement results
+            
+        Returns:
+            StatementValidator: Validator that re-parses only the statements
+                that changed since its last call, or None if the grammar has
+                no LALR parser
+        """
+        if self.lalr_parser is None or self.parser_mode == 'earley':
+            return None
+        return StatementValidator(self, capacity=capacity)
+        
+    def validate(self, oml_code, return_tree=True):
         """
         Validate OML code against grammar.
         
+        Results are cached by a hash of the grammar and the code, so
+        validating the same code again is a lookup. The cache keeps no parse
+        trees unless it was created with keep_trees=True, so cached valid
+        code is parsed again when its tree is requested.
+        
         Args:
             oml_code (str): OML code to validate
+            return_tree (bool): Return the parse tree of valid code (None otherwise)
             
         Returns:
             tuple: (is_valid, result) - Boolean and parse tree or error message
         """
-        try:
-            # Parse the generated code
-            tree = self.parser.parse(oml_code)
-            return True, tree  # Code is valid, return parse tree
-        except UnexpectedInput as e:
-            # If parsing fails, the code doesn't follow the grammar
-            return False, str(e)  # Return error message
-        except Exception as e:
-            # Handle other exceptions
-            return False, f"Validation error: {str(e)}"
+        return self._cached_validate(oml_code, return_tree, self._validate)
+        
+    def _cached_validate(self, oml_code, return_tree, validate):
+        """
+        Validate code through the result cache.
+        
+        Args:
+            oml_code (str): OML code to validate
+            return_tree (bool): Return the parse tree of valid code
+            validate (callable): Parses code on a miss, returning
+                (is_valid, result, error) like _validate
+            
+        Returns:
+            tuple: (is_valid, result) - Boolean and parse tree or error message
+        """
+        if self.result_cache is None:
+            is_valid, result, _ = validate(oml_code)
+            return is_valid, result if return_tree or not is_valid else None
+            
+        entry, tree = self._cached_result(oml_code, return_tree, validate)
+        if entry['valid']:
+            return True, tree if return_tree else None
+        return False, entry['error']['message']
+        
+    def check(self, oml_code, recover=False):
+        """
+        Validate OML code and describe the error as structured data.
+        
+        With recover=True, every syntax error is collected in one pass: after
+        an error, the LALR parser resumes at the next statement (see
+        src.validation.recovery), so a candidate with several mistakes can be
+        fixed in one feedback iteration.
+        
+        Args:
+            oml_code (str): OML code to validate
+            recover (bool): Also collect all syntax errors in 'errors'
+            
+        Returns:
+            dict: 'valid' and 'error', which is None for valid code or a dict
+                with message, line, column, token and expected terminals;
+                with recover, also 'errors', a list of such dicts that also
+                have the offending 'statement'
+        """
+        if self.result_cache is None:
+            is_valid, result, error = self._validate(oml_code)
+            entry = {'valid': is_valid, 'error': None if is_valid else error_record(error, result)}
+            if recover:
+                entry['errors'] = [] if is_valid else self._recover_errors(oml_code, entry['error'])
+            return entry
+            
+        entry, _ = self._cached_result(oml_code, False)
+        if recover and 'errors' not in entry:
+            errors = [] if entry['valid'] else self._recover_errors(oml_code, entry['error'])
+            entry = self.result_cache.put(ValidationCache.make_key(self.cache_namespace, oml_code),
+                                          dict(entry, errors=errors), tree=entry.get('tree'))
+        result = {'valid': entry['valid'], 'error': entry['error']}
+        if recover:
+            result['errors'] = entry['errors']
+        return result
+        
+    def _recover_errors(self, oml_code, first_error):
+        """
+        Collect every syntax error of invalid code.
+        
+        Args:
+            oml_code (str): Code that failed validation
+            first_error (dict): Record of the error that failed it
+            
+        Returns:
+            list: Error records with the offending statement
+        """
+        if self.lalr_parser is None:
+            # Only the interactive LALR parser can resume after an error
+            lines = oml_code.split('\n')
+            line = first_error['line']
+            statement = lines[line - 1].strip() if line and line <= len(lines) else ''
+            return [dict(first_error, statement=statement)]
+            
+        with span('parse_validate', chars=len(oml_code), recover=True) as recover_span:
+            errors = [dict(error_record(error), statement=statement)
+                      for error, statement in recover_errors(self.lalr_parser, oml_code)]
+            recover_span.set(errors=len(errors))
+        if not errors:
+            # The LALR parser accepts the code, so it failed for another reason
+            errors = [dict(first_error, statement='')]
+        return errors
+        
+    def _cached_result(self, oml_code, need_tree, validate=None):
+        """
+        Look up the result of the code, validating and caching it on a miss.
+        
+        Args:
+            oml_code (str): OML code
+            need_tree (bool): Whether the parse tree of valid code is needed
+            validate (callable): Parses code on a miss (defaults to _validate)
+        
+        Returns:
+            tuple: (entry, tree) - Cached result dictionary and parse tree
+                (None unless valid and needed or kept by the cache)
+        """
+        key = ValidationCache.make_key(self.cache_namespace, oml_code)
+        entry = self.result_cache.get(key)
+        if entry is not None and not (need_tree and entry['valid'] and 'tree' not in entry):
+            with span('parse_validate', chars=len(oml_code), cached=True, valid=entry['valid']):
+                get_instrumentation().increment('oml_validation_cache_hits_total')
+            return entry, entry.get('tree')
+            
+        is_valid, result, error = (validate or self._validate)(oml_code)
+        if is_valid:
+            return self.result_cache.put(key, {'valid': True, 'error': None}, tree=result), result
+        entry = {'valid': False, 'error': error_record(error, result)}
+        if error is not None:
+            # Only syntax errors are a property of the code; other failures may not repeat
+            entry = self.result_cache.put(key, entry)
+        return entry, None
+        
+    def _validate(self, oml_code):
+        """
+        Parse the code.
+        
+        Returns:
+            tuple: (is_valid, result, error) - Boolean, parse tree or error
+                message, and the Lark syntax error (None if valid or if
+                parsing failed for another reason)
+        """
+        with span('parse_validate', chars=len(oml_code)) as validate_span:
+            try:
+                # Parse the generated code
+                tree = self._parse(oml_code, validate_span)
+                validate_span.set(valid=True)
+                return True, tree, None  # Code is valid, return parse tree
+            except UnexpectedInput as e:
+                # If parsing fails, the code doesn't follow the grammar
+                validate_span.set(valid=False)
+                return False, str(e), e  # Return error message
+            except Exception as e:
+                # Handle other exceptions
+                validate_span.set(valid=False)
+                return False, f"Validation error: {str(e)}", None
+                
+    def _parse(self, oml_code, validate_span):
+        """
+        Parse with LALR, or with Earley if the grammar has no LALR parser.
+        
+        Both parsers accept the same inputs of an LALR-compatible grammar (see
+        tests/test_validator.py), so LALR's verdict is final and rejected
+        code is never parsed twice.
+        """
+        if self.lalr_parser is None:
+            validate_span.set(parser='earley')
+            return self.earley_parser.parse(oml_code)
+        validate_span.set(parser='lalr')
+        return self.lalr_parser.parse(oml_code)
             
     def extract_code_from_response(self, response):
         """
@@ -56,8 +330,7 @@ class OMLValidator:
             str: Extracted OML code or None
         """
         # Use case-insensitive pattern to match 'oml' or 'OML' at the start
-        pattern = r'```(?:[a-zA-Z]+)?\n(.*?)```'
-        match = re.search(pattern, response, re.DOTALL)
+        match = CODE_BLOCK_PATTERN.search(response)
         if match:
             return match.group(1)
         else:
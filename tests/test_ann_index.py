@@ -0,0 +1,85 @@
+import numpy as np
+
+from src.ann_index import IVFIndex, benchmark_recall
+from src.retriever import OMLRetriever
+
+
+def clustered_matrix(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dim))
+    matrix = centers[rng.integers(20, size=n)] + 0.3 * rng.standard_normal((n, dim))
+    matrix = matrix.astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_search_with_all_lists_is_exact():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=16).build(matrix)
+    query = matrix[7]
+
+    indices, scores = index.search(query, 5, nprobe=16)
+    exact = np.argsort(-(matrix @ query))[:5]
+
+    assert indices.tolist() == exact.tolist()
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_inverted_lists_cover_every_row_once():
+    index = IVFIndex(n_lists=16).build(clustered_matrix())
+
+    assert sorted(index.list_ids.tolist()) == list(range(2000))
+    assert index.list_offsets[-1] == 2000
+
+
+def test_benchmark_reports_high_recall():
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=16).build(matrix)
+
+    results = benchmark_recall(matrix, matrix[:20], index, k=5, nprobe_values=(4, 16))
+
+    assert results[-1]["recall"] == 1.0
+    assert results[0]["recall"] > 0.8
+
+
+def test_save_and_load(tmp_path):
+    matrix = clustered_matrix()
+    index = IVFIndex(n_lists=16, nprobe=4).build(matrix)
+    index.save(str(tmp_path / "ivf.npz"))
+
+    loaded = IVFIndex.load(str(tmp_path / "ivf.npz"), matrix)
+
+    assert loaded.nprobe == 4
+    assert loaded.search(matrix[3], 3)[0].tolist() == index.search(matrix[3], 3)[0].tolist()
+
+
+class IdentityTokenizer:
+    def __init__(self):
+        self.texts = []
+
+    def encode(self, text):
+        self.texts.append(text)
+        return [len(self.texts) - 1]
+
+    def decode(self, tokens):
+        return "".join(self.texts[token] for token in tokens)
+
+
+class RowEmbeddingModel:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def get_query_embedding(self, text):
+        return self.matrix[int(text)]
+
+
+def test_retriever_uses_ann_above_threshold():
+    matrix = clustered_matrix(n=500)
+    vector_db = [(f"input {i}", f"output {i}", row, row) for i, row in enumerate(matrix)]
+    model = RowEmbeddingModel(matrix)
+
+    small = OMLRetriever(vector_db, model, tokenizer=IdentityTokenizer(), ann_threshold=1000)
+    large = OMLRetriever(vector_db, model, tokenizer=IdentityTokenizer(), ann_threshold=100)
+
+    assert small.ann_index is None
+    assert large.ann_index is not None
+    assert large.retrieve("42", top_n=1)[0][0] == "output 42"
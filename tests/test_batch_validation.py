@@ -0,0 +1,95 @@
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from src.validation.batch import (grammar_file_hash, load_state, order_largest_first, save_state, validate_files,
+                                  write_json_report, write_junit_report)
+
+VALID = "vocabulary <http://a#> as a {\n    concept A\n}\n"
+LARGE_VALID = "vocabulary <http://b#> as b {\n" + "".join(f"    concept C{i}\n" for i in range(50)) + "}\n"
+INVALID = "vocabulary <http://c#> as c {\n    concept A [\n}\n"
+
+
+@pytest.fixture
+def oml_files(tmp_path):
+    paths = []
+    for name, content in [("valid.oml", VALID), ("large.oml", LARGE_VALID), ("invalid.oml", INVALID)]:
+        path = tmp_path / name
+        path.write_text(content)
+        paths.append(str(path))
+    return paths
+
+
+def test_files_are_ordered_largest_first(oml_files):
+    assert [path.rsplit("/", 1)[1] for path in order_largest_first(oml_files)] == [
+        "large.oml", "invalid.oml", "valid.oml"]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_validate_files_keeps_input_order(oml_files, jobs):
+    results = validate_files(oml_files, parser="lalr", jobs=jobs)
+
+    assert [result["path"] for result in results] == oml_files
+    assert [result["valid"] for result in results] == [True, True, False]
+    assert results[2]["error"].startswith("Unexpected token")
+    assert all(result["parse_time"] > 0 and not result["skipped"] for result in results)
+
+
+def test_changed_since_only_validates_changed_files(oml_files, tmp_path):
+    state_file = str(tmp_path / "state.json")
+    save_state(state_file, grammar_file_hash(), validate_files(oml_files, parser="lalr"), parser="lalr")
+
+    with open(oml_files[0], "a") as file:
+        file.write("\n")
+    seen = []
+    results = validate_files(oml_files, parser="lalr", state=load_state(state_file), on_result=seen.append)
+
+    assert [result["skipped"] for result in results] == [False, True, True]
+    assert [result["valid"] for result in results] == [True, True, False]
+    assert results[2]["error"].startswith("Unexpected token")
+    assert len(seen) == 3
+
+
+def test_changed_grammar_validates_everything(oml_files, tmp_path):
+    state_file = str(tmp_path / "state.json")
+    save_state(state_file, "another grammar", validate_files(oml_files, parser="lalr"))
+
+    results = validate_files(oml_files, parser="lalr", state=load_state(state_file))
+
+    assert not any(result["skipped"] for result in results)
+
+
+def test_changed_parser_mode_validates_everything(oml_files, tmp_path):
+    state_file = str(tmp_path / "state.json")
+    save_state(state_file, grammar_file_hash(), validate_files(oml_files, parser="lalr"), parser="lalr")
+
+    results = validate_files(oml_files, parser="earley", state=load_state(state_file))
+
+    assert not any(result["skipped"] for result in results)
+
+
+def test_missing_state_is_empty(tmp_path):
+    assert load_state(str(tmp_path / "missing.json"))["files"] == {}
+
+
+def test_reports(oml_files, tmp_path):
+    results = validate_files(oml_files, parser="lalr")
+    json_file = tmp_path / "report.json"
+    junit_file = tmp_path / "report.xml"
+
+    write_json_report(results, str(json_file))
+    write_junit_report(results, str(junit_file))
+
+    report = json.loads(json_file.read_text())
+    assert report["summary"]["files"] == 3
+    assert report["summary"]["invalid"] == 1
+    assert report["files"][0]["parse_time"] == results[0]["parse_time"]
+
+    suite = ElementTree.parse(str(junit_file)).getroot()
+    assert suite.get("tests") == "3"
+    assert suite.get("failures") == "1"
+    cases = suite.findall("testcase")
+    assert [case.get("name") for case in cases] == oml_files
+    assert cases[2].find("failure").text == results[2]["error"]
+    assert float(cases[0].get("time")) == pytest.approx(results[0]["parse_time"], abs=1e-6)
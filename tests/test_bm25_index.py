@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.bm25_index import BM25Index
+
+
+DOCUMENTS = [
+    "Define pizzas\nconcept Pizza [ restricts some hasTopping to PizzaTopping ]",
+    "Define foods\nconcept Food",
+    "Define identifiers\nscalar property hasId [ domain Food ]",
+]
+
+
+def test_tokenize_splits_camel_case_identifiers():
+    terms = BM25Index.tokenize("restricts some hasTopping to rdfs:comment")
+
+    assert "hastopping" in terms
+    assert "topping" in terms
+    assert "rdfs:comment" in terms
+
+
+def test_score_prefers_documents_with_rare_terms():
+    index = BM25Index(DOCUMENTS)
+
+    scores = index.score("pizza topping")
+
+    assert scores.shape == (3,)
+    assert int(np.argmax(scores)) == 0
+    assert scores[1] == 0.0
+
+
+def test_score_without_matching_terms():
+    index = BM25Index(DOCUMENTS)
+
+    assert not index.score("aspect").any()
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+from src.validation.constrained import LocalChatClient, StandInModel, TokenConstraint, generate
+from src.validation.error_handler import ErrorHandler
+from src.validation.feedback_loop import FeedbackLoop
+from src.validation.validator import OMLValidator
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "src", "oml_examples.jsonl")
+
+WORD_PATTERN = r" +|\n|\S+"
+
+HEADER = "vocabulary <http://a#> as a {\n"
+
+# The stand-in model has memorized code with an unclosed "["
+ANSWER = HEADER + "    concept A [\n}\n"
+
+VALID = '''vocabulary <http://example.com/pizza#> as pizza {
+    extends <http://www.w3.org/2001/XMLSchema#> as xsd
+    concept Pizza [
+        key hasName
+    ]
+    scalar property hasName [
+        domain Pizza
+        range xsd:string
+        functional
+    ]
+}
+'''
+
+
+def vocabulary_of(*texts):
+    words = []
+    for text in texts:
+        words += re.findall(WORD_PATTERN, text)
+    return ["<eos>", "]", "\n"] + list(dict.fromkeys(word for word in words if word != "\n"))
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return OMLValidator(result_cache=False)
+
+
+@pytest.fixture(scope="module")
+def constraint(validator):
+    return validator.constraint()
+
+
+def advance_all(constraint, chunks):
+    state = constraint.initial_state()
+    for chunk in chunks:
+        state = constraint.advance(state, chunk)
+        if state is None:
+            return None
+    return state
+
+
+def test_unfinished_tokens_stay_viable(constraint):
+    assert advance_all(constraint, [HEADER, "    concept A [\n", "        key x", "sd:"]) is not None
+    assert advance_all(constraint, [HEADER, "    conc"]) is not None
+    assert advance_all(constraint, [HEADER, '    @a:b "unterminated']) is not None
+    assert advance_all(constraint, [HEADER, "    // Top", " Level\n", "\n    concept A"]) is not None
+
+
+def test_dead_prefixes_are_rejected(constraint):
+    assert constraint.advance(constraint.initial_state(), "concept") is None
+    assert advance_all(constraint, [HEADER, "    concept A ]"]) is None
+    assert advance_all(constraint, [HEADER, "    #"]) is None
+
+
+def test_valid_corpus_examples_stay_viable(validator, constraint):
+    with open(EXAMPLES_PATH) as file:
+        outputs = [json.loads(line)["output"] for line in file if line.strip()]
+
+    for code in outputs:
+        if validator.validate(code, return_tree=False)[0]:
+            state = advance_all(constraint, [code[start:start + 5] for start in range(0, len(code), 5)])
+            assert state is not None and constraint.is_complete(state)
+
+
+def test_allowed_terminals_after_the_header(constraint):
+    state = advance_all(constraint, [HEADER])
+
+    allowed = constraint.allowed_terminals(state)
+
+    assert {"CONCEPT", "ASPECT", "RBRACE", "AT"} <= allowed
+    assert "$END" not in allowed and "RSQB" not in allowed
+
+
+def test_completion_is_only_accepted_at_the_end(constraint):
+    assert not constraint.is_complete(advance_all(constraint, [HEADER, "    concept A\n"]))
+    assert constraint.is_complete(advance_all(constraint, [HEADER, "    concept A\n}"]))
+    assert constraint.is_complete(advance_all(constraint, [VALID]))
+
+
+def test_mask_and_logits_callback(constraint):
+    vocabulary = vocabulary_of(ANSWER)
+    tokens = TokenConstraint(constraint, vocabulary, eos_token_id=0)
+    prefix = [vocabulary.index(word) for word in re.findall(WORD_PATTERN, HEADER)]
+
+    mask = tokens.mask(prefix)
+    logits = tokens(prefix, np.zeros(len(vocabulary)))
+
+    assert mask[vocabulary.index("concept")] and mask[vocabulary.index("    ")]
+    assert not mask[0] and not mask[vocabulary.index("]")]
+    assert np.isneginf(logits[~mask]).all() and (logits[mask] == 0).all()
+    assert tokens.allowed_tokens(prefix) == list(np.flatnonzero(mask))
+
+
+def test_prefix_states_are_cached(constraint):
+    vocabulary = vocabulary_of(ANSWER)
+    tokens = TokenConstraint(constraint, vocabulary, eos_token_id=0, cache_size=64)
+    prefix = [vocabulary.index(word) for word in re.findall(WORD_PATTERN, HEADER)]
+
+    next_token = tokens.allowed_tokens(prefix)[0]
+    misses = tokens.misses
+    tokens.state(prefix + [next_token])
+    tokens.allowed_tokens(prefix + [next_token])
+
+    assert tokens.misses == misses
+    assert tokens.hits >= 2
+    # Only the generated path is cached, not every candidate
+    assert len(tokens._states) <= len(prefix) + 1
+
+
+def test_trie_walk_matches_advancing_every_token(constraint):
+    words = re.findall(WORD_PATTERN, VALID)
+    # Sub-word pieces, so that many tokens share prefixes
+    pieces = {word[i:j] for word in words for i in range(len(word)) for j in range(i + 1, min(len(word), i + 4) + 1)}
+    vocabulary = ["<eos>"] + sorted(pieces)
+    tokens = TokenConstraint(constraint, vocabulary, eos_token_id=0)
+    prefix = []
+    position = 0
+    while position < len(VALID):
+        length = max(length for length in range(1, 5) if VALID[position:position + length] in pieces)
+        prefix.append(vocabulary.index(VALID[position:position + length]))
+        position += length
+
+    for end in list(range(0, len(prefix), 7)) + [len(prefix)]:
+        state = tokens.state(prefix[:end])
+        expected = [token_id for token_id, text in enumerate(vocabulary)
+                    if token_id and constraint.advance(state, text) is not None]
+        if constraint.is_complete(state):
+            expected.insert(0, 0)
+        assert tokens.allowed_tokens(prefix[:end]) == expected
+
+
+def test_constrained_stand_in_generates_valid_code(validator, constraint):
+    vocabulary = vocabulary_of(ANSWER)
+    model = StandInModel(vocabulary, ANSWER, eos_token_id=0)
+
+    unconstrained = "".join(vocabulary[token_id] for token_id in generate(model, [], 0))
+    tokens = TokenConstraint(constraint, vocabulary, eos_token_id=0)
+    constrained = "".join(vocabulary[token_id] for token_id in generate(model, [], 0, tokens))
+
+    assert unconstrained == ANSWER
+    assert not validator.validate(unconstrained, return_tree=False)[0]
+    assert validator.validate(constrained, return_tree=False)[0]
+    assert constrained == HEADER + "    concept A [\n]}\n"
+
+
+def test_feedback_loop_succeeds_in_one_pass(validator, constraint):
+    vocabulary = vocabulary_of(ANSWER)
+    model = StandInModel(vocabulary, ANSWER, eos_token_id=0)
+    client = LocalChatClient(model, vocabulary, 0, TokenConstraint(constraint, vocabulary, eos_token_id=0))
+    loop = FeedbackLoop(client, validator, ErrorHandler(), on_chunk=None)
+
+    code, iterations, success = loop.generate_and_refine("make a vocabulary")
+
+    assert success and iterations == 1
+    assert code.strip() == (HEADER + "    concept A [\n]}").strip()
+
+
+def test_num_predict_caps_the_reply():
+    vocabulary = vocabulary_of(ANSWER)
+    client = LocalChatClient(StandInModel(vocabulary, ANSWER, eos_token_id=0), vocabulary, 0)
+
+    reply = client.chat("local", [], options={"num_predict": 3})
+
+    assert reply["message"]["content"] == "```oml\nvocabulary <http://a#>\n```"
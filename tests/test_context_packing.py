@@ -0,0 +1,112 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src.context_packing import pack_examples, split_statements, statement_excerpt
+from src.tokenizer_utils import fit_examples_in_context
+
+
+class WordTokenizer:
+    def __init__(self):
+        self.vocabulary = {}
+        self.words = []
+
+    def encode(self, text):
+        for word in text.split():
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+        return [self.vocabulary[word] for word in text.split()]
+
+    def decode(self, tokens):
+        return " ".join(self.words[token] for token in tokens)
+
+
+VOCABULARY = """vocabulary <http://example.com/pizza#> as pizza {
+    extends <http://www.w3.org/2000/01/rdf-schema#> as rdfs
+    @rdfs:comment "A food"
+    concept Food
+    concept Pizza < Food [
+        restricts hasBase to exactly 1
+    ]
+    relation entity HasBase [
+        from Pizza
+        to Base
+    ]
+}"""
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_split_statements_keeps_blocks_and_annotations_together():
+    header, statements, footer = split_statements(VOCABULARY)
+
+    assert header == "vocabulary <http://example.com/pizza#> as pizza {\n"
+    assert footer == "}"
+    assert len(statements) == 4
+    assert statements[1] == '    @rdfs:comment "A food"\n    concept Food\n'
+    assert statements[2].strip().endswith("]")
+
+
+def test_statement_excerpt_keeps_whole_statements():
+    tokenizer = WordTokenizer()
+
+    excerpt = statement_excerpt(VOCABULARY, 20, tokenizer)
+
+    assert excerpt.startswith("vocabulary <http://example.com/pizza#> as pizza {\n")
+    assert excerpt.endswith("concept Food\n}")
+    assert len(tokenizer.encode(excerpt)) <= 20
+
+
+def test_knapsack_packs_more_relevance_than_prefix_cut():
+    tokenizer = WordTokenizer()
+    examples = [(words("big", 900), 0.9), (words("a", 100), 0.8), (words("b", 100), 0.7)]
+
+    prefix = fit_examples_in_context(examples, "system", max_tokens=952, tokenizer=tokenizer, reserve_tokens=1,
+                                     return_token_counts=True)
+    packed = fit_examples_in_context(examples, "system", max_tokens=952, tokenizer=tokenizer, reserve_tokens=1,
+                                     packing="knapsack", return_token_counts=True)
+
+    assert [tokens for _, _, tokens in prefix] == [900]
+    assert [score for _, score, _ in packed] == [0.9, 0.8, 0.7]
+    assert packed[0][0].startswith("big0 big1") and packed[0][2] < 900
+    assert sum(tokens for _, _, tokens in packed) <= 950
+    assert sum(score * tokens / len(text.split()) for text, score, tokens in packed) > 0.9
+
+
+def test_pack_examples_is_optimal_for_whole_examples():
+    rng = np.random.default_rng(0)
+    tokenizer = WordTokenizer()
+    for trial in range(20):
+        sizes = rng.integers(1, 40, size=6)
+        scores = rng.random(6)
+        examples = [(words(f"t{trial}e{i}w", size), score) for i, (size, score) in enumerate(zip(sizes, scores))]
+        budget = int(sizes.sum() // 2)
+
+        packed = pack_examples(examples, budget, tokenizer, excerpt=None)
+
+        best = max(
+            sum(scores[i] for i in subset)
+            for r in range(7) for subset in itertools.combinations(range(6), r)
+            if sizes[list(subset)].sum() <= budget
+        )
+        assert sum(item["tokens"] for item in packed) <= budget
+        assert sum(item["score"] for item in packed) == pytest.approx(best)
+
+
+def test_large_budgets_use_a_coarser_grid():
+    tokenizer = WordTokenizer()
+    examples = [(words(f"g{i}w", 3000), 1.0 - i / 10) for i in range(4)]
+
+    packed = pack_examples(examples, 10000, tokenizer, excerpt=None)
+
+    assert [item["rank"] for item in packed] == [0, 1, 2]
+    assert all(item["tokens"] == 3000 for item in packed)
+
+
+def test_unknown_packing_mode_is_rejected():
+    with pytest.raises(ValueError):
+        fit_examples_in_context([], "system", tokenizer=WordTokenizer(), packing="best")
@@ -0,0 +1,87 @@
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+def test_get_many_returns_only_cached_positions(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many("model", "passage", ["a", "b"], [np.array([1.0, 2.0]), np.array([3.0, 4.0])])
+
+    found = cache.get_many("model", "passage", ["b", "c", "a"])
+
+    assert set(found) == {0, 2}
+    assert np.allclose(found[0], [3.0, 4.0])
+    assert found[2].dtype == np.float32
+
+
+def test_keys_include_model_and_prefix(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many("model", "passage", ["a"], [np.array([1.0])])
+
+    assert cache.get_many("model", "query", ["a"]) == {}
+    assert cache.get_many("other-model", "passage", ["a"]) == {}
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("model", "query", ["a"], [np.array([1.0, 0.0])])
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+
+    assert len(reopened) == 1
+    assert np.allclose(reopened.get_many("model", "query", ["a"])[0], [1.0, 0.0])
+
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put_many("model", "passage", ["a"], [np.array([1.0])])
+    cache.put_many("model", "passage", ["b"], [np.array([2.0])])
+    cache.get_many("model", "passage", ["a"])
+    cache.put_many("model", "passage", ["c"], [np.array([3.0])])
+
+    assert len(cache) == 2
+    assert set(cache.get_many("model", "passage", ["a", "b", "c"])) == {0, 2}
+
+
+def test_query_cache_counts_hits_and_misses():
+    cache = QueryEmbeddingCache(capacity=2)
+
+    assert cache.get("pizza") is None
+    cache.put("pizza", np.array([1.0, 2.0]))
+    assert np.allclose(cache.get("pizza"), [1.0, 2.0])
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(capacity=2)
+    cache.put("a", np.array([1.0]))
+    cache.put("b", np.array([2.0]))
+    cache.get("a")
+    cache.put("c", np.array([3.0]))
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+
+def test_query_cache_entries_are_read_only():
+    cache = QueryEmbeddingCache()
+    cache.put("a", np.array([1.0]))
+
+    assert not cache.get("a").flags.writeable
+
+
+def test_query_cache_clear_resets_counters():
+    cache = QueryEmbeddingCache()
+    cache.put("a", np.array([1.0]))
+    cache.get("a")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == 0
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from src.embedding_index import EmbeddingIndex
+
+
+def build_vector_db():
+    return [
+        ("concept input", "concept Pizza", np.array([3.0, 4.0]), np.array([1.0, 0.0])),
+        ("relation input", "relation entity HasBase", np.array([0.0, 2.0]), np.array([0.0, 1.0])),
+    ]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = EmbeddingIndex.from_vector_db(build_vector_db(), ids=["a", "b"], model_name="test-model")
+    index.save(str(tmp_path / "index"))
+
+    loaded = EmbeddingIndex.load(str(tmp_path / "index"))
+
+    assert isinstance(loaded.input_embeddings, np.memmap)
+    assert loaded.ids == ["a", "b"]
+    assert loaded.outputs == ["concept Pizza", "relation entity HasBase"]
+    assert loaded.model_name == "test-model"
+    assert loaded.dimension == 2
+    assert np.allclose(loaded.input_embeddings[0], [0.6, 0.8])
+    assert np.allclose(loaded.output_embeddings, [[1.0, 0.0], [0.0, 1.0]])
+
+
+def test_exists(tmp_path):
+    assert not EmbeddingIndex.exists(str(tmp_path))
+    assert not EmbeddingIndex.exists(None)
+
+    EmbeddingIndex.from_vector_db(build_vector_db()).save(str(tmp_path))
+
+    assert EmbeddingIndex.exists(str(tmp_path))
+
+
+def test_from_vector_db_rejects_mismatched_ids():
+    with pytest.raises(ValueError):
+        EmbeddingIndex.from_vector_db(build_vector_db(), ids=["only-one"])
+
+
+def test_change_journal_round_trip_and_save_clears_it(tmp_path):
+    index_path = str(tmp_path)
+    EmbeddingIndex.from_vector_db(build_vector_db()).save(index_path)
+
+    EmbeddingIndex.append_changes(index_path, [
+        {"op": "upsert", "id": "c", "input": "in", "output": "out",
+         "input_embedding": np.array([0.25, 0.5]), "output_embedding": np.array([1.0, 2.0])},
+        {"op": "delete", "id": "0"},
+    ])
+    with open(tmp_path / "changes.jsonl", "a") as file:
+        file.write('{"op": "upsert", "id": "torn"')
+
+    changes = EmbeddingIndex.load_changes(index_path)
+
+    assert [change["op"] for change in changes] == ["upsert", "delete"]
+    assert changes[0]["input_embedding"].dtype == np.float32
+    assert np.array_equal(changes[0]["input_embedding"], [0.25, 0.5])
+
+    EmbeddingIndex.load(index_path).save(index_path)
+    assert EmbeddingIndex.load_changes(index_path) == []
+
+
+def test_changes_appended_after_a_torn_line_are_kept(tmp_path):
+    index_path = str(tmp_path)
+    EmbeddingIndex.append_changes(index_path, [{"op": "delete", "id": "a"}])
+    with open(tmp_path / "changes.jsonl", "a") as file:
+        file.write('{"op": "upsert", "id": "torn"')
+
+    EmbeddingIndex.append_changes(index_path, [{"op": "delete", "id": "b"}])
+
+    assert EmbeddingIndex.load_changes(index_path) == [{"op": "delete", "id": "a"}, {"op": "delete", "id": "b"}]
+
+
+def test_torn_first_line_is_dropped_before_appending(tmp_path):
+    with open(tmp_path / "changes.jsonl", "w") as file:
+        file.write('{"op": "del' + " " * 5000)
+
+    EmbeddingIndex.append_changes(str(tmp_path), [{"op": "delete", "id": "b"}])
+
+    assert EmbeddingIndex.load_changes(str(tmp_path)) == [{"op": "delete", "id": "b"}]
+
+
+class NamedTokenizer:
+    name = "test-encoding"
+
+    def encode(self, text):
+        return [len(word) for word in text.split()]
+
+
+def test_token_ids_are_stored_with_the_index(tmp_path):
+    index = EmbeddingIndex.from_vector_db(build_vector_db(), tokenizer=NamedTokenizer())
+    index.save(str(tmp_path))
+
+    loaded = EmbeddingIndex.load(str(tmp_path))
+
+    assert loaded.tokenizer_name == "test-encoding"
+    assert isinstance(loaded.token_ids, np.memmap)
+    assert loaded.token_counts.tolist() == [2, 3]
+    assert loaded.output_token_ids(1).tolist() == [8, 6, 7]
+
+
+def test_index_without_token_ids_loads(tmp_path):
+    EmbeddingIndex.from_vector_db(build_vector_db()).save(str(tmp_path))
+
+    loaded = EmbeddingIndex.load(str(tmp_path))
+
+    assert not loaded.has_token_ids
+    assert loaded.token_counts is None
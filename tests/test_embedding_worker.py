@@ -0,0 +1,168 @@
+import os
+import stat
+import sys
+import threading
+from multiprocessing import AuthenticationError
+
+import numpy as np
+import pytest
+
+from src.embedding_worker import EmbeddingWorker, EmbeddingWorkerClient, default_socket_path, main
+from src.embeddings import EmbeddingManager
+
+
+class FakeSentenceTransformer:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, texts, batch_size=32):
+        self.batch_sizes.append(len(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+
+class BlockingSentenceTransformer(FakeSentenceTransformer):
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def encode(self, texts, batch_size=32):
+        self.entered.set()
+        self.release.wait()
+        return super().encode(texts, batch_size)
+
+
+AUTHKEY = b"test-secret"
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = EmbeddingWorker(str(tmp_path / "run" / "worker.sock"), "fake-model", model=FakeSentenceTransformer(),
+                             max_wait_ms=200, authkey=AUTHKEY)
+    worker.start()
+    yield worker
+    worker.close()
+
+
+def test_client_encodes_through_worker(worker):
+    client = EmbeddingWorkerClient(worker.address, AUTHKEY)
+
+    embeddings = client.encode(["a", "bbb"])
+
+    assert client.model_name == "fake-model"
+    assert client.get_sentence_embedding_dimension() == 2
+    assert embeddings[:, 0].tolist() == [1.0, 3.0]
+    client.close()
+
+
+def test_concurrent_requests_are_micro_batched(worker):
+    clients = [EmbeddingWorkerClient(worker.address, AUTHKEY) for _ in range(4)]
+    results = {}
+
+    def encode(i, client):
+        results[i] = client.encode(["x" * (i + 1)])
+
+    threads = [threading.Thread(target=encode, args=(i, client)) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [results[i][0, 0] for i in range(4)] == [1.0, 2.0, 3.0, 4.0]
+    assert worker.texts_encoded == 4
+    assert worker.batches < 4
+    for client in clients:
+        client.close()
+
+
+def test_embedding_manager_uses_worker(worker):
+    manager = EmbeddingManager("fake-model", worker_address=worker.address, worker_authkey=AUTHKEY)
+
+    embedding = manager.get_query_embedding("pizza")
+
+    assert embedding.tolist() == [len("query: pizza"), 1.0]
+
+
+def test_embedding_manager_rejects_other_model(worker):
+    manager = EmbeddingManager("other-model", worker_address=worker.address, worker_authkey=AUTHKEY)
+
+    with pytest.raises(ValueError):
+        manager.get_query_embedding("pizza")
+
+
+def test_socket_directory_is_private(worker, tmp_path):
+    assert stat.S_IMODE(os.stat(os.path.dirname(worker.address)).st_mode) == 0o700
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o755)
+    shared.chmod(0o755)
+    with pytest.raises(PermissionError):
+        EmbeddingWorker(str(shared / "worker.sock"), model=FakeSentenceTransformer(), authkey=AUTHKEY).start()
+
+
+def test_default_socket_is_in_the_runtime_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+
+    assert default_socket_path() == str(tmp_path / "oml-copilot" / "embeddings.sock")
+
+
+def test_authkey_is_required(worker, monkeypatch):
+    monkeypatch.delenv("OML_EMBEDDING_WORKER_AUTHKEY", raising=False)
+
+    with pytest.raises(ValueError):
+        EmbeddingWorker(worker.address + "2", model=FakeSentenceTransformer())
+    with pytest.raises(AuthenticationError):
+        EmbeddingWorkerClient(worker.address, b"wrong")
+    # The worker keeps accepting clients that present the key
+    EmbeddingWorkerClient(worker.address, AUTHKEY).close()
+
+
+def test_client_reconnects_after_worker_restart(worker):
+    client = EmbeddingWorkerClient(worker.address, AUTHKEY)
+    client.encode(["a"])
+
+    worker.close()
+    restarted = EmbeddingWorker(worker.address, "fake-model", model=FakeSentenceTransformer(), authkey=AUTHKEY)
+    restarted.start()
+    try:
+        assert client.encode(["bb"])[:, 0].tolist() == [2.0]
+        assert restarted.texts_encoded == 1
+    finally:
+        client.close()
+        restarted.close()
+
+
+def test_requests_queued_at_shutdown_are_failed(tmp_path):
+    model = BlockingSentenceTransformer()
+    worker = EmbeddingWorker(str(tmp_path / "run" / "worker.sock"), "fake-model", model=model, max_wait_ms=0,
+                             authkey=AUTHKEY).start()
+    requests = {}
+
+    def encode(name):
+        requests[name] = worker._encode([name])
+
+    first = threading.Thread(target=encode, args=("first",))
+    first.start()
+    assert model.entered.wait(5)
+    worker.close()
+    # Queued behind the shutdown sentinel, so the batch loop never encodes it
+    late = threading.Thread(target=encode, args=("late",))
+    late.start()
+    model.release.set()
+    first.join(5)
+    late.join(5)
+
+    assert not first.is_alive() and not late.is_alive()
+    assert requests["first"].result[:, 0].tolist() == [5.0]
+    assert requests["late"].error == "Embedding worker is shutting down"
+
+
+def test_main_reads_the_authkey_only_from_the_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("OML_EMBEDDING_WORKER_AUTHKEY", raising=False)
+    for argv in ([], ["--authkey", "secret"]):
+        monkeypatch.setattr(sys, "argv", ["embedding_worker", "--socket", str(tmp_path / "worker.sock")] + argv)
+        with pytest.raises(SystemExit):
+            main()
@@ -0,0 +1,128 @@
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import EmbeddingManager
+
+
+class FakeSentenceTransformer:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32):
+        self.encoded.extend(texts)
+        return np.array([[len(text), text.startswith("query: ")] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+
+def make_manager(**kwargs):
+    manager = EmbeddingManager("fake-model", **kwargs)
+    manager._model = FakeSentenceTransformer()
+    return manager
+
+
+def test_model_is_loaded_lazily():
+    manager = EmbeddingManager("fake-model")
+
+    assert not manager.is_model_loaded
+
+
+def test_encode_batch_restores_input_order():
+    manager = make_manager(batch_size=2)
+
+    embeddings = manager.get_passage_embeddings(["a", "ccc", "bb"])
+
+    assert embeddings[:, 0].tolist() == [len("passage: a"), len("passage: ccc"), len("passage: bb")]
+    # Longest texts are encoded first
+    assert manager.model.encoded[0] == "passage: ccc"
+
+
+class BatchRecordingTransformer(FakeSentenceTransformer):
+    """Embeds "<padding> <number>" texts as [length, number] and records each forward pass."""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.pools = 0
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        return np.array([[len(text), int(text.rsplit(" ", 1)[1])] for text in texts], dtype=np.float32)
+
+    def start_multi_process_pool(self, target_devices):
+        self.pools += 1
+        return target_devices
+
+    def encode_multi_process(self, texts, pool, batch_size=32):
+        return self.encode(texts, batch_size)
+
+    def stop_multi_process_pool(self, pool):
+        pass
+
+
+def test_length_sorted_batches_return_embeddings_in_input_order():
+    manager = make_manager(batch_size=3)
+    manager._model = BatchRecordingTransformer()
+    lengths = [5, 1, 9, 1, 7, 3, 9, 2]
+    texts = ["x" * length + f" {i}" for i, length in enumerate(lengths)]
+
+    embeddings = manager.encode_batch(texts)
+
+    assert embeddings[:, 1].tolist() == list(range(len(texts)))
+    assert embeddings[:, 0].tolist() == [len(text) for text in texts]
+    batch_lengths = [[len(text) for text in batch] for batch in manager.model.batches]
+    assert [len(batch) for batch in batch_lengths] == [3, 3, 2]
+    assert sum(batch_lengths, []) == sorted(map(len, texts), reverse=True)
+
+
+def test_worker_pool_keeps_input_order():
+    manager = make_manager(num_workers=2)
+    manager._model = BatchRecordingTransformer()
+    texts = ["x" * length + f" {i}" for i, length in enumerate([2, 8, 4])]
+
+    embeddings = manager.encode_batch(texts)
+
+    assert manager.model.pools == 1
+    assert embeddings[:, 1].tolist() == [0, 1, 2]
+
+
+def test_build_database_embeds_inputs_and_outputs_in_bulk():
+    manager = make_manager()
+
+    vector_db = manager.build_database([{"input": "in", "output": "out"}], show_progress=False)
+
+    input_text, output_text, input_embedding, output_embedding = vector_db[0]
+    assert (input_text, output_text) == ("in", "out")
+    assert input_embedding.tolist() == [len("query: in"), 1.0]
+    assert output_embedding.tolist() == [len("passage: out"), 0.0]
+
+
+def test_persistent_cache_skips_known_texts():
+    manager = make_manager(cache=EmbeddingCache(":memory:"))
+    manager.get_passage_embeddings(["a", "b"])
+    manager.model.encoded.clear()
+
+    embeddings = manager.get_passage_embeddings(["b", "c"])
+
+    assert manager.model.encoded == ["passage: c"]
+    assert embeddings[:, 0].tolist() == [len("passage: b"), len("passage: c")]
+
+
+def test_query_cache_skips_repeated_queries():
+    manager = make_manager()
+    manager.get_query_embedding("pizza")
+    manager.get_query_embedding("pizza")
+
+    assert manager.model.encoded == ["query: pizza"]
+    assert manager.query_cache.stats()["hits"] == 1
+
+
+def test_set_model_invalidates_query_cache():
+    manager = make_manager()
+    manager.get_query_embedding("pizza")
+
+    manager.set_model("other-model")
+
+    assert not manager.is_model_loaded
+    assert len(manager.query_cache) == 0
@@ -6,4 +6,18 @@ def test_package_imports():
     assert hasattr(src, "create_instruction_prompt")
     assert hasattr(src, "extract_oml_code")
     assert hasattr(src, "ExamplesProcessor")
-    assert hasattr(src, "DependencyExtractor")
\ No newline at end of file
+    assert hasattr(src, "DependencyExtractor")
+
+def test_package_import_is_lazy():
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    code = (
+        "import sys, src, src.validation; "
+        "from src import count_tokens, EmbeddingManager; "
+        "EmbeddingManager(); "
+        "assert 'sentence_transformers' not in sys.modules; "
+        "assert 'torch' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1], check=True)
@@ -0,0 +1,136 @@
+import pytest
+
+from src.validation.error_handler import ErrorHandler
+from src.validation.feedback_loop import FeedbackLoop
+from src.validation.validator import OMLValidator
+
+VALID = '''vocabulary <http://example.com/pizza#> as pizza {
+    extends <http://www.w3.org/2001/XMLSchema#> as xsd
+    @rdfs:comment """A
+    long comment"""
+    concept Pizza [
+        key hasName
+    ]
+    scalar property hasName [
+        domain Pizza
+        range xsd:string
+        functional
+    ]
+}
+'''
+
+INVALID = '''vocabulary <http://example.com/pizza#> as pizza {
+    concept Pizza
+    concept concept Topping
+    concept Base
+}
+'''
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return OMLValidator()
+
+
+def feed_chunks(incremental, code, size):
+    for start in range(0, len(code), size):
+        if not incremental.feed(code[start:start + size]):
+            return start
+    return None
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_valid_code_stays_alive_for_any_chunking(validator, size):
+    incremental = validator.incremental()
+
+    assert feed_chunks(incremental, VALID, size) is None
+    is_valid, tree = incremental.finish()
+
+    assert is_valid
+    assert tree == validator.validate(VALID)[1]
+
+
+def test_partial_words_are_not_judged_yet(validator):
+    incremental = validator.incremental()
+
+    assert incremental.feed("vocabulary <http://a#> as a {\n    scalar property p [ range xsd:")
+    assert incremental.feed("string ]\n}")
+    assert incremental.finish()[0]
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_invalid_statement_stops_the_parse_on_its_line(validator, size):
+    incremental = validator.incremental()
+
+    stopped_at = feed_chunks(incremental, INVALID, size)
+
+    assert stopped_at is not None
+    assert stopped_at < INVALID.index("concept Base")
+    assert not incremental.alive
+    assert incremental.error.line == 3
+    assert "concept concept Topping" in incremental.error_message()
+    assert not incremental.finish()[0]
+
+
+def test_incremental_parse_needs_lalr():
+    assert OMLValidator(parser='earley').incremental() is None
+
+
+class StreamingLLM:
+    def __init__(self, responses, size=3):
+        self.responses = list(responses)
+        self.size = size
+        self.messages = []
+        self.closed = 0
+
+    def chat(self, model, messages, stream=False, options=None):
+        self.messages.append(messages)
+        return self._stream(self.responses.pop(0))
+
+    def _stream(self, response):
+        try:
+            for start in range(0, len(response), self.size):
+                yield {"message": {"content": response[start:start + self.size]}}
+        finally:
+            self.closed += 1
+
+
+def test_feedback_loop_cuts_invalid_code_and_repairs_it(validator):
+    invalid = "```oml\n" + INVALID + "```\nThis is never read."
+    valid = "```oml\n" + VALID + "```"
+    llm = StreamingLLM([invalid, valid])
+    chunks = []
+    loop = FeedbackLoop(llm, validator, ErrorHandler(), on_chunk=chunks.append)
+
+    code, iterations, success = loop.generate_and_refine("make a pizza vocabulary")
+
+    assert success and iterations == 2
+    assert code == VALID
+    assert llm.closed == 2
+    assert "concept Base" not in "".join(chunks)
+    debugging_prompt = llm.messages[1][-1]["content"]
+    assert "Error at line 3, column 21" in debugging_prompt
+    assert "concept concept Topping" in debugging_prompt
+
+
+def test_feedback_loop_without_incremental_validation_reads_the_whole_block(validator):
+    llm = StreamingLLM(["```oml\n" + INVALID + "```"])
+    chunks = []
+    loop = FeedbackLoop(llm, validator, ErrorHandler(), max_iterations=1, on_chunk=chunks.append,
+                        incremental_validation=False)
+
+    code, iterations, success = loop.generate_and_refine("make a pizza vocabulary")
+
+    assert not success
+    assert code == INVALID
+    assert "concept Base" in "".join(chunks)
+
+
+def test_error_details_from_lalr_errors():
+    handler = ErrorHandler()
+    message = ("Unexpected token Token('ID', 'Topping') at line 3, column 21.\n"
+               "Expected one of: \n\t* LSQB\n")
+
+    line, column, token, _ = handler.parse_error_details(message)
+
+    assert (line, column, token) == ("3", "21", "Topping")
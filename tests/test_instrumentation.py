@@ -0,0 +1,152 @@
+import json
+import logging
+
+import numpy as np
+import pytest
+
+from src.instrumentation import (
+    Instrumentation, MetricsRegistry, SpanRecorder, get_instrumentation, set_instrumentation, span,
+)
+from src.retriever import OMLRetriever
+from src.validation.feedback_loop import FeedbackLoop
+
+
+@pytest.fixture
+def recorder():
+    recorder = SpanRecorder()
+    previous = set_instrumentation(Instrumentation(sinks=[recorder]))
+    yield recorder
+    set_instrumentation(previous)
+
+
+def test_spans_nest_under_one_request(recorder):
+    with span("request") as request:
+        with span("index_scan", top_n=3):
+            pass
+        with pytest.raises(KeyError):
+            with span("parse_validate"):
+                raise KeyError("boom")
+
+    records = recorder.by_request(request.request_id)
+    assert [record["name"] for record in records] == ["index_scan", "parse_validate", "request"]
+    assert records[0]["parent_id"] == request.span_id
+    assert records[0]["attributes"] == {"top_n": 3}
+    assert records[1]["error"] == "KeyError"
+
+    registry = get_instrumentation().registry
+    assert registry.histogram("oml_stage_duration_seconds", stage="index_scan").count == 1
+    assert registry.counter("oml_stage_errors_total", stage="parse_validate") == 1
+
+
+def test_prometheus_export():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe("oml_stage_duration_seconds", 0.05, stage="index_scan")
+    registry.observe("oml_stage_duration_seconds", 0.5, stage="index_scan")
+    registry.observe("oml_stage_duration_seconds", 5.0, stage="index_scan")
+    registry.increment("oml_feedback_iterations_total", outcome="valid")
+
+    assert registry.to_prometheus().splitlines() == [
+        "# TYPE oml_feedback_iterations_total counter",
+        'oml_feedback_iterations_total{outcome="valid"} 1',
+        "# TYPE oml_stage_duration_seconds histogram",
+        'oml_stage_duration_seconds_bucket{stage="index_scan",le="0.1"} 1',
+        'oml_stage_duration_seconds_bucket{stage="index_scan",le="1.0"} 2',
+        'oml_stage_duration_seconds_bucket{stage="index_scan",le="+Inf"} 3',
+        'oml_stage_duration_seconds_sum{stage="index_scan"} 5.55',
+        'oml_stage_duration_seconds_count{stage="index_scan"} 3',
+    ]
+
+
+def test_json_lines_export():
+    registry = MetricsRegistry(buckets=(0.1,))
+    registry.observe("latency", 0.05, stage="a")
+    registry.increment("calls", 2)
+
+    records = [json.loads(line) for line in registry.to_json_lines().splitlines()]
+
+    assert records[0] == {"type": "counter", "name": "calls", "labels": {}, "value": 2}
+    assert records[1]["type"] == "histogram"
+    assert records[1]["buckets"] == {"0.1": 1}
+    assert records[1]["count"] == 1
+
+
+class FakeLLM:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def chat(self, model, messages, stream=False):
+        response = self.responses.pop(0)
+        return iter([{"message": {"content": part}} for part in response.split("|")])
+
+
+class FakeValidator:
+    def extract_code_from_response(self, response):
+        return response.split("```")[1] if "```" in response else None
+
+    def validate(self, code):
+        return ("concept" in code), "bad code"
+
+
+class FakeErrorHandler:
+    def process_error(self, code, error):
+        return {}
+
+    def format_debugging_prompt(self, error_info):
+        return "fix it"
+
+
+def test_feedback_loop_records_iterations(recorder, caplog):
+    llm = FakeLLM(["no code here", "```|aspect A|```", "```concept| A```"])
+    chunks = []
+    loop = FeedbackLoop(llm, FakeValidator(), FakeErrorHandler(), on_chunk=chunks.append)
+
+    with caplog.at_level(logging.INFO, logger="src.validation.feedback_loop"):
+        code, iterations, success = loop.generate_and_refine("make a concept")
+
+    assert (code, iterations, success) == ("concept A", 3, True)
+    assert "".join(chunks).count("```") == 4
+    assert "Valid OML code generated!" in caplog.text
+
+    names = [record["name"] for record in recorder.records]
+    assert names.count("feedback_iteration") == 3
+    assert names.count("llm_first_token") == 3
+    assert names.count("llm_total") == 3
+    assert names.count("prompt_build") == 1
+
+    registry = get_instrumentation().registry
+    assert registry.counter("oml_feedback_iterations_total", outcome="no_code") == 1
+    assert registry.counter("oml_feedback_iterations_total", outcome="invalid") == 1
+    assert registry.counter("oml_feedback_iterations_total", outcome="valid") == 1
+
+
+class WhitespaceTokenizer:
+    def __init__(self):
+        self.vocabulary = {}
+        self.words = []
+
+    def encode(self, text):
+        for word in text.split():
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+        return [self.vocabulary[word] for word in text.split()]
+
+    def decode(self, tokens):
+        return " ".join(self.words[token] for token in tokens)
+
+
+class FakeEmbeddingModel:
+    def get_query_embedding(self, text):
+        return np.array([1.0, 0.0], dtype=np.float32)
+
+
+def test_retrieve_records_stages_and_logs_at_debug(recorder, capsys, caplog):
+    vector_db = [("in", "concept A", np.array([1.0, 0.0]), np.array([1.0, 0.0]))]
+    retriever = OMLRetriever(vector_db, FakeEmbeddingModel(), tokenizer=WhitespaceTokenizer())
+
+    with caplog.at_level(logging.DEBUG, logger="src.retriever"):
+        retriever.retrieve("query", top_n=1)
+
+    assert capsys.readouterr().out == ""
+    assert "Rank 1: Similarity = 1.0000 -> concept A" in caplog.text
+    assert [record["name"] for record in recorder.records] == ["token_count", "query_embedding", "index_scan"]
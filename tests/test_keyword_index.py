@@ -0,0 +1,54 @@
+from src.keyword_index import KeywordIndex
+
+
+OUTPUTS = [
+    "vocabulary <http://x#> as x {\n    concept Pizza < Food\n    relation entity HasBase [\n        from Pizza\n    ]\n}",
+    "concept Food",
+    "@rdfs:comment \"A property\"\nscalar property hasId [\n    domain Food\n]",
+]
+
+
+def build_index():
+    return KeywordIndex(["pizza input", "food input", "id input"], OUTPUTS, [len(text.split()) for text in OUTPUTS])
+
+
+def test_terms_include_keyword_phrases_and_qualified_names():
+    terms = KeywordIndex.terms(OUTPUTS[2])
+
+    assert "scalar property" in terms
+    assert "rdfs:comment" in terms
+    assert "hasId" in terms
+
+
+def test_lookup_orders_postings_shortest_first():
+    index = build_index()
+
+    assert index.lookup("concept") == [1, 0]
+    assert index.shortest("concept") == 1
+
+
+def test_lookup_normalizes_keywords():
+    index = build_index()
+
+    assert index.shortest("relation entity") == 0
+    assert index.shortest("@rdfs:comment") == 2
+    assert index.shortest("relation   entity") == 0
+
+
+def test_lookup_unknown_keyword():
+    index = build_index()
+
+    assert index.lookup("aspect") == []
+    assert index.shortest("aspect") is None
+    assert KeywordIndex.normalize_keyword("}") is None
+
+
+def test_add_and_remove_keep_postings_ordered():
+    index = build_index()
+
+    index.add(3, "short input", "concept", 1)
+    assert index.lookup("concept") == [3, 1, 0]
+
+    index.remove(1, "food input", OUTPUTS[1])
+    assert index.lookup("concept") == [3, 0]
+    assert index.lookup("Food") == [2, 0]
@@ -0,0 +1,82 @@
+import os
+
+import lark
+import pytest
+from lark.exceptions import GrammarError
+
+from src.validation import parser_cache
+from src.validation.parser_cache import clear_parser_cache, get_parser, parser_key
+from src.validation.validator import OMLValidator
+
+GRAMMAR = 'ontology: "concept" NAME+\nNAME: /[A-Z][a-z]*/\n%ignore " "\n'
+
+
+@pytest.fixture(autouse=True)
+def fresh_process_cache():
+    clear_parser_cache()
+    yield
+    clear_parser_cache()
+
+
+class NoCompileLark(lark.Lark):
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("grammar was compiled")
+
+
+def test_parser_is_shared_within_the_process(tmp_path):
+    first = get_parser(GRAMMAR, cache_dir=str(tmp_path))
+
+    assert get_parser(GRAMMAR, cache_dir=str(tmp_path)) is first
+    assert first.parse("concept Pizza Base").data == "ontology"
+
+
+def test_compiled_parser_is_loaded_from_disk(tmp_path, monkeypatch):
+    get_parser(GRAMMAR, cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == [parser_key(GRAMMAR) + ".lark"]
+    clear_parser_cache()
+
+    monkeypatch.setattr(parser_cache, "Lark", NoCompileLark)
+    loaded = get_parser(GRAMMAR, cache_dir=str(tmp_path))
+
+    assert loaded.parse("concept Pizza").children[0] == "Pizza"
+
+
+def test_unreadable_cache_file_is_rebuilt(tmp_path):
+    (tmp_path / (parser_key(GRAMMAR) + ".lark")).write_bytes(b"not a parser")
+
+    parser = get_parser(GRAMMAR, cache_dir=str(tmp_path))
+
+    assert parser.parse("concept Pizza")
+    clear_parser_cache()
+    assert get_parser(GRAMMAR, cache_dir=str(tmp_path)).parse("concept Pizza")
+
+
+def test_key_depends_on_grammar_options_and_lark_version(monkeypatch):
+    key = parser_key(GRAMMAR)
+
+    assert parser_key(GRAMMAR + "\n") != key
+    assert parser_key(GRAMMAR, parser="earley") != key
+    monkeypatch.setattr(lark, "__version__", "0.0.0")
+    assert parser_key(GRAMMAR) != key
+
+
+def test_grammar_errors_are_remembered(tmp_path, monkeypatch):
+    ambiguous = 'ontology: a | b\na: NAME\nb: NAME\nNAME: /[a-z]+/\n'
+    with pytest.raises(GrammarError):
+        get_parser(ambiguous, cache_dir=str(tmp_path))
+
+    monkeypatch.setattr(parser_cache, "Lark", NoCompileLark)
+    with pytest.raises(GrammarError):
+        get_parser(ambiguous, cache_dir=str(tmp_path))
+
+
+def test_validators_share_parsers(tmp_path):
+    grammar_file = tmp_path / "grammar.txt"
+    grammar_file.write_text(GRAMMAR)
+
+    first = OMLValidator(str(grammar_file), cache_dir=str(tmp_path))
+    second = OMLValidator(str(grammar_file), cache_dir=str(tmp_path))
+
+    assert first.lalr_parser is second.lalr_parser
+    assert first.earley_parser is second.earley_parser
+    assert second.validate("concept Pizza")[0]
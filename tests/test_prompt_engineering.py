@@ -1,4 +1,4 @@
-from src.prompt_engineering import extract_oml_code
+from src.prompt_engineering import create_instruction_prompt, extract_oml_code
 
 
 def test_extract_oml_code_from_fenced_block():
@@ -21,4 +21,46 @@ def test_extract_oml_code_from_fenced_block():
 
 def test_extract_oml_code_returns_none_without_code_block():
     response = "No code block here."
-    assert extract_oml_code(response) is None
\ No newline at end of file
+    assert extract_oml_code(response) is None
+
+class CountingTokenizer:
+    def __init__(self):
+        self.vocabulary = {}
+        self.words = []
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        for word in text.split():
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+        return [self.vocabulary[word] for word in text.split()]
+
+    def decode(self, tokens):
+        return " ".join(self.words[token] for token in tokens)
+
+
+def test_instruction_prompt_reuses_cached_token_counts():
+    tokenizer = CountingTokenizer()
+    long_example = " ".join(f"w{i}" for i in range(400))
+    knowledge = [("concept Pizza", 0.9), (long_example, 0.5)]
+
+    prompt = create_instruction_prompt(knowledge, tokenizer=tokenizer)
+    encoded = len(tokenizer.encoded)
+    again = create_instruction_prompt(knowledge, tokenizer=tokenizer)
+
+    assert again == prompt
+    assert " - concept Pizza\n" in prompt
+    assert " w299\n" in prompt and "w300" not in prompt
+    # Nothing is tokenized again on the second build
+    assert tokenizer.encoded[encoded:] == []
+
+
+def test_instruction_prompt_truncates_to_max_tokens():
+    tokenizer = CountingTokenizer()
+    knowledge = [(f"concept C{i} < Thing", 0.5) for i in range(20)]
+
+    prompt = create_instruction_prompt(knowledge, max_tokens=30, tokenizer=tokenizer)
+
+    assert len(tokenizer.encode(prompt)) == 30
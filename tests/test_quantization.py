@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.quantization import QuantizedMatrix, benchmark_quantization
+
+
+def normalized_matrix(n=500, dim=64, seed=0):
+    matrix = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("mode, bytes_per_value", [("float16", 2), ("int8", 1)])
+def test_quantized_scores_are_close(mode, bytes_per_value):
+    matrix = normalized_matrix()
+    quantized = QuantizedMatrix.quantize(matrix, mode, chunk_rows=128)
+
+    scores = quantized.score(matrix[0], chunk_rows=100)
+
+    assert quantized.mode == mode
+    assert quantized.codes.nbytes == matrix.size * bytes_per_value
+    assert np.allclose(scores, matrix @ matrix[0], atol=0.02)
+    assert np.allclose(quantized.rows(np.array([3])), matrix[3:4], atol=0.02)
+
+
+def test_save_and_load(tmp_path):
+    quantized = QuantizedMatrix.quantize(normalized_matrix(), "int8")
+    quantized.save(str(tmp_path / "q.npz"))
+
+    loaded = QuantizedMatrix.load(str(tmp_path / "q.npz"))
+
+    assert np.array_equal(loaded.codes, quantized.codes)
+    assert np.array_equal(loaded.scales, quantized.scales)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        QuantizedMatrix.quantize(normalized_matrix(), "int4")
+
+
+def test_benchmark_reports_savings_and_recall():
+    matrix = normalized_matrix()
+
+    results = benchmark_quantization(matrix, matrix[:10], k=3)
+
+    int8 = next(row for row in results if row["mode"] == "int8")
+    assert int8["bytes_saved"] > 0.7 * matrix.nbytes
+    assert int8["rescored_recall"] == 1.0
+
+
+def test_benchmark_leaves_the_query_row_out():
+    matrix = normalized_matrix(n=5)
+    rows = np.arange(5)
+
+    # With k = n - 1, a query's results are exactly the other rows
+    results = benchmark_quantization(matrix, matrix, k=4, modes=("int8",), exclude=rows)
+
+    assert results[0]["recall"] == results[0]["rescored_recall"] == 1.0
@@ -0,0 +1,150 @@
+import json
+import os
+
+import pytest
+
+from src.validation.error_handler import ErrorHandler
+from src.validation.feedback_loop import FeedbackLoop
+from src.validation.recovery import recover_errors, statement_starts
+from src.validation.result_cache import ValidationCache
+from src.validation.validator import OMLValidator
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "src", "oml_examples.jsonl")
+
+THREE_ERRORS = '''vocabulary <http://a#> as a {
+    extends <http://b#> as b
+    concept A [
+        key x
+    concept B
+    concpt C
+    concept D
+    scalar property p [
+        domain A
+        range xsd:string
+        functonal
+    ]
+    aspect E
+}
+'''
+
+VALID = "vocabulary <http://a#> as a {\n    concept A\n}\n"
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return OMLValidator(result_cache=False)
+
+
+def test_statement_starts():
+    code = "vocabulary <http://a#> as a {\n    concept A [\n        key x\n    ]\n    @a:b\n}\n"
+
+    assert [code[start:start + 3] for start in statement_starts(code)] == ["con", "@a:", "}\n"]
+    assert [code[start] for start in statement_starts(code.replace("    ]\n", "    }\n"))] == ["c", "@", "}"]
+
+
+def test_every_error_is_reported_once_with_its_statement(validator):
+    errors = validator.check(THREE_ERRORS, recover=True)["errors"]
+
+    assert [(error["line"], error["column"], error["token"]) for error in errors] == [
+        (5, 5, "concept"), (6, 5, "concpt"), (11, 9, "functonal")]
+    assert [error["statement"].split("\n")[0] for error in errors] == [
+        "concept A [", "concpt C", "scalar property p ["]
+    assert "RSQB" in errors[0]["expected"]
+
+
+def test_valid_code_has_no_errors(validator):
+    assert validator.check(VALID, recover=True) == {"valid": True, "error": None, "errors": []}
+
+
+def test_missing_closing_brace_is_reported_at_the_end(validator):
+    errors = validator.check(VALID[:-2] + "\n", recover=True)["errors"]
+
+    assert len(errors) == 1
+    assert errors[0]["token"] == ""
+    assert errors[0]["statement"] == "concept A"
+
+
+def test_first_recovered_error_matches_the_parse_error_on_the_corpus():
+    validator = OMLValidator(parser="lalr", result_cache=False)
+    with open(EXAMPLES_PATH) as file:
+        outputs = [json.loads(line)["output"] for line in file if line.strip()]
+
+    for code in outputs:
+        result = validator.check(code, recover=True)
+        if result["valid"]:
+            assert result["errors"] == []
+        else:
+            first = result["errors"][0]
+            assert (first["line"], first["column"]) == (result["error"]["line"], result["error"]["column"])
+
+
+def test_stray_closing_brace_is_not_a_resume_point(validator):
+    code = ("vocabulary <http://a#> as a {\n    concept Pizza {\n    }\n    concept Topping\n"
+            "    aspect Food\n}\n")
+
+    errors = validator.check(code, recover=True)["errors"]
+
+    assert [(error["line"], error["token"]) for error in errors] == [(2, "{")]
+    assert errors[0]["statement"] == "concept Pizza {\n    }"
+
+
+def test_error_limit(validator):
+    code = "vocabulary <http://a#> as a {\n" + "    concept A B\n" * 5 + "}\n"
+
+    assert len(recover_errors(validator.lalr_parser, code, max_errors=3)) == 3
+    assert len(validator.check(code, recover=True)["errors"]) == 5
+
+
+def test_recovered_errors_are_cached():
+    cache = ValidationCache()
+    validator = OMLValidator(result_cache=cache)
+
+    first = validator.check(THREE_ERRORS, recover=True)
+    second = validator.check(THREE_ERRORS, recover=True)
+
+    assert first == second
+    assert validator.check(THREE_ERRORS) == {"valid": False, "error": first["error"]}
+
+
+def test_error_handler_asks_for_every_fix_at_once(validator):
+    handler = ErrorHandler()
+    error_infos = handler.process_errors(THREE_ERRORS, validator.check(THREE_ERRORS, recover=True)["errors"])
+
+    prompt = handler.format_errors_prompt(error_infos)
+
+    assert "3 syntax errors" in prompt
+    assert "### Error 2: line 6, column 5" in prompt
+    assert "Unexpected **functonal**" in prompt
+    assert "concept A [\n        key x" in prompt
+    assert error_infos[1]["keyword"] == "concpt"
+
+
+class ReplayLLM:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.messages = []
+
+    def chat(self, model, messages, stream=False, options=None):
+        self.messages.append(messages)
+        return iter([{"message": {"content": self.responses.pop(0)}}])
+
+
+def test_feedback_loop_sends_all_errors_in_one_iteration(validator):
+    llm = ReplayLLM(["```oml\n" + THREE_ERRORS + "```", "```oml\n" + VALID + "```"])
+    loop = FeedbackLoop(llm, validator, ErrorHandler(), on_chunk=None)
+
+    code, iterations, success = loop.generate_and_refine("make a vocabulary")
+
+    assert success and iterations == 2
+    debugging_prompt = llm.messages[1][-1]["content"]
+    assert "3 syntax errors" in debugging_prompt
+    assert "concpt C" in debugging_prompt and "functonal" in debugging_prompt
+
+
+def test_feedback_loop_can_report_only_the_first_error(validator):
+    llm = ReplayLLM(["```oml\n" + THREE_ERRORS + "```", "```oml\n" + VALID + "```"])
+    loop = FeedbackLoop(llm, validator, ErrorHandler(), on_chunk=None, collect_all_errors=False)
+
+    loop.generate_and_refine("make a vocabulary")
+
+    assert llm.messages[1][-1]["content"].strip().startswith("Error at line 5, column 5")
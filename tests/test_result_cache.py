@@ -0,0 +1,129 @@
+import pytest
+
+from src.instrumentation import Instrumentation, set_instrumentation
+from src.validation.result_cache import ValidationCache
+from src.validation.validator import OMLValidator
+
+VALID = "vocabulary <http://a#> as a {\n    concept A\n}\n"
+INVALID = "vocabulary <http://a#> as a {\n    concept A [\n}\n"
+
+
+@pytest.fixture
+def instrumentation():
+    instrumentation = Instrumentation()
+    previous = set_instrumentation(instrumentation)
+    yield instrumentation
+    set_instrumentation(previous)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ValidationCache(capacity=2)
+    cache.put("a", {"valid": True, "error": None})
+    cache.put("b", {"valid": True, "error": None})
+    cache.get("a")
+    cache.put("c", {"valid": True, "error": None})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert len(cache) == 2
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_outlives_the_process_cache_without_trees(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    first = ValidationCache(cache_path=path, keep_trees=True)
+    first.put("a", {"valid": True, "error": None}, tree=object())
+    assert "tree" in first.get("a")
+    first.close()
+
+    second = ValidationCache(cache_path=path)
+
+    assert second.get("a") == {"valid": True, "error": None}
+    assert second.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = ValidationCache(capacity=1, cache_path=str(tmp_path / "results.sqlite"), max_disk_entries=2)
+    for key in "abc":
+        cache.put(key, {"valid": True, "error": None})
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+
+def test_repeated_validation_is_a_lookup(instrumentation):
+    validator = OMLValidator(result_cache=ValidationCache())
+
+    first = validator.validate(INVALID)
+    second = validator.validate(INVALID)
+
+    assert first == second
+    assert not first[0]
+    assert validator.result_cache.stats()["hits"] == 1
+    assert instrumentation.registry.counter("oml_validation_cache_hits_total") == 1
+
+
+def test_trees_are_only_cached_when_asked(instrumentation):
+    validator = OMLValidator(result_cache=ValidationCache())
+
+    assert validator.validate(VALID, return_tree=False) == (True, None)
+    assert validator.validate(VALID, return_tree=False) == (True, None)
+    is_valid, tree = validator.validate(VALID)
+
+    assert is_valid and tree.data == "ontology"
+    assert instrumentation.registry.counter("oml_validation_cache_hits_total") == 1
+
+    keeping = OMLValidator(result_cache=ValidationCache(keep_trees=True))
+    first, second = keeping.validate(VALID)[1], keeping.validate(VALID)[1]
+    assert first == second and first is not second
+    assert keeping.result_cache.stats()["hits"] == 1
+
+
+def test_check_returns_structured_errors():
+    validator = OMLValidator(result_cache=ValidationCache())
+
+    result = validator.check(INVALID)
+
+    assert not result["valid"]
+    error = result["error"]
+    assert (error["line"], error["column"], error["token"]) == (3, 1, "}")
+    assert "RSQB" in error["expected"]
+    assert error["message"] == validator.validate(INVALID)[1]
+    assert validator.check(VALID) == {"valid": True, "error": None}
+    assert validator.check(INVALID) == OMLValidator(result_cache=False).check(INVALID)
+
+
+def test_callers_cannot_modify_cached_results():
+    validator = OMLValidator(result_cache=ValidationCache())
+
+    validator.check(INVALID, recover=True)["error"]["expected"].clear()
+    validator.check(INVALID, recover=True)["errors"].clear()
+    result = validator.check(INVALID, recover=True)
+
+    assert "RSQB" in result["error"]["expected"]
+    assert result["errors"]
+    assert result == OMLValidator(result_cache=False).check(INVALID, recover=True)
+
+
+def test_recovered_errors_are_added_to_a_disk_cache_with_trees(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    validator = OMLValidator(result_cache=ValidationCache(cache_path=path, keep_trees=True))
+    tree = validator.validate(VALID)[1]
+
+    assert validator.check(VALID, recover=True) == {"valid": True, "error": None, "errors": []}
+    assert validator.validate(VALID)[1] == tree
+    assert ValidationCache(cache_path=path).get(ValidationCache.make_key(validator.cache_namespace, VALID)) == {
+        "valid": True, "error": None, "errors": []}
+
+
+def test_results_are_keyed_by_grammar_and_parser_mode(tmp_path):
+    grammar_file = tmp_path / "grammar.txt"
+    grammar_file.write_text('ontology: NAME\nNAME: /[a-z]+/\n')
+    cache = ValidationCache()
+
+    assert OMLValidator(result_cache=cache).validate("pizza", return_tree=False)[0] is False
+    assert OMLValidator(str(grammar_file), result_cache=cache).validate("pizza", return_tree=False)[0]
+    assert OMLValidator(parser="lalr", result_cache=cache).cache_namespace != OMLValidator(
+        result_cache=cache).cache_namespace
+    assert cache.stats()["hits"] == 0
@@ -0,0 +1,296 @@
+import numpy as np
+import pytest
+
+from src.embedding_index import EmbeddingIndex
+from src.retriever import OMLRetriever
+from src.tokenizer_utils import get_token_cache
+
+
+class WhitespaceTokenizer:
+    def __init__(self):
+        self.vocabulary = {}
+        self.words = []
+
+    def encode(self, text):
+        for word in text.split():
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+        return [self.vocabulary[word] for word in text.split()]
+
+    def decode(self, tokens):
+        return " ".join(self.words[token] for token in tokens)
+
+
+class FakeEmbeddingModel:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get_query_embedding(self, text):
+        return np.asarray(self.vectors[text], dtype=np.float32)
+
+
+def build_vector_db():
+    return [
+        ("concept input", "concept Pizza", np.array([1.0, 0.0, 0.0]), np.array([1.0, 0.0, 0.0])),
+        ("relation input", "relation entity HasBase", np.array([0.0, 2.0, 0.0]), np.array([0.0, 1.0, 0.0])),
+        ("scalar input", "scalar property hasId", np.array([0.0, 0.0, 3.0]), np.array([0.0, 0.0, 1.0])),
+        ("mixed input", "concept Food < Thing", np.array([1.0, 1.0, 0.0]), np.array([1.0, 1.0, 0.0])),
+    ]
+
+
+def test_embedding_matrix_is_normalized_float32():
+    retriever = OMLRetriever(build_vector_db(), FakeEmbeddingModel({}), tokenizer=WhitespaceTokenizer())
+
+    assert retriever.embedding_matrix.dtype == np.float32
+    assert retriever.embedding_matrix.flags["C_CONTIGUOUS"]
+    assert np.allclose(np.linalg.norm(retriever.embedding_matrix, axis=1), 1.0)
+
+
+def test_retrieve_ranks_by_cosine_similarity():
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer())
+
+    results = retriever.retrieve("pizza", top_n=2)
+
+    assert [text for text, _ in results] == ["concept Pizza", "concept Food < Thing"]
+    expected = 2.0 / np.linalg.norm([2.0, 0.5, 0.0])
+    assert abs(results[0][1] - expected) < 1e-6
+
+
+def test_retrieve_handles_top_n_larger_than_database():
+    model = FakeEmbeddingModel({"anything": [0.0, 0.0, 1.0]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer())
+
+    results = retriever.retrieve("anything", top_n=10)
+
+    assert len(results) == 4
+    assert results[0][0] == "scalar property hasId"
+
+
+def test_retrieve_on_empty_database():
+    model = FakeEmbeddingModel({"anything": [0.0, 0.0, 1.0]})
+    retriever = OMLRetriever([], model, tokenizer=WhitespaceTokenizer())
+
+    assert retriever.retrieve("anything") == []
+
+
+def test_from_index_uses_mapped_matrix(tmp_path):
+    EmbeddingIndex.from_vector_db(build_vector_db(), model_name="test-model").save(str(tmp_path))
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    model.model_name = "test-model"
+
+    retriever = OMLRetriever.from_index(str(tmp_path), model, tokenizer=WhitespaceTokenizer())
+
+    assert isinstance(retriever.embedding_matrix, np.memmap)
+    assert [text for text, _ in retriever.retrieve("pizza", top_n=2)] == ["concept Pizza", "concept Food < Thing"]
+
+
+def test_from_index_rejects_other_model(tmp_path):
+    EmbeddingIndex.from_vector_db(build_vector_db(), model_name="test-model").save(str(tmp_path))
+    model = FakeEmbeddingModel({})
+    model.model_name = "other-model"
+
+    with pytest.raises(ValueError):
+        OMLRetriever.from_index(str(tmp_path), model, tokenizer=WhitespaceTokenizer())
+
+
+def test_retrieve_by_keyword_returns_shortest_match():
+    retriever = OMLRetriever(build_vector_db(), FakeEmbeddingModel({}), tokenizer=WhitespaceTokenizer())
+
+    assert retriever.retrieve_by_keyword("concept") == "concept Pizza"
+    assert retriever.retrieve_by_keyword("relation entity") == "relation entity HasBase"
+    assert retriever.retrieve_by_keyword("<") == "concept Food < Thing"
+    assert retriever.retrieve_by_keyword("aspect") == "No relevant example found in the database."
+
+
+def test_hybrid_retrieval_promotes_lexical_matches():
+    # The dense model alone ranks the scalar property example first
+    model = FakeEmbeddingModel({"relation entity HasBase": [0.1, 0.0, 1.0]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer(), dense_weight=0.3)
+
+    dense = retriever.retrieve("relation entity HasBase", top_n=1)
+    weighted = retriever.retrieve("relation entity HasBase", top_n=1, fusion="weighted")
+    rrf = retriever.retrieve("relation entity HasBase", top_n=4, fusion="rrf")
+
+    assert dense[0][0] == "scalar property hasId"
+    assert weighted[0][0] == "relation entity HasBase"
+    assert {text for text, _ in rrf[:2]} == {"scalar property hasId", "relation entity HasBase"}
+
+
+def test_unknown_fusion_mode_is_rejected():
+    with pytest.raises(ValueError):
+        OMLRetriever(build_vector_db(), FakeEmbeddingModel({}), tokenizer=WhitespaceTokenizer(), fusion="max")
+
+
+def test_retrieve_many_matches_retrieve(capsys):
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0], "scalar": [0.0, 0.1, 1.0], "relation": [0.0, 1.0, 0.2]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer())
+
+    batched = retriever.retrieve_many(["pizza", "scalar", "relation"], top_n=2, chunk_size=2)
+
+    assert capsys.readouterr().out == ""
+    for query, results in zip(["pizza", "scalar", "relation"], batched):
+        single = retriever.retrieve(query, top_n=2)
+        assert [text for text, _ in results] == [text for text, _ in single]
+        assert np.allclose([score for _, score in results], [score for _, score in single])
+
+
+def test_retrieve_many_on_empty_database():
+    model = FakeEmbeddingModel({"pizza": [1.0, 0.0, 0.0]})
+    retriever = OMLRetriever([], model, tokenizer=WhitespaceTokenizer())
+
+    assert retriever.retrieve_many(["pizza"]) == [[]]
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_quantized_retrieval_rescores_exactly(mode):
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    exact = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer())
+    quantized = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer(), quantization=mode)
+
+    assert quantized.quantized_matrix.mode == mode
+    # Rescoring reads the stored vectors instead of a second float32 matrix
+    assert quantized.embedding_matrix is None
+    assert quantized.retrieve("pizza", top_n=2) == exact.retrieve("pizza", top_n=2)
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_quantized_retrieval_from_an_empty_database(mode):
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    retriever = OMLRetriever([], model, tokenizer=WhitespaceTokenizer(), quantization=mode)
+
+    assert retriever.retrieve("pizza") == []
+    assert retriever.retrieve_many(["pizza"]) == [[]]
+
+    retriever.upsert("0", "concept input", "concept Pizza", [1.0, 0.0, 0.0], [1.0, 0.0, 0.0])
+    assert [text for text, _ in retriever.retrieve("pizza")] == ["concept Pizza"]
+
+
+def test_quantized_retriever_rescores_from_the_mapped_index(tmp_path):
+    EmbeddingIndex.from_vector_db(build_vector_db()).save(str(tmp_path))
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+
+    retriever = OMLRetriever.from_index(str(tmp_path), model, tokenizer=WhitespaceTokenizer(), quantization="int8")
+    retriever.upsert("4", "aspect input", "aspect Named", [2.0, 0.4, 0.0], [1.0, 0.0, 0.0])
+    retriever.delete("0")
+    retriever.compact()
+
+    assert isinstance(retriever.embedding_matrix, np.memmap)
+    assert [text for text, _ in retriever.retrieve("pizza", top_n=2)] == ["aspect Named", "concept Food < Thing"]
+
+
+def test_upsert_and_delete_by_id():
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer(),
+                             ids=["pizza", "base", "id", "food"])
+
+    retriever.upsert("aspect", "aspect input", "aspect Named", [2.0, 0.4, 0.0], [1.0, 0.0, 0.0])
+    retriever.upsert("pizza", "concept input", "concept Pizza2", [0.0, 1.0, 1.0], [1.0, 0.0, 0.0])
+    assert retriever.delete("food")
+    assert not retriever.delete("missing")
+
+    assert len(retriever) == 4
+    assert "food" not in retriever
+    assert [text for text, _ in retriever.retrieve("pizza", top_n=2)] == ["aspect Named", "relation entity HasBase"]
+    assert len(retriever.retrieve("pizza", top_n=10)) == 4
+    assert retriever.retrieve_by_keyword("concept") == "concept Pizza2"
+    assert retriever.retrieve_by_keyword("aspect") == "aspect Named"
+    assert retriever.retrieve_by_keyword("<") == "No relevant example found in the database."
+
+    hybrid = retriever.retrieve("pizza", top_n=10, fusion="rrf")
+    assert "concept Pizza" not in [text for text, _ in hybrid]
+
+    batched = retriever.retrieve_many(["pizza"], top_n=10)[0]
+    assert [text for text, _ in batched] == [text for text, _ in retriever.retrieve("pizza", top_n=10)]
+
+
+def assert_same_results(found, expected):
+    assert [text for text, _ in found] == [text for text, _ in expected]
+    assert np.allclose([score for _, score in found], [score for _, score in expected])
+
+
+def test_compact_drops_tombstones():
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    retriever = OMLRetriever(build_vector_db(), model, tokenizer=WhitespaceTokenizer())
+    retriever.upsert("4", "aspect input", "aspect Named", [2.0, 0.4, 0.0], [1.0, 0.0, 0.0])
+    retriever.delete("0")
+    before = retriever.retrieve("pizza", top_n=3)
+
+    retriever.compact()
+
+    assert retriever.ids == ["1", "2", "3", "4"]
+    assert retriever.embedding_matrix.shape == (4, 3)
+    assert_same_results(retriever.retrieve("pizza", top_n=3), before)
+
+
+def test_changes_persist_to_index(tmp_path):
+    index_path = str(tmp_path)
+    EmbeddingIndex.from_vector_db(build_vector_db(), model_name="test-model").save(index_path)
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+    model.model_name = "test-model"
+
+    retriever = OMLRetriever.from_index(index_path, model, tokenizer=WhitespaceTokenizer())
+    retriever.upsert("4", "aspect input", "aspect Named", [2.0, 0.4, 0.0], [1.0, 0.0, 0.0])
+    retriever.delete("0")
+    expected = retriever.retrieve("pizza", top_n=4)
+
+    reopened = OMLRetriever.from_index(index_path, model, tokenizer=WhitespaceTokenizer())
+    assert_same_results(reopened.retrieve("pizza", top_n=4), expected)
+
+    reopened.compact()
+    assert EmbeddingIndex.load_changes(index_path) == []
+    assert isinstance(reopened.embedding_matrix, np.memmap)
+    assert EmbeddingIndex.load(index_path).ids == ["1", "2", "3", "4"]
+    reloaded = OMLRetriever.from_index(index_path, model, tokenizer=WhitespaceTokenizer())
+    assert_same_results(reloaded.retrieve("pizza", top_n=4), expected)
+
+
+@pytest.mark.parametrize("options", [{"ann_threshold": 50}, {"quantization": "int8"}, {}])
+def test_incremental_updates_match_rebuild(options):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    queries = rng.normal(size=(5, 8)).astype(np.float32)
+    model = FakeEmbeddingModel({f"q{i}": query for i, query in enumerate(queries)})
+    vector_db = [(f"in {i}", f"out {i}", vector, vector) for i, vector in enumerate(vectors[:200])]
+
+    retriever = OMLRetriever(vector_db, model, tokenizer=WhitespaceTokenizer(), **options)
+    for i in range(200, 300):
+        retriever.upsert(str(i), f"in {i}", f"out {i}", vectors[i], vectors[i])
+    for i in range(0, 300, 3):
+        retriever.delete(str(i))
+
+    # 200 pending rows against a base of 200 triggered at least one compaction
+    assert retriever._delta_count + retriever._deleted_count < 100
+
+    live = [i for i in range(300) if i % 3]
+    rebuilt = OMLRetriever([(f"in {i}", f"out {i}", vectors[i], vectors[i]) for i in live], model,
+                           tokenizer=WhitespaceTokenizer(), ann_threshold=None)
+    for i in range(len(queries)):
+        expected = [text for text, _ in rebuilt.retrieve(f"q{i}", top_n=5)]
+        found = [text for text, _ in retriever.retrieve(f"q{i}", top_n=5)]
+        if options:
+            assert len(set(found) & set(expected)) >= 4
+        else:
+            assert found == expected
+
+
+def test_from_index_reuses_stored_token_ids(tmp_path):
+    tokenizer = WhitespaceTokenizer()
+    tokenizer.name = "whitespace"
+    EmbeddingIndex.from_vector_db(build_vector_db(), tokenizer=tokenizer).save(str(tmp_path))
+    model = FakeEmbeddingModel({"pizza": [2.0, 0.5, 0.0]})
+
+    class RefusingTokenizer(WhitespaceTokenizer):
+        name = "whitespace"
+
+        def encode(self, text):
+            if text != "pizza":
+                raise AssertionError(f"re-encoded {text!r}")
+            return super().encode(text)
+
+    retriever = OMLRetriever.from_index(str(tmp_path), model, tokenizer=RefusingTokenizer())
+
+    assert retriever.output_token_counts == [2, 3, 3, 4]
+    assert [text for text, _ in retriever.retrieve("pizza", top_n=2)] == ["concept Pizza", "concept Food < Thing"]
+    assert get_token_cache().get(retriever.tokenizer, "concept Pizza") is not None
@@ -0,0 +1,159 @@
+import json
+import os
+
+import pytest
+from lark import UnexpectedInput
+
+from src.instrumentation import Instrumentation, set_instrumentation
+from src.validation.result_cache import ValidationCache
+from src.validation.statements import split_statements
+from src.validation.validator import OMLValidator
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "src", "oml_examples.jsonl")
+
+VOCABULARY = '''@dc:description "Pizzas"
+vocabulary <http://example.com/pizza#> as pizza {
+    extends <http://www.w3.org/2001/XMLSchema#> as xsd
+    extends <http://purl.org/dc/elements/1.1/> as dc
+
+    @rdfs:comment """A pizza
+concept that is not a statement"""
+    @dc:creator "me"
+    concept Pizza [
+        key hasName
+    ]
+    // concept Commented
+    relation entity HasTopping [
+        from Pizza
+        to Topping
+        @rdfs:label "has topping"
+        forward hasTopping
+    ]
+    concept Topping
+    scalar property hasName [
+        domain Pizza
+        range xsd:string
+        functional
+    ]
+}
+'''
+
+
+@pytest.fixture
+def instrumentation():
+    instrumentation = Instrumentation()
+    previous = set_instrumentation(instrumentation)
+    yield instrumentation
+    set_instrumentation(previous)
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return OMLValidator(parser="lalr", result_cache=False)
+
+
+def first_lines(code, starts, footer):
+    bounds = zip(starts, starts[1:] + [footer])
+    return [code[start:end].strip().split("\n")[0] for start, end in bounds]
+
+
+def full_parse_error(validator, code):
+    try:
+        validator.lalr_parser.parse(code)
+    except UnexpectedInput as e:
+        return e
+    return None
+
+
+def test_split_statements():
+    starts, footer = split_statements(VOCABULARY)
+
+    assert first_lines(VOCABULARY, starts, footer) == [
+        '@rdfs:comment """A pizza', "relation entity HasTopping [", "concept Topping", "scalar property hasName ["]
+    assert VOCABULARY[footer:] == "}\n"
+    assert VOCABULARY[:starts[0]].rstrip().endswith("as dc")
+
+
+def test_tree_matches_the_full_parse(validator):
+    is_valid, tree = validator.statement_validator().validate(VOCABULARY)
+
+    assert is_valid
+    assert tree == validator.validate(VOCABULARY)[1]
+
+
+def test_only_changed_statements_are_parsed_again(validator, instrumentation):
+    statements = validator.statement_validator()
+    statements.validate(VOCABULARY)
+    assert statements.stats()["misses"] == 4
+
+    edited = VOCABULARY.replace("concept Topping", "concept Toppings")
+    is_valid, tree = statements.validate(edited)
+
+    assert is_valid and tree == validator.validate(edited)[1]
+    assert statements.stats()["misses"] == 5
+    assert statements.stats()["hits"] == 3
+    assert instrumentation.registry.counter("oml_statements_reparsed_total") == 5
+
+
+def test_result_cache_is_consulted_first(instrumentation):
+    validator = OMLValidator(parser="lalr", result_cache=ValidationCache(keep_trees=True))
+    statements = validator.statement_validator()
+    is_valid, tree = statements.validate(VOCABULARY)
+    broken = VOCABULARY.replace("key hasName", "key")
+    message = statements.validate(broken)[1]
+
+    assert statements.validate(VOCABULARY) == (is_valid, tree)
+    assert statements.validate(broken) == (False, message)
+    assert validator.validate(VOCABULARY) == (True, tree)
+    assert statements.stats()["misses"] == 5
+    assert instrumentation.registry.counter("oml_validation_cache_hits_total") == 3
+
+
+def test_every_broken_statement_is_reported(validator):
+    code = VOCABULARY.replace("key hasName", "key").replace("concept Topping", "concept Topping Topping")
+
+    tree, errors = validator.statement_validator().parse(code)
+
+    assert tree is None
+    assert [(error.line, error.column) for error, _ in errors] == [(11, 5), (19, 21)]
+    assert errors[1][1] == "concept Topping Topping"
+    first = full_parse_error(validator, code)
+    assert str(errors[0][0]) == str(first)
+
+
+def test_missing_closing_brace(validator):
+    code = VOCABULARY[:-2]
+
+    is_valid, message = validator.statement_validator().validate(code)
+
+    assert not is_valid
+    assert message == str(full_parse_error(validator, code))
+
+
+def test_statement_continued_on_a_statement_line(validator):
+    code = "vocabulary <http://a#> as a {\n    scalar S <\n    scalar T\n}\n"
+
+    is_valid, tree = validator.statement_validator().validate(code)
+
+    assert is_valid
+    assert tree == validator.validate(code)[1]
+
+
+def test_verdicts_and_first_errors_match_the_full_parse_on_the_corpus(validator):
+    with open(EXAMPLES_PATH) as file:
+        outputs = [json.loads(line)["output"] for line in file if line.strip()]
+    statements = validator.statement_validator()
+
+    # Every valid example also checked with one bracket removed
+    edited = [code.replace("]", "", 1) for code in outputs if validator.validate(code, return_tree=False)[0]]
+    for code in outputs + edited:
+        tree, errors = statements.parse(code)
+        error = full_parse_error(validator, code)
+        if error is None:
+            assert tree == validator.validate(code)[1]
+        else:
+            assert str(errors[0][0]) == str(error)
+
+
+def test_statement_validator_needs_an_lalr_parser():
+    assert OMLValidator(parser="earley", result_cache=False).statement_validator() is None
@@ -0,0 +1,103 @@
+import pytest
+
+from src.instrumentation import Instrumentation, SpanRecorder, set_instrumentation
+from src.validation.feedback_loop import FeedbackLoop
+from src.validation.streaming import CODE_BLOCK_PATTERN, CodeFenceDetector
+
+RESPONSE = "Here is the vocabulary:\n```oml\nvocabulary <http://a#> as a {\n    concept A\n}\n```\nThis defines a concept A."
+
+
+def extract(response):
+    match = CODE_BLOCK_PATTERN.search(response)
+    return match.group(1) if match else None
+
+
+def feed_all(detector, chunks):
+    for index, chunk in enumerate(chunks):
+        if detector.feed(chunk) is not None:
+            return index
+    return None
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 100])
+def test_detector_closes_at_the_fence_for_any_chunking(size):
+    chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    detector = CodeFenceDetector()
+
+    index = feed_all(detector, chunks)
+
+    assert detector.code == extract(RESPONSE)
+    assert detector.response() == RESPONSE[:RESPONSE.index("```\nThis") + 3]
+    assert index == (len(RESPONSE) - len("\nThis defines a concept A.") - 1) // size
+
+
+def test_detector_skips_inline_fences():
+    response = "Use ```x``` inline.\n```oml\nconcept B\n``` done"
+    detector = CodeFenceDetector()
+
+    feed_all(detector, list(response))
+
+    assert detector.code == extract(response) == "concept B\n"
+
+
+def test_detector_waits_without_a_closed_block():
+    detector = CodeFenceDetector()
+
+    assert feed_all(detector, ["```oml\n", "concept A\n"]) is None
+    assert not detector.closed
+    assert detector.response() == "```oml\nconcept A\n"
+
+
+class StreamingLLM:
+    def __init__(self, response, size=4):
+        self.response = response
+        self.size = size
+        self.sent = 0
+        self.closed = False
+        self.options = None
+
+    def chat(self, model, messages, stream=False, options=None):
+        self.options = options
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for start in range(0, len(self.response), self.size):
+                self.sent += 1
+                yield {"message": {"content": self.response[start:start + self.size]}}
+        finally:
+            self.closed = True
+
+
+def test_generate_response_stops_after_the_code_block():
+    recorder = SpanRecorder()
+    instrumentation = Instrumentation(sinks=[recorder])
+    previous = set_instrumentation(instrumentation)
+    try:
+        llm = StreamingLLM(RESPONSE)
+        chunks = []
+        loop = FeedbackLoop(llm, None, None, on_chunk=chunks.append, max_response_tokens=100)
+
+        response = loop.generate_response([])
+    finally:
+        set_instrumentation(previous)
+
+    assert response == "".join(chunks) == RESPONSE[:RESPONSE.index("```\nThis") + 3]
+    assert llm.closed
+    assert llm.sent < -(-len(RESPONSE) // llm.size)
+    assert llm.options == {"num_predict": 100}
+
+    record = [record for record in recorder.records if record["name"] == "llm_total"][0]
+    assert record["attributes"]["stopped_early"]
+    assert record["attributes"]["tokens"] == llm.sent
+    assert record["attributes"]["tokens_saved"] == 100 - llm.sent
+    assert instrumentation.registry.counter("oml_llm_tokens_saved_total") == 100 - llm.sent
+    assert instrumentation.registry.counter("oml_llm_early_stops_total") == 1
+
+
+def test_generate_response_streams_everything_without_early_stop():
+    llm = StreamingLLM(RESPONSE)
+    loop = FeedbackLoop(llm, None, None, on_chunk=None, early_stop=False)
+
+    assert loop.generate_response([]) == RESPONSE
+    assert llm.options is None
@@ -0,0 +1,66 @@
+import gc
+
+import numpy as np
+
+from src.tokenizer_utils import TokenCache, count_tokens, encode, get_token_cache, tokenizer_name, truncate_text
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return [len(word) for word in text.split()]
+
+    def decode(self, tokens):
+        return " ".join("x" * token for token in tokens)
+
+
+def test_encode_is_cached_per_tokenizer():
+    tokenizer = CountingTokenizer()
+    other = CountingTokenizer()
+
+    first = encode("aa bbb c", tokenizer)
+    assert count_tokens("aa bbb c", tokenizer) == 3
+    assert truncate_text("aa bbb c", 2, tokenizer) == "xx xxx"
+    encode("aa bbb c", other)
+
+    assert tokenizer.calls == 1
+    assert other.calls == 1
+    assert first.dtype == np.int32
+    assert not first.flags.writeable
+
+
+def test_token_cache_evicts_least_recently_used():
+    tokenizer = CountingTokenizer()
+    cache = TokenCache(capacity=2)
+    cache.put(tokenizer, "a", [1])
+    cache.put(tokenizer, "b", [2])
+    cache.get(tokenizer, "a")
+    cache.put(tokenizer, "c", [3])
+
+    assert cache.get(tokenizer, "b") is None
+    assert cache.get(tokenizer, "a").tolist() == [1]
+    assert len(cache) == 2
+    assert cache.stats()["hits"] == 2
+
+
+def test_seeded_token_ids_skip_encoding():
+    tokenizer = CountingTokenizer()
+    get_token_cache().put(tokenizer, "seeded text", [7, 8])
+
+    assert count_tokens("seeded text", tokenizer) == 2
+    assert tokenizer.calls == 0
+
+
+def test_collected_tokenizers_do_not_share_entries_with_new_ones():
+    cache = TokenCache()
+    tokenizer = CountingTokenizer()
+    cache.put(tokenizer, "text", [1])
+    del tokenizer
+    gc.collect()
+
+    # New tokenizers often reuse the address of the collected one
+    assert all(cache.get(CountingTokenizer(), "text") is None for _ in range(100))
+    assert tokenizer_name(CountingTokenizer()) is None
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+from pathlib import Path
+
+import pytest
+from lark import Lark
+from lark.exceptions import GrammarError
+
+from src.instrumentation import Instrumentation, SpanRecorder, set_instrumentation
+from src.validation.validator import OMLValidator
+
+EXAMPLES_PATH = Path(__file__).resolve().parents[1] / "src" / "oml_examples.jsonl"
+ORIGINAL_GRAMMAR_PATH = Path(__file__).resolve().parents[1] / "grammar" / "oml3_lark.txt"
+
+GRAMMAR_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"i?|/(?:\\.|[^/\\])+/[imslux]*|\w+|\S')
+
+# Earley needs about a second per kilobyte of valid OML; set OML_CORPUS_MAX_CHARS=0
+# to compare the parsers on the whole corpus
+CORPUS_MAX_CHARS = int(os.environ.get("OML_CORPUS_MAX_CHARS", "800"))
+
+VALID_OML = """@dc:description "A vocabulary about pizzas"
+vocabulary <http://example.com/pizza#> as pizza {
+    extends <http://www.w3.org/2000/01/rdf-schema#> as rdfs
+
+    concept Food
+    concept Pizza < Food [
+        restricts some hasBase to Base
+    ]
+    relation entity HasBase [
+        from Pizza
+        to Base
+        forward hasBase
+        functional
+        asymmetric
+        irreflexive
+    ]
+    scalar property hasName [
+        domain Food
+        range xsd:string
+    ]
+}
+"""
+
+
+def load_corpus():
+    with open(EXAMPLES_PATH) as file:
+        examples = [json.loads(line) for line in file if line.strip()]
+    return [example for example in examples
+            if not CORPUS_MAX_CHARS or len(example["output"]) <= CORPUS_MAX_CHARS]
+
+
+def lift_optional_items(tokens, rules):
+    """Move every item?/item* of a rule body into a rule of its own, returning the new body."""
+    body = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "(":
+            depth, end = 1, i + 1
+            while depth:
+                depth += {"(": 1, ")": -1}.get(tokens[end], 0)
+                end += 1
+            item = ["("] + lift_optional_items(tokens[i + 1:end - 1], rules) + [")"]
+            i = end
+        else:
+            item = [tokens[i]]
+            i += 1
+        if i < len(tokens) and tokens[i] in ("?", "*"):
+            name = f"_optional_{len(rules)}"
+            rules.append(f"{name}: {' '.join(item)}{tokens[i]}")
+            body.append(name)
+            i += 1
+        else:
+            body.extend(item)
+    return body
+
+
+def original_grammar():
+    # Lark expands each optional item of a rule into alternatives with and without it, which turns
+    # the original grammar into ~186k rules; the same items in rules of their own derive the same language
+    text = re.sub(r"\n\s*\|", " |", ORIGINAL_GRAMMAR_PATH.read_text())
+    lines, rules = [], []
+    for line in text.split("\n"):
+        match = re.match(r"([a-z_]\w*)\s*:(.*)", line)
+        if match:
+            body = lift_optional_items(GRAMMAR_TOKEN.findall(match.group(2)), rules)
+            line = f"{match.group(1)}: {' '.join(body)}"
+        lines.append(line)
+    return "\n".join(lines + rules)
+
+
+@pytest.fixture(scope="module")
+def validator():
+    # Parse every time, so the tests see which parser ran
+    return OMLValidator(result_cache=False)
+
+
+@pytest.fixture(scope="module")
+def original_parser():
+    return Lark(original_grammar(), start="ontology")
+
+
+def accepts(parser, code):
+    try:
+        parser.parse(code)
+    except Exception:
+        return False
+    return True
+
+
+@pytest.mark.parametrize("example", load_corpus(), ids=lambda example: example["id"])
+def test_lalr_and_earley_accept_the_same_corpus_inputs(validator, original_parser, example):
+    code = example["output"]
+
+    verdict = accepts(validator.lalr_parser, code)
+    assert verdict == accepts(validator.earley_parser, code)
+    assert verdict == accepts(original_parser, code)
+
+
+def test_lalr_and_the_original_grammar_accept_as_many_corpus_inputs(validator, original_parser):
+    with open(EXAMPLES_PATH) as file:
+        outputs = [json.loads(line)["output"] for line in file if line.strip()]
+
+    accepted = sum(accepts(validator.lalr_parser, code) for code in outputs)
+
+    # Many corpus outputs use escaped newlines or constructs outside the grammar
+    assert 0 < accepted < len(outputs)
+    assert accepted == sum(accepts(original_parser, code) for code in outputs)
+
+
+def test_valid_code_is_accepted_by_lalr_alone(validator):
+    recorder = SpanRecorder()
+    previous = set_instrumentation(Instrumentation(sinks=[recorder]))
+    try:
+        is_valid, tree = validator.validate(VALID_OML)
+    finally:
+        set_instrumentation(previous)
+
+    assert is_valid
+    assert tree.data == "ontology"
+    assert recorder.records[-1]["attributes"]["parser"] == "lalr"
+
+
+def test_modifier_order_is_still_enforced(validator):
+    code = VALID_OML.replace("functional\n        asymmetric", "asymmetric\n        functional")
+
+    is_valid, error = validator.validate(code)
+
+    assert not is_valid
+    assert "functional" in error
+
+
+def test_rejected_code_is_not_parsed_again():
+    validator = OMLValidator(result_cache=False)
+    recorder = SpanRecorder()
+    previous = set_instrumentation(Instrumentation(sinks=[recorder]))
+    try:
+        is_valid, error = validator.validate("vocabulary <http://a#> as a {\n    concept\n}")
+    finally:
+        set_instrumentation(previous)
+
+    assert not is_valid
+    assert error
+    assert recorder.records[-1]["attributes"]["parser"] == "lalr"
+    assert validator._earley_parser is None
+
+
+def test_grammar_that_is_not_lalr_compatible(tmp_path):
+    grammar_file = tmp_path / "ambiguous.txt"
+    grammar_file.write_text('ontology: a | b\na: NAME\nb: NAME\nNAME: /[a-z]+/\n%ignore " "\n')
+
+    validator = OMLValidator(str(grammar_file))
+
+    assert validator.lalr_parser is None
+    assert validator.validate("pizza")[0]
+    with pytest.raises(GrammarError):
+        OMLValidator(str(grammar_file), parser="lalr")
+
+
+def test_unknown_parser_mode():
+    with pytest.raises(ValueError):
+        OMLValidator(parser="cyk")